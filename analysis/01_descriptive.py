@@ -7,6 +7,12 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 
+import sys
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+from panel_store import load_panel
+from panel_cube import PanelCube
+from derived import DerivedPanel, yoy
+
 # Config
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data.csv")
 FIGURES_DIR = os.path.join(PROJECT_ROOT, "paper", "figures")
@@ -29,18 +35,18 @@ def main():
         print(f"Data file not found: {DATA_PATH}")
         return
 
-    df = pd.read_csv(DATA_PATH)
-    df['date'] = pd.to_datetime(df['date'])
+    df = load_panel(DATA_PATH, columns=['HICP_Total', 'HICP_Core', 'HICP_Energy', 'IP_Total', 'f_OIL'])
     
     # Calculate YoY Growth for Indices (if needed)
     # Eurostat Indices are usually 2015=100. Growth = (t / t-12) - 1
     # We should ensure data is sorted
     df = df.sort_values(by=['geo', 'date'])
+    derived = DerivedPanel(PanelCube.from_panel(df))
     
     for col in ['HICP_Total', 'HICP_Core', 'HICP_Energy', 'IP_Total']:
         if col in df.columns:
-            # Calculate YoY
-            df[f'{col}_YoY'] = df.groupby('geo')[col].pct_change(12) * 100
+            # Calculate YoY (all geos at once)
+            df[f'{col}_YoY'] = derived.rows(yoy(col), df)
             
             # Plot Levels
             plot_time_series(df, col, f'{col} Level', f'{col}_level.png')
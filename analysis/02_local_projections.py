@@ -9,6 +9,10 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 
+import sys
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+from panel_store import load_panel
+
 # Config
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data.csv")
 FIGURES_DIR = os.path.join(PROJECT_ROOT, "paper", "figures")
@@ -91,8 +95,7 @@ def main():
         print("Data not found.")
         return
 
-    df = pd.read_csv(DATA_PATH)
-    df['date'] = pd.to_datetime(df['date'])
+    df = load_panel(DATA_PATH, columns=VARIABLES + [SHOCK_GLOBAL, SHOCK_FX] + CONTROLS)
     df = df.sort_values(by=['geo', 'date'])
     
     # Ensure EA_IP is available (merged into all rows? or just check)
@@ -17,6 +17,12 @@ from scipy import stats
 import warnings
 warnings.filterwarnings('ignore')
 
+import sys
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+from panel_store import load_panel
+from panel_cube import PanelCube
+from derived import DerivedPanel, log, dlog, lag, product
+
 # Config
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data.csv")
 FIGURES_DIR = os.path.join(PROJECT_ROOT, "paper", "figures")
@@ -47,25 +53,26 @@ COUNTRY_SPECS = {
 VARIABLES = ['HICP_Total', 'HICP_Core', 'IP_Total']
 HORIZONS = 12
 
-def run_enhanced_lp(df, country, dep_var, horizon, country_spec):
+def run_enhanced_lp(derived, country, dep_var, horizon, country_spec):
     """
     Run enhanced local projection for a specific country and horizon
-    Returns detailed results with standard errors and significance
+    Returns detailed results with standard errors and significance.
+    Logs, growth rates and lags come from the shared DerivedPanel, so they
+    are computed once for all horizons rather than once per horizon.
     """
-    sub_df = df[df['geo'] == country].copy()
-    if sub_df.empty:
+    if country not in derived.cube.geos:
         return None
     
+    def series(expr):
+        return derived.series(expr, country)
+    
     # Prepare data
-    temp = sub_df[['date', dep_var] + country_spec['shock_vars']].copy()
+    temp = pd.DataFrame({var: series(var) for var in [dep_var] + country_spec['shock_vars']})
     
     # Log levels for LHS
-    temp['log_dep'] = np.log(temp[dep_var])
-    temp['target'] = (temp['log_dep'].shift(-horizon) - temp['log_dep'].shift(1)) * 100
-    
-    # Shocks (already in percentage)
-    for shock in country_spec['shock_vars']:
-        temp[shock] = temp[shock]
+    log_dep = log(dep_var)
+    temp['log_dep'] = series(log_dep)
+    temp['target'] = (series(lag(log_dep, -horizon)) - series(lag(log_dep, 1))) * 100
 
     # Add Interaction Term if specified
     if country_spec.get('interaction', False) and len(country_spec['shock_vars']) >= 2:
@@ -73,23 +80,22 @@ def run_enhanced_lp(df, country, dep_var, horizon, country_spec):
         s1 = country_spec['shock_vars'][0] # DL_Gas_EUR
         s2 = country_spec['shock_vars'][1] # DL_XR_Local
         interaction_name = 'Interaction_Gas_FX'
-        temp[interaction_name] = temp[s1] * temp[s2]
+        temp[interaction_name] = series(product(s1, s2))
         # Add to features list for regression later
         # We need to manage this dynamically in the regression step
 
     
     # Lagged dependent variable growth
-    dep_growth = temp['log_dep'].diff() * 100
-    temp['lag_dep_1'] = dep_growth.shift(1)
-    temp['lag_dep_2'] = dep_growth.shift(2)
+    temp['lag_dep_1'] = series(lag(dlog(dep_var), 1))
+    temp['lag_dep_2'] = series(lag(dlog(dep_var), 2))
     
     # Lagged shocks
     for shock in country_spec['shock_vars']:
-        temp[f'lag_{shock}_1'] = temp[shock].shift(1)
+        temp[f'lag_{shock}_1'] = series(lag(shock, 1))
     
     # Controls
-    if 'EA_IP_Total' in sub_df.columns:
-        temp['EA_IP_Total'] = sub_df['EA_IP_Total'].values
+    if 'EA_IP_Total' in derived.cube:
+        temp['EA_IP_Total'] = series('EA_IP_Total')
     
     # Drop NA
     temp = temp.dropna()
@@ -153,7 +159,7 @@ def run_enhanced_lp(df, country, dep_var, horizon, country_spec):
     
     return results
 
-def run_country_analysis(df, country_code):
+def run_country_analysis(derived, country_code):
     """
     Run complete LP analysis for a country
     """
@@ -172,7 +178,7 @@ def run_country_analysis(df, country_code):
         var_results = []
         
         for h in range(HORIZONS + 1):
-            result = run_enhanced_lp(df, country_code, var, h, spec)
+            result = run_enhanced_lp(derived, country_code, var, h, spec)
             
             if result:
                 result['variable'] = var
@@ -356,12 +362,12 @@ def main():
         print("Data file not found")
         return
     
-    df = pd.read_csv(DATA_PATH)
-    df['date'] = pd.to_datetime(df['date'])
+    df = load_panel(DATA_PATH, columns=VARIABLES + ['DL_Gas_EUR', 'DL_XR_Local', 'EA_IP_Total'])
+    derived = DerivedPanel(PanelCube.from_panel(df))
     
     # Run analysis for both countries
     for country in ['ES', 'PL']:
-        results = run_country_analysis(df, country)
+        results = run_country_analysis(derived, country)
         
         if results is not None:
             print(f"\nSuccessfully completed analysis for {country}")
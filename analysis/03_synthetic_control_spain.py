@@ -9,7 +9,11 @@ import seaborn as sns
 import os
 from sklearn.linear_model import LinearRegression, Ridge
 from sklearn.utils.validation import check_X_y
-from scipy.optimize import minimize
+
+import sys
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+from panel_store import load_panel
+from scm import SCMPanel, fit_series
 
 # Config
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data.csv")
@@ -26,7 +30,7 @@ START_DATE = '2019-01-01'
 INTERVENTION_DATE = '2022-06-01' # Iberian Mechanism Implementation
 END_DATE = '2024-12-01'
 
-def synthetic_control(df, target, donors, variable, start_date, intervention_date, end_date):
+def synthetic_control(panel, target, donors, variable, start_date, intervention_date, end_date):
     """
     Implements a simple Synthetic Control Method using constrained Linear Regression (Non-negative weights summing to 1 would be ideal, 
     but OLS/Ridge on pre-trend is a robust approximation for "Synthetic" construction in many contexts if donors are well-chosen).
@@ -35,55 +39,30 @@ def synthetic_control(df, target, donors, variable, start_date, intervention_dat
     Here we minimize pre-intervention prediction error of the outcome variable (Inflation).
     """
     
-    # 1. Prepare Data
-    pivot = df.pivot(index='date', columns='geo', values=variable)
-    pivot = pivot.dropna()
-    
-    # Check availability
-    available_donors = [d for d in donors if d in pivot.columns]
-    if target not in pivot.columns:
+    # 1. Prepare Data (panel: the variable's SCMPanel, pivoted once in main)
+    available_donors = [d for d in donors if d in panel]
+    if target not in panel:
         print(f"Target {target} not in data.")
         return
     
     print(f"Comparison: {target} vs {available_donors}")
     
-    # Subset time
-    mask_pre = (pivot.index >= start_date) & (pivot.index < intervention_date)
-    mask_post = (pivot.index >= intervention_date) & (pivot.index <= end_date)
-    
-    # X (Donors) and y (Target)
-    X_pre = pivot.loc[mask_pre, available_donors]
-    y_pre = pivot.loc[mask_pre, target]
-    
-    X_full = pivot.loc[(pivot.index >= start_date) & (pivot.index <= end_date), available_donors]
-    y_full = pivot.loc[(pivot.index >= start_date) & (pivot.index <= end_date), target]
-    
     # 2. Estimate Weights
     # We want w such that y_pre ~ X_pre * w
     # Constraint: sum(w) = 1, w >= 0.
-    # We can use scipy.optimize for this.
-    from scipy.optimize import minimize
-    
-    def loss(w):
-        return np.sum((y_pre - X_pre.dot(w))**2)
-    
-    def constraint_sum(w):
-        return np.sum(w) - 1.0
-    
-    n_donors = len(available_donors)
-    w0 = np.ones(n_donors) / n_donors
-    bounds = [(0, 1) for _ in range(n_donors)]
-    constraints = [{'type': 'eq', 'fun': constraint_sum}]
-    
-    res = minimize(loss, w0, bounds=bounds, constraints=constraints)
-    weights = res.x
+    fit = panel.fit(target, donors, (start_date, intervention_date), (intervention_date, end_date))
+    if fit is None:
+        print("Optimization failed.")
+        return
+    weights = fit['weights']
     
     print("Synthetic Weights:")
     for d, w in zip(available_donors, weights):
         print(f"  {d}: {w:.3f}")
         
     # 3. Construct Synthetic Control
-    synthetic = X_full.dot(weights)
+    y_full = fit_series(fit, 'actual')
+    synthetic = fit_series(fit, 'synthetic')
     
     # 4. Plot
     plt.figure(figsize=(10, 6))
@@ -131,7 +110,7 @@ def synthetic_control(df, target, donors, variable, start_date, intervention_dat
     plt.savefig(out_path_yoy, dpi=300)
     plt.close()
 
-def run_leave_one_out(df, target, donors, variable, start_date, intervention_date, end_date):
+def run_leave_one_out(panel, target, donors, variable, start_date, intervention_date, end_date):
     """
     Runs SCM multiple times, excluding one donor at a time to check robustness.
     """
@@ -149,52 +128,19 @@ def run_leave_one_out(df, target, donors, variable, start_date, intervention_dat
         sub_pool = [d for d in donors if d != exclude_country]
         if not sub_pool: continue
         
-        # Prepare Data
-        pivoted = df.pivot(index='date', columns='geo', values=variable)
-        if target not in pivoted.columns: continue
-        
-        # Check donors availability
-        available_donors = [c for c in sub_pool if c in pivoted.columns]
-        
-        # Drop NaN
-        data_clean = pivoted[[target] + available_donors].dropna()
-        if data_clean.empty: continue
-        
-        # Split Data
-        pre_intervention = data_clean[data_clean.index < intervention_date]
-        if pre_intervention.empty: continue
-        
-        y_pre = pre_intervention[target].values
-        X_pre = pre_intervention[available_donors].values
-        
-        # Optimize Weights
-        def loss(w): return np.sum((y_pre - X_pre.dot(w))**2)
-        def constraint_sum(w): return np.sum(w) - 1.0
-        
-        w0 = np.ones(len(available_donors)) / len(available_donors)
-        bounds = [(0, 1) for _ in range(len(available_donors))]
-        constraints = [{'type': 'eq', 'fun': constraint_sum}]
-        
-        try:
-            res = minimize(loss, w0, bounds=bounds, constraints=constraints)
-            weights = res.x
-            
-            # Construct Synthetic
-            X_full = data_clean[available_donors].values
-            synthetic = X_full.dot(weights)
-            synthetic_series = pd.Series(synthetic, index=data_clean.index)
-            
-            variations.append((exclude_country, synthetic_series))
-        except Exception as e:
-            print(f"Failed LOO for {exclude_country}: {e}")
+        # Complete cases of the target and this pool only, no start date
+        fit = panel.fit(target, sub_pool, (None, intervention_date), (intervention_date, None),
+                        complete='pool')
+        if fit is None or not fit['pre'].any():
+            print(f"Failed LOO for {exclude_country}")
+            continue
+        variations.append((exclude_country, fit_series(fit, 'synthetic')))
             
     # Plotting
     plt.figure(figsize=(10, 6))
     
     # Plot Real Data
-    # Get Real Data again (hacky but safe)
-    pivoted_full = df.pivot(index='date', columns='geo', values=variable)
-    y_real = pivoted_full[target].dropna()
+    y_real = panel.series(target).dropna()
     plt.plot(y_real.index, y_real, label='Actual Spain', color='red', linewidth=3, zorder=10)
     
     # Plot Variations
@@ -220,8 +166,7 @@ def main():
         print("Data not found.")
         return
         
-    df = pd.read_csv(DATA_PATH)
-    df['date'] = pd.to_datetime(df['date'])
+    df = load_panel(DATA_PATH, columns=['HICP_Total', 'CP0451', 'HICP_Energy'])
     
     # Run SCM for multiple variables
     targets = [
@@ -232,8 +177,9 @@ def main():
     
     for var_code, var_name in targets:
         print(f"\n--- Running SCM for {var_name} ({var_code}) ---")
-        synthetic_control(df, TARGET_COUNTRY, DONOR_POOL, var_code, START_DATE, INTERVENTION_DATE, END_DATE)
-        run_leave_one_out(df, TARGET_COUNTRY, DONOR_POOL, var_code, START_DATE, INTERVENTION_DATE, END_DATE)
+        panel = SCMPanel.from_long(df, var_code)
+        synthetic_control(panel, TARGET_COUNTRY, DONOR_POOL, var_code, START_DATE, INTERVENTION_DATE, END_DATE)
+        run_leave_one_out(panel, TARGET_COUNTRY, DONOR_POOL, var_code, START_DATE, INTERVENTION_DATE, END_DATE)
 
 if __name__ == "__main__":
     main()
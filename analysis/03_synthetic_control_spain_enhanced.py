@@ -12,11 +12,15 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
-from scipy.optimize import minimize
-from sklearn.metrics import mean_squared_error
 import warnings
 warnings.filterwarnings('ignore')
 
+import sys
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+from panel_store import load_panel, flag_mask
+from derived import apply
+from scm import SCMPanel, fit_series
+
 # Config
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data.csv")
 FIGURES_DIR = os.path.join(PROJECT_ROOT, "paper", "figures")
@@ -38,148 +42,89 @@ PREDICTOR_VARS = {
     'energy': ['DL_Gas_EUR'],  # Gas price exposure
 }
 
-def calculate_predictors(df, country, start_date, intervention_date):
+def predictor_table(df, start_date, intervention_date):
     """
-    Calculate multidimensional predictors for SCM
+    Calculate multidimensional predictors for SCM, for every country at once
     Includes pre-intervention means, trends, and energy structure
+    Returns a geo x predictor DataFrame
     """
-    sub_df = df[(df['geo'] == country) & 
-                (df['date'] >= start_date) & 
-                (df['date'] < intervention_date)].copy()
-    
-    if sub_df.empty:
-        return None
+    sub_df = df[(df['date'] >= start_date) & (df['date'] < intervention_date)]
+    groups = sub_df.groupby('geo', sort=False)
+    predictors = pd.DataFrame(index=groups.size().index)
+    first = groups.head(1).set_index('geo')
+    last = groups.tail(1).set_index('geo')
     
-    predictors = {}
-    
-    # 1. Outcome variables (pre-intervention means) - ensure all exist
+    # 1. Outcome variables (pre-intervention means and first-to-last trends)
     for var in PREDICTOR_VARS['outcome']:
-        col_name_mean = f'{var}_mean'
-        col_name_trend = f'{var}_trend'
-        
-        if var in sub_df.columns and not sub_df[var].isna().all():
-            predictors[col_name_mean] = sub_df[var].mean()
-            if len(sub_df[var].dropna()) > 1:
-                predictors[col_name_trend] = sub_df[var].iloc[-1] - sub_df[var].iloc[0]
-            else:
-                predictors[col_name_trend] = 0
+        if var in sub_df.columns:
+            predictors[f'{var}_mean'] = groups[var].mean()
+            predictors[f'{var}_trend'] = (last[var] - first[var]).where(groups[var].count() > 1, 0)
         else:
-            # Fill with defaults if missing
-            predictors[col_name_mean] = 0
-            predictors[col_name_trend] = 0
+            predictors[f'{var}_mean'] = 0
+            predictors[f'{var}_trend'] = 0
     
-    # 2. Economic controls - ensure all exist
+    # 2. Economic controls
     for var in PREDICTOR_VARS['economic']:
-        col_name = f'{var}_mean'
-        if var in sub_df.columns and not sub_df[var].isna().all():
-            predictors[col_name] = sub_df[var].mean()
-        else:
-            predictors[col_name] = 0
+        predictors[f'{var}_mean'] = groups[var].mean() if var in sub_df.columns else 0
     
-    # 3. Energy exposure (gas price correlation)
+    # 3. Energy exposure (gas price correlation over months with both, if more than 10)
+    predictors['gas_energy_corr'] = 0
     if 'DL_Gas_EUR' in sub_df.columns and 'HICP_Energy' in sub_df.columns:
-        valid_data = sub_df[['DL_Gas_EUR', 'HICP_Energy']].dropna()
-        if len(valid_data) > 10:
-            predictors['gas_energy_corr'] = valid_data['DL_Gas_EUR'].corr(valid_data['HICP_Energy'])
-        else:
-            predictors['gas_energy_corr'] = 0
-    else:
-        predictors['gas_energy_corr'] = 0
+        both = sub_df[['geo', 'DL_Gas_EUR', 'HICP_Energy']].dropna()
+        pairs = both.groupby('geo', sort=False)
+        x = both['DL_Gas_EUR'] - pairs['DL_Gas_EUR'].transform('mean')
+        y = both['HICP_Energy'] - pairs['HICP_Energy'].transform('mean')
+        moments = pd.DataFrame({'xy': x * y, 'xx': x * x, 'yy': y * y, 'geo': both['geo']}).groupby('geo').sum()
+        corr = moments['xy'] / np.sqrt(moments['xx'] * moments['yy'])
+        predictors['gas_energy_corr'] = corr.where(pairs.size() > 10).reindex(predictors.index)
     
     # 4. Volatility measures
-    if 'HICP_Total' in sub_df.columns and not sub_df['HICP_Total'].isna().all():
-        predictors['inflation_volatility'] = sub_df['HICP_Total'].std()
-    else:
-        predictors['inflation_volatility'] = 0
+    predictors['inflation_volatility'] = groups['HICP_Total'].std() if 'HICP_Total' in sub_df.columns else 0
     
     # Ensure all predictors are finite
-    for key, value in predictors.items():
-        if not np.isfinite(value):
-            predictors[key] = 0
-    
-    return predictors
+    return predictors.astype(np.float64).replace([np.inf, -np.inf], np.nan).fillna(0)
 
-def enhanced_synthetic_control(df, target, donors, variable, start_date, intervention_date, end_date):
+def enhanced_synthetic_control(df, target, donors, variable, start_date, intervention_date, end_date,
+                               predictors=None):
     """
     Enhanced SCM with multidimensional predictors and diagnostic statistics
+    predictors: predictor_table for the same window (computed if not given)
     """
     print(f"\n{'='*60}")
     print(f"Running Enhanced SCM for {variable}")
     print(f"{'='*60}")
     
-    # Prepare data
-    pivot = df.pivot(index='date', columns='geo', values=variable)
-    pivot = pivot.dropna()
+    # Prepare data (the variable pivoted once for all fits)
+    panel = SCMPanel.from_long(df, variable)
     
-    available_donors = [d for d in donors if d in pivot.columns]
-    if target not in pivot.columns:
+    available_donors = [d for d in donors if d in panel]
+    if target not in panel:
         print(f"Target {target} not found in data")
         return None
     
     print(f"Target: {target}")
     print(f"Donor pool: {available_donors}")
     
-    # Time masks
-    mask_pre = (pivot.index >= start_date) & (pivot.index < intervention_date)
-    mask_post = (pivot.index >= intervention_date) & (pivot.index <= end_date)
-    mask_full = (pivot.index >= start_date) & (pivot.index <= end_date)
-    
-    # 1. Calculate multidimensional predictors for target and donors
+    # 1. Multidimensional predictors for target and donors
     print("\nCalculating multidimensional predictors...")
-    target_predictors = calculate_predictors(df, target, start_date, intervention_date)
+    if predictors is None:
+        predictors = predictor_table(df, start_date, intervention_date)
     
-    donor_predictors = {}
-    for donor in available_donors:
-        donor_predictors[donor] = calculate_predictors(df, donor, start_date, intervention_date)
-    
-    # 2. Build predictor matrix
-    predictor_names = list(target_predictors.keys())
+    # 2. Predictor variables
+    predictor_names = list(predictors.columns)
     print(f"Predictor variables: {predictor_names}")
     
-    # Target predictor vector
-    y_pred = np.array([target_predictors[name] for name in predictor_names])
-    
-    # Donor predictor matrix
-    X_pred = np.array([
-        [donor_predictors[donor][name] for name in predictor_names]
-        for donor in available_donors
-    ])
-    
-    # 3. Optimize weights using pre-intervention outcome fit AND predictor fit
-    def combined_loss(w):
-        # Outcome fit (primary objective)
-        y_pre_outcome = pivot.loc[mask_pre, target]
-        X_pre_outcome = pivot.loc[mask_pre, available_donors]
-        outcome_loss = np.sum((y_pre_outcome - X_pre_outcome.dot(w))**2)
-        
-        # Predictor fit (secondary objective)
-        # X_pred shape: (n_donors, n_predictors)
-        # We want: y_pred (n_predictors,) ~ w (n_donors,) dot X_pred (n_donors, n_predictors)
-        # Which gives: w.T @ X_pred
-        predicted_predictors = w @ X_pred  # Shape: (n_predictors,)
-        predictor_loss = np.sum((y_pred - predicted_predictors)**2)
-        
-        # Combined loss (can adjust weights)
-        return outcome_loss + 0.5 * predictor_loss
-    
-    # Constraints: weights sum to 1, non-negative
-    def constraint_sum(w):
-        return np.sum(w) - 1.0
-    
-    n_donors = len(available_donors)
-    w0 = np.ones(n_donors) / n_donors
-    bounds = [(0, 1) for _ in range(n_donors)]
-    constraints = [{'type': 'eq', 'fun': constraint_sum}]
-    
-    # Optimization
-    result = minimize(combined_loss, w0, bounds=bounds, constraints=constraints, 
-                     method='SLSQP', options={'disp': True, 'maxiter': 1000})
+    # 3. Optimize weights: predictor importance V chosen to fit the
+    # pre-intervention outcome, donor weights W fitting the standardized
+    # predictors under that V (nested V-matrix optimization)
+    fit = panel.fit_nested(target, available_donors, (start_date, intervention_date),
+                           (intervention_date, end_date), predictors)
     
-    if not result.success:
-        print(f"Optimization failed: {result.message}")
+    if fit is None:
+        print("Optimization failed")
         return None
     
-    weights = result.x
+    weights = fit['weights']
     
     # 4. Calculate diagnostics
     print("\n" + "="*60)
@@ -187,11 +132,12 @@ def enhanced_synthetic_control(df, target, donors, variable, start_date, interve
     print("="*60)
     
     # Pre-intervention RMSPE
-    y_pre = pivot.loc[mask_pre, target]
-    X_pre = pivot.loc[mask_pre, available_donors]
-    synthetic_pre = X_pre.dot(weights)
+    y_full = fit_series(fit, 'actual')
+    synthetic_full = fit_series(fit, 'synthetic')
+    y_pre = y_full[fit['pre']]
+    synthetic_pre = synthetic_full[fit['pre']]
     
-    rmspe_pre = np.sqrt(mean_squared_error(y_pre, synthetic_pre))
+    rmspe_pre = fit['rmspe_pre']
     print(f"Pre-intervention RMSPE: {rmspe_pre:.4f}")
     
     # Pre-intervention MAPE
@@ -204,6 +150,15 @@ def enhanced_synthetic_control(df, target, donors, variable, start_date, interve
     r_squared = 1 - (ss_res / ss_tot)
     print(f"Pre-intervention R²: {r_squared:.4f}")
     
+    # Predictor importance
+    print(f"\nPredictor Weights (V), {fit['nit']} outer iterations, "
+          f"{fit['evaluations']} candidate V's ({fit['cache_hits']} cached), {fit['inner_nit']} inner iterations:")
+    for name, v in fit['v'].sort_values(ascending=False).items():
+        print(f"  {name}: {v:.4f}")
+    if not fit['converged']:
+        print(f"  WARNING: V search stopped on its iteration limit before converging; "
+              f"weights may not be optimal")
+    
     # Weight distribution
     print(f"\nOptimal Weights:")
     for donor, weight in zip(available_donors, weights):
@@ -216,17 +171,12 @@ def enhanced_synthetic_control(df, target, donors, variable, start_date, interve
     dominant_donor = available_donors[np.argmax(weights)]
     print(f"Dominant donor: {dominant_donor} ({max_weight:.2%})")
     
-    # 5. Construct synthetic control
-    X_full = pivot.loc[mask_full, available_donors]
-    y_full = pivot.loc[mask_full, target]
-    synthetic_full = X_full.dot(weights)
-    
-    # 6. Calculate post-intervention effects
-    gap = y_full - synthetic_full
-    gap_post = gap[gap.index >= intervention_date]
+    # 5. Post-intervention effects of the synthetic control
+    gap = fit_series(fit, 'gap')
+    gap_post = gap[fit['post']]
     
     # Average treatment effect
-    ate = gap_post.mean()
+    ate = fit['ate']
     ate_std = gap_post.std()
     
     print(f"\n{'='*60}")
@@ -236,10 +186,16 @@ def enhanced_synthetic_control(df, target, donors, variable, start_date, interve
     print(f"Standard deviation of effect: {ate_std:.4f}")
     print(f"Number of post-intervention periods: {len(gap_post)}")
     
+    # Provisional / estimated target observations (Eurostat flags p, e)
+    flagged_dates = df.loc[(df['geo'] == target) & flag_mask(df, variable), 'date']
+    n_flagged_post = int(gap_post.index.isin(flagged_dates).sum())
+    if n_flagged_post:
+        print(f"Provisional/estimated {target} observations in post-period: {n_flagged_post}")
+    
     # YoY inflation effect
     if variable == 'HICP_Total':
-        y_full_yoy = y_full.pct_change(12) * 100
-        synthetic_yoy = synthetic_full.pct_change(12) * 100
+        y_full_yoy = apply('yoy', y_full, 12)
+        synthetic_yoy = apply('yoy', synthetic_full, 12)
         gap_yoy = y_full_yoy - synthetic_yoy
         gap_yoy_post = gap_yoy[gap_yoy.index >= intervention_date]
         
@@ -249,12 +205,13 @@ def enhanced_synthetic_control(df, target, donors, variable, start_date, interve
         print(f"Average effect on YoY inflation: {ate_yoy:.2f} percentage points")
         print(f"Standard deviation: {ate_yoy_std:.2f}")
     
-    # 7. Save results
+    # 6. Save results
     results_df = pd.DataFrame({
         'date': y_full.index,
         'actual': y_full.values,
         'synthetic': synthetic_full.values,
-        'gap': gap.values
+        'gap': gap.values,
+        'flagged': y_full.index.isin(flagged_dates)
     })
     
     if variable == 'HICP_Total':
@@ -267,9 +224,10 @@ def enhanced_synthetic_control(df, target, donors, variable, start_date, interve
     results_df.to_csv(output_file, index=False)
     print(f"\nResults saved to: {output_file}")
     
-    # 8. Plotting
+    # 7. Plotting
     plot_scm_results(y_full, synthetic_full, gap, intervention_date, 
-                    variable, target, weights, available_donors, rmspe_pre, ate_yoy if variable == 'HICP_Total' else None)
+                    variable, target, weights, available_donors, rmspe_pre, ate_yoy if variable == 'HICP_Total' else None,
+                    (y_full_yoy, synthetic_yoy) if variable == 'HICP_Total' else None)
     
     # Return diagnostics
     return {
@@ -279,12 +237,14 @@ def enhanced_synthetic_control(df, target, donors, variable, start_date, interve
         'r_squared': r_squared,
         'ate': ate,
         'ate_yoy': ate_yoy if variable == 'HICP_Total' else None,
-        'post_periods': len(gap_post)
+        'post_periods': len(gap_post),
+        'flagged_post': n_flagged_post
     }
 
-def plot_scm_results(actual, synthetic, gap, intervention_date, variable, target, weights, donors, rmspe_pre, ate_yoy=None):
+def plot_scm_results(actual, synthetic, gap, intervention_date, variable, target, weights, donors, rmspe_pre, ate_yoy=None, yoy_series=None):
     """
     Create publication-quality SCM plots with confidence bands and diagnostics
+    (yoy_series: the (actual, synthetic) YoY rates already computed by the caller)
     """
     fig, axes = plt.subplots(2, 2, figsize=(14, 10))
     fig.suptitle(f'Enhanced Synthetic Control Analysis: {target} vs Synthetic {target}\nVariable: {variable}', 
@@ -328,8 +288,8 @@ def plot_scm_results(actual, synthetic, gap, intervention_date, variable, target
     # Plot 3: YoY Inflation (if applicable)
     if ate_yoy is not None:
         ax3 = axes[1, 0]
-        actual_yoy = actual.pct_change(12) * 100
-        synthetic_yoy = synthetic.pct_change(12) * 100
+        actual_yoy, synthetic_yoy = yoy_series if yoy_series is not None else (
+            apply('yoy', actual, 12), apply('yoy', synthetic, 12))
         
         ax3.plot(actual_yoy.index, actual_yoy, label=f'Actual {target}', color='#d62728', linewidth=2.5)
         ax3.plot(synthetic_yoy.index, synthetic_yoy, label=f'Synthetic {target}', color='#1f77b4', 
@@ -383,8 +343,8 @@ def main():
         print("Data file not found")
         return
     
-    df = pd.read_csv(DATA_PATH)
-    df['date'] = pd.to_datetime(df['date'])
+    outcomes = ['HICP_Total', 'CP0451', 'HICP_Energy']
+    df = load_panel(DATA_PATH, columns=outcomes + [f'{v}_flag' for v in outcomes] + ['IP_Total', 'DL_Gas_EUR'])
     
     # Variables to analyze
     variables = [
@@ -396,13 +356,16 @@ def main():
     # Store diagnostics
     diagnostics_summary = []
     
+    # Predictors depend on the window only, so one table serves every outcome
+    predictors = predictor_table(df, START_DATE, INTERVENTION_DATE)
+    
     for var_code, var_name in variables:
         if var_code not in df.columns:
             print(f"Variable {var_code} not found in data")
             continue
         
         diag = enhanced_synthetic_control(df, TARGET_COUNTRY, DONOR_POOL, var_code, 
-                                         START_DATE, INTERVENTION_DATE, END_DATE)
+                                         START_DATE, INTERVENTION_DATE, END_DATE, predictors)
         
         if diag:
             diag['variable'] = var_code
@@ -12,11 +12,14 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
-from scipy.optimize import minimize
-from sklearn.metrics import mean_squared_error
 import warnings
 warnings.filterwarnings('ignore')
 
+import sys
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+from panel_store import load_panel
+from scm import SCMPanel, fit_series
+
 # Config
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data.csv")
 FIGURES_DIR = os.path.join(PROJECT_ROOT, "paper", "figures")
@@ -32,61 +35,7 @@ START_DATE = '2019-01-01'
 END_DATE = '2023-12-01'
 VARIABLE = 'HICP_Total'  # Focus on headline inflation
 
-def run_scm(df, target, donors, variable, start_date, intervention_date, end_date):
-    """Run standard SCM - simplified for placebo tests"""
-    pivot = df.pivot(index='date', columns='geo', values=variable)
-    pivot = pivot.dropna()
-    
-    available_donors = [d for d in donors if d in pivot.columns]
-    if target not in pivot.columns:
-        return None
-    
-    mask_pre = (pivot.index >= start_date) & (pivot.index < intervention_date)
-    mask_full = (pivot.index >= start_date) & (pivot.index <= end_date)
-    
-    # Pre-intervention data
-    y_pre = pivot.loc[mask_pre, target]
-    X_pre = pivot.loc[mask_pre, available_donors]
-    
-    # Optimization
-    def loss(w):
-        return np.sum((y_pre - X_pre.dot(w))**2)
-    
-    def constraint_sum(w):
-        return np.sum(w) - 1.0
-    
-    n_donors = len(available_donors)
-    w0 = np.ones(n_donors) / n_donors
-    bounds = [(0, 1) for _ in range(n_donors)]
-    constraints = [{'type': 'eq', 'fun': constraint_sum}]
-    
-    result = minimize(loss, w0, bounds=bounds, constraints=constraints, method='SLSQP')
-    
-    if not result.success:
-        return None
-    
-    weights = result.x
-    
-    # Full data
-    X_full = pivot.loc[mask_full, available_donors]
-    y_full = pivot.loc[mask_full, target]
-    synthetic_full = X_full.dot(weights)
-    
-    # Calculate gap
-    gap = y_full - synthetic_full
-    
-    # Pre-intervention RMSPE
-    rmspe_pre = np.sqrt(mean_squared_error(y_pre, X_pre.dot(weights)))
-    
-    return {
-        'weights': dict(zip(available_donors, weights)),
-        'rmspe_pre': rmspe_pre,
-        'gap': gap,
-        'actual': y_full,
-        'synthetic': synthetic_full
-    }
-
-def time_placebo_test(df, placebo_date='2021-06-01'):
+def time_placebo_test(panel, placebo_date='2021-06-01'):
     """
     Time placebo test: Run SCM with fake intervention date
     """
@@ -96,31 +45,28 @@ def time_placebo_test(df, placebo_date='2021-06-01'):
     print(f"Placebo intervention date: {placebo_date}")
     print(f"If effect is real, we should see NO effect before actual intervention")
     
-    result = run_scm(df, TARGET_COUNTRY, DONOR_POOL, VARIABLE, 
-                    START_DATE, placebo_date, END_DATE)
+    result = panel.fit(TARGET_COUNTRY, DONOR_POOL, (START_DATE, placebo_date), (placebo_date, END_DATE))
     
     if result is None:
         print("Placebo test failed")
         return None
     
     # Calculate placebo effect
-    placebo_gap = result['gap']
-    placebo_post = placebo_gap[placebo_gap.index >= placebo_date]
+    placebo_gap = fit_series(result, 'gap')
     
     # Compare to actual effect
-    actual_result = run_scm(df, TARGET_COUNTRY, DONOR_POOL, VARIABLE,
-                           START_DATE, INTERVENTION_DATE, END_DATE)
+    actual_result = panel.fit(TARGET_COUNTRY, DONOR_POOL, (START_DATE, INTERVENTION_DATE),
+                              (INTERVENTION_DATE, END_DATE))
     
     if actual_result is None:
         print("Actual SCM failed")
         return None
     
-    actual_gap = actual_result['gap']
-    actual_post = actual_gap[actual_gap.index >= INTERVENTION_DATE]
+    actual_gap = fit_series(actual_result, 'gap')
     
     # Statistics
-    placebo_effect = placebo_post.mean()
-    actual_effect = actual_post.mean()
+    placebo_effect = result['ate']
+    actual_effect = actual_result['ate']
     
     print(f"\nPlacebo effect (pre-intervention): {placebo_effect:.4f}")
     print(f"Actual effect (post-intervention): {actual_effect:.4f}")
@@ -179,7 +125,7 @@ def time_placebo_test(df, placebo_date='2021-06-01'):
         'actual_rmspe': actual_result['rmspe_pre']
     }
 
-def permutation_test(df, n_permutations=100):
+def permutation_test(panel, n_permutations=100):
     """
     Permutation test: Randomly assign treatment to donor countries
     """
@@ -189,16 +135,14 @@ def permutation_test(df, n_permutations=100):
     print(f"Running {n_permutations} permutations...")
     
     # Get actual treatment effect
-    actual_result = run_scm(df, TARGET_COUNTRY, DONOR_POOL, VARIABLE,
-                           START_DATE, INTERVENTION_DATE, END_DATE)
+    actual_result = panel.fit(TARGET_COUNTRY, DONOR_POOL, (START_DATE, INTERVENTION_DATE),
+                              (INTERVENTION_DATE, END_DATE))
     
     if actual_result is None:
         print("Actual SCM failed")
         return None
     
-    actual_gap = actual_result['gap']
-    actual_post = actual_gap[actual_gap.index >= INTERVENTION_DATE]
-    actual_effect = actual_post.mean()
+    actual_effect = actual_result['ate']
     actual_rmspe = actual_result['rmspe_pre']
     
     print(f"Actual treatment effect: {actual_effect:.4f}")
@@ -208,26 +152,20 @@ def permutation_test(df, n_permutations=100):
     placebo_effects = []
     placebo_rmspes = []
     
-    for i, donor in enumerate(DONOR_POOL):
-        if donor == TARGET_COUNTRY:
-            continue
-            
-        print(f"  Permutation {i+1}/{len(DONOR_POOL)-1}: Treating {donor} as treated unit")
-        
-        # Create new donor pool (exclude the "treated" donor)
-        new_donors = [d for d in DONOR_POOL if d != donor]
-        
-        # Run SCM with this donor as "treated"
-        placebo_result = run_scm(df, donor, new_donors, VARIABLE,
-                                START_DATE, INTERVENTION_DATE, END_DATE)
+    # Each donor as if it were the treated unit, from the others, in one batch
+    placebos = [d for d in DONOR_POOL if d != TARGET_COUNTRY]
+    placebo_results = panel.fit_batch([(donor, [d for d in DONOR_POOL if d != donor],
+                                        (START_DATE, INTERVENTION_DATE), (INTERVENTION_DATE, END_DATE))
+                                       for donor in placebos])
+    
+    for i, (donor, placebo_result) in enumerate(zip(placebos, placebo_results)):
+        print(f"  Permutation {i+1}/{len(placebos)}: Treating {donor} as treated unit")
         
         if placebo_result is None:
             continue
         
-        # Calculate placebo effect
-        placebo_gap = placebo_result['gap']
-        placebo_post = placebo_gap[placebo_gap.index >= INTERVENTION_DATE]
-        placebo_effect = placebo_post.mean()
+        # Placebo effect: mean post-intervention gap
+        placebo_effect = placebo_result['ate']
         
         placebo_effects.append(placebo_effect)
         placebo_rmspes.append(placebo_result['rmspe_pre'])
@@ -302,16 +240,16 @@ def main():
         print("Data file not found")
         return
     
-    df = pd.read_csv(DATA_PATH)
-    df['date'] = pd.to_datetime(df['date'])
+    df = load_panel(DATA_PATH, columns=[VARIABLE])
+    panel = SCMPanel.from_long(df, VARIABLE)
     
     # Run time placebo test
     print("Running time placebo test...")
-    placebo_results = time_placebo_test(df, placebo_date='2021-06-01')
+    placebo_results = time_placebo_test(panel, placebo_date='2021-06-01')
     
     # Run permutation test
     print("\nRunning permutation test...")
-    perm_results = permutation_test(df, n_permutations=len(DONOR_POOL))
+    perm_results = permutation_test(panel, n_permutations=len(DONOR_POOL))
     
     # Save results
     if placebo_results:
@@ -12,13 +12,19 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
-from scipy.optimize import minimize
-from sklearn.metrics import mean_squared_error
+import argparse
 import warnings
 warnings.filterwarnings('ignore')
 
+import sys
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+from panel_cube import PanelCube, map_with_cube
+from scm import SCMPanel, weight_dict, report_iterations
+
 # Config
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data.csv")
+# Every-geo panel from `process_data.py --universe` (optional)
+UNIVERSE_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data_universe.csv")
 FIGURES_DIR = os.path.join(PROJECT_ROOT, "paper", "figures")
 RESULTS_DIR = os.path.join(PROJECT_ROOT, "paper", "tables")
 os.makedirs(FIGURES_DIR, exist_ok=True)
@@ -26,68 +32,71 @@ os.makedirs(RESULTS_DIR, exist_ok=True)
 
 # Base settings
 TARGET_COUNTRY = 'ES'
+DONOR_POOL = ['DE', 'FR', 'IT', 'AT', 'NL']
 INTERVENTION_DATE = '2022-06-01'
 START_DATE = '2019-01-01'
 END_DATE = '2023-12-01'
 VARIABLE = 'HICP_Total'
 
-def run_scm_basic(df, target, donors, variable, start_date, intervention_date, end_date):
-    """Simplified SCM for robustness checks"""
-    pivot = df.pivot(index='date', columns='geo', values=variable)
-    pivot = pivot.dropna()
-    
-    available_donors = [d for d in donors if d in pivot.columns]
-    if target not in pivot.columns:
-        return None
-    
-    mask_pre = (pivot.index >= start_date) & (pivot.index < intervention_date)
-    mask_full = (pivot.index >= start_date) & (pivot.index <= end_date)
-    
-    y_pre = pivot.loc[mask_pre, target]
-    X_pre = pivot.loc[mask_pre, available_donors]
-    
-    def loss(w):
-        return np.sum((y_pre - X_pre.dot(w))**2)
-    
-    def constraint_sum(w):
-        return np.sum(w) - 1.0
-    
-    n_donors = len(available_donors)
-    if n_donors == 0:
-        return None
-    
-    w0 = np.ones(n_donors) / n_donors
-    bounds = [(0, 1) for _ in range(n_donors)]
-    constraints = [{'type': 'eq', 'fun': constraint_sum}]
-    
-    result = minimize(loss, w0, bounds=bounds, constraints=constraints, method='SLSQP')
-    
-    if not result.success:
-        return None
-    
-    weights = result.x
-    
-    X_full = pivot.loc[mask_full, available_donors]
-    y_full = pivot.loc[mask_full, target]
-    synthetic_full = X_full.dot(weights)
-    
-    gap = y_full - synthetic_full
-    
-    rmspe_pre = np.sqrt(mean_squared_error(y_pre, X_pre.dot(weights)))
-    
-    gap_post = gap[gap.index >= intervention_date]
-    ate = gap_post.mean()
-    
-    return {
-        'weights': dict(zip(available_donors, weights)),
-        'rmspe_pre': rmspe_pre,
-        'ate': ate,
-        'gap': gap,
-        'donors_used': available_donors
-    }
+# EU member states (Eurostat geo codes), the full donor universe
+EU27 = ['AT', 'BE', 'BG', 'CY', 'CZ', 'DE', 'DK', 'EE', 'EL', 'ES', 'FI', 'FR', 'HR', 'HU',
+        'IE', 'IT', 'LT', 'LU', 'LV', 'MT', 'NL', 'PL', 'PT', 'RO', 'SE', 'SI', 'SK']
+
+# SCM panels built in this process, one per (cube, variable, geos)
+_PANELS = {}
+
+def scm_panel(cube, variable, geos=None):
+    """SCMPanel of a cube variable (geos: restrict the panel first), pivoted once"""
+    key = (id(cube), variable, None if geos is None else tuple(geos))
+    if key not in _PANELS:
+        _PANELS[key] = SCMPanel.from_cube(cube, variable, geos)
+    return _PANELS[key]
 
-def test_donor_pools(df):
-    """Test different donor pool specifications"""
+def _panel_specs(cube, specs):
+    """The panel of (target, donors, variable, start, intervention, end[, geos]) specs, and their fit() specs"""
+    variable, geos = specs[0][2], specs[0][6:]
+    return scm_panel(cube, variable, *geos), [
+        (target, donors, (start_date, intervention_date), (intervention_date, end_date))
+        for target, donors, _, start_date, intervention_date, end_date, *_ in specs]
+
+def _scm_batch_job(cube, specs):
+    """Pool job: specs on one panel solved together by fit_batch"""
+    panel, fit_specs = _panel_specs(cube, specs)
+    return panel.fit_batch(fit_specs)
+
+def _scm_sweep_job(cube, item):
+    """Pool job: (specs on one panel, cold_reference) fitted as a warm-started sweep"""
+    specs, cold_reference = item
+    panel, fit_specs = _panel_specs(cube, specs)
+    return panel.sweep(fit_specs, cold_reference=cold_reference)
+
+def fit_specs(cube, specs, workers=1, sweep=False, cold_reference=False):
+    """
+    One fit per spec, one job per (variable, geos) panel: a single
+    fit_batch, or with sweep=True a warm-started sweep of neighbouring
+    windows (cold_reference: also refit cold, for report_iterations)
+    """
+    groups = {}
+    for k, (_, _, variable, _, _, _, *geos) in enumerate(specs):
+        geos = geos[0] if geos else None
+        groups.setdefault((variable, None if geos is None else tuple(geos)), []).append(k)
+    items = [[specs[k] for k in ks] for ks in groups.values()]
+    if sweep:
+        batches = map_with_cube(_scm_sweep_job, [(group, cold_reference) for group in items], cube, workers)
+    else:
+        batches = map_with_cube(_scm_batch_job, items, cube, workers)
+    fitted = [None] * len(specs)
+    for ks, fits in zip(groups.values(), batches):
+        for k, fit in zip(ks, fits):
+            fitted[k] = fit
+    return fitted
+
+def test_donor_pools(cube, universe=None, workers=1):
+    """
+    Test different donor pool specifications. Pools with donors missing
+    from the panel (BE, IE, the full EU pool) are drawn from the every-geo
+    panel (universe) when available; otherwise those donors are skipped.
+    """
     print(f"\n{'='*70}")
     print("ROBUSTNESS: DIFFERENT DONOR POOLS")
     print(f"{'='*70}")
@@ -100,6 +109,22 @@ def test_donor_pools(df):
         'Southern Europe': ['IT', 'FR', 'PT'],  # Mediterranean countries
         'Expanded': ['DE', 'FR', 'IT', 'AT', 'NL', 'PT', 'BE', 'IE'], # Broadest pool
     }
+    base_geos = set(cube.geos)
+    if universe is not None:
+        donor_pools['EU Universe'] = [g for g in EU27 if g != TARGET_COUNTRY]
+    
+    # Pools beyond the baseline geos run on the universe cube, restricted to
+    # the baseline geos plus their donors for the same complete-case dates
+    wide = {name for name, donors in donor_pools.items()
+            if universe is not None and not set(donors) <= base_geos}
+    specs = {name: (TARGET_COUNTRY, donors, VARIABLE, START_DATE, INTERVENTION_DATE, END_DATE,
+                    sorted(base_geos | set(donors)) if name in wide else None)
+             for name, donors in donor_pools.items()}
+    fitted = {}
+    for pool_cube, names in ((cube, [n for n in specs if n not in wide]),
+                             (universe, [n for n in specs if n in wide])):
+        if names:
+            fitted.update(zip(names, fit_specs(pool_cube, [specs[n] for n in names], workers)))
     
     results = {}
     
@@ -107,15 +132,14 @@ def test_donor_pools(df):
         print(f"\nTesting donor pool: {name}")
         print(f"Donors: {donors}")
         
-        result = run_scm_basic(df, TARGET_COUNTRY, donors, VARIABLE, 
-                              START_DATE, INTERVENTION_DATE, END_DATE)
+        result = fitted[name]
         
         if result:
             results[name] = result
             print(f"  RMSPE: {result['rmspe_pre']:.4f}")
             print(f"  ATE: {result['ate']:.4f}")
-            print(f"  Effective donors: {len(result['donors_used'])}")
-            print(f"  Weights: {result['weights']}")
+            print(f"  Effective donors: {len(result['donors'])}")
+            print(f"  Weights: {weight_dict(result)}")
         else:
             print(f"  Failed to converge")
     
@@ -127,7 +151,7 @@ def test_donor_pools(df):
                 'Donor Pool': name,
                 'RMSPE': result['rmspe_pre'],
                 'ATE': result['ate'],
-                'Donors Used': len(result['donors_used'])
+                'Donors Used': len(result['donors'])
             })
         
         comparison_df = pd.DataFrame(comparison)
@@ -186,8 +210,8 @@ def test_donor_pools(df):
         print("No successful results")
         return None
 
-def test_time_periods(df):
-    """Test different pre-intervention periods"""
+def test_time_periods(cube, workers=1, cold_reference=False):
+    """Test different pre-intervention periods (cold_reference: report warm-start savings)"""
     print(f"\n{'='*70}")
     print("ROBUSTNESS: DIFFERENT TIME PERIODS")
     print(f"{'='*70}")
@@ -202,14 +226,15 @@ def test_time_periods(df):
     
     results = {}
     baseline_ate = None
+    specs = [(TARGET_COUNTRY, DONOR_POOL, VARIABLE, start, intervention, END_DATE)
+             for start, intervention in time_periods.values()]
+    fitted = fit_specs(cube, specs, workers, sweep=True, cold_reference=cold_reference)
+    report_iterations(fitted)
     
-    for name, (start, intervention) in time_periods.items():
+    for (name, (start, intervention)), result in zip(time_periods.items(), fitted):
         print(f"\nTesting period: {name}")
         print(f"Start: {start}, Intervention: {intervention}")
         
-        result = run_scm_basic(df, TARGET_COUNTRY, DONOR_POOL, VARIABLE, 
-                              start, intervention, END_DATE)
-        
         if result:
             results[name] = result
             print(f"  RMSPE: {result['rmspe_pre']:.4f}")
@@ -253,7 +278,7 @@ def test_time_periods(df):
         print("No successful results")
         return None
 
-def test_outcome_variables(df):
+def test_outcome_variables(cube, workers=1):
     """Test different outcome variables"""
     print(f"\n{'='*70}")
     print("ROBUSTNESS: DIFFERENT OUTCOME VARIABLES")
@@ -267,16 +292,19 @@ def test_outcome_variables(df):
     }
     
     results = {}
+    present = {name: var for name, var in variables.items() if var in cube}
+    fitted = dict(zip(present, fit_specs(
+        cube, [(TARGET_COUNTRY, DONOR_POOL, var, START_DATE, INTERVENTION_DATE, END_DATE)
+               for var in present.values()], workers)))
     
     for name, var in variables.items():
-        if var not in df.columns:
+        if var not in cube:
             print(f"\nSkipping {name}: {var} not in data")
             continue
         
         print(f"\nTesting variable: {name} ({var})")
         
-        result = run_scm_basic(df, TARGET_COUNTRY, DONOR_POOL, var, 
-                              START_DATE, INTERVENTION_DATE, END_DATE)
+        result = fitted[name]
         
         if result:
             results[name] = result
@@ -289,13 +317,11 @@ def test_outcome_variables(df):
     if results:
         comparison = []
         for name, result in results.items():
-            var_key = [k for k, v in variables.items() if v == [v for v in variables.values() if v in df.columns and v in str(result)][0]][0]
-            
             comparison.append({
                 'Outcome Variable': name,
                 'RMSPE': result['rmspe_pre'],
                 'ATE': result['ate'],
-                'Donors Used': len(result['donors_used'])
+                'Donors Used': len(result['donors'])
             })
         
         comparison_df = pd.DataFrame(comparison)
@@ -314,24 +340,44 @@ def test_outcome_variables(df):
         print("No successful results")
         return None
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SCM robustness checks')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes for the SCM fits (1 = run serially)')
+    parser.add_argument('--iteration-report', action='store_true',
+                        help='Also refit the time-period sweep cold to report solver iterations saved')
+    args = parser.parse_args(argv)
+    
     if not os.path.exists(DATA_PATH):
         print("Data file not found")
         return
     
-    df = pd.read_csv(DATA_PATH)
-    df['date'] = pd.to_datetime(df['date'])
+    # One shared-memory copy of each panel for all pool workers
+    cube = PanelCube.load(DATA_PATH, [VARIABLE, 'HICP_Core', 'HICP_Energy', 'CP0451'])
+    universe = None
+    if os.path.exists(UNIVERSE_PATH):
+        universe = PanelCube.load(UNIVERSE_PATH, [VARIABLE])
+        print(f"Donor universe: {len(universe.geos)} geos from {UNIVERSE_PATH}")
+    if args.workers > 1:
+        cube.share()
+        if universe is not None:
+            universe.share()
     
     print("Running comprehensive robustness checks...")
     
-    # Test 1: Different donor pools
-    donor_results = test_donor_pools(df)
-    
-    # Test 2: Different time periods
-    time_results = test_time_periods(df)
-    
-    # Test 3: Different outcome variables
-    outcome_results = test_outcome_variables(df)
+    try:
+        # Test 1: Different donor pools
+        donor_results = test_donor_pools(cube, universe, args.workers)
+        
+        # Test 2: Different time periods
+        time_results = test_time_periods(cube, args.workers, args.iteration_report)
+        
+        # Test 3: Different outcome variables
+        outcome_results = test_outcome_variables(cube, args.workers)
+    finally:
+        cube.close()
+        if universe is not None:
+            universe.close()
     
     # Create summary
     print(f"\n{'='*70}")
@@ -13,11 +13,14 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
-from scipy.optimize import minimize
-from sklearn.metrics import mean_squared_error
 import warnings
 warnings.filterwarnings('ignore')
 
+import sys
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+from panel_store import load_panel
+from scm import SCMPanel, fit_series
+
 # Config
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data.csv")
 FIGURES_DIR = os.path.join(PROJECT_ROOT, "paper", "figures")
@@ -34,58 +37,7 @@ END_DATE = '2023-12-01'
 VARIABLE = 'HICP_Total'
 ALPHA = 0.05  # Significance level for 95% CI
 
-def run_scm_return_gap(df, target, donors, variable, start_date, intervention_date, end_date):
-    """Run SCM and return full gap time series"""
-    pivot = df.pivot(index='date', columns='geo', values=variable)
-    pivot = pivot.dropna()
-    
-    available_donors = [d for d in donors if d in pivot.columns]
-    if target not in pivot.columns:
-        return None
-    
-    mask_pre = (pivot.index >= start_date) & (pivot.index < intervention_date)
-    mask_full = (pivot.index >= start_date) & (pivot.index <= end_date)
-    
-    y_pre = pivot.loc[mask_pre, target]
-    X_pre = pivot.loc[mask_pre, available_donors]
-    
-    def loss(w):
-        return np.sum((y_pre - X_pre.dot(w))**2)
-    
-    def constraint_sum(w):
-        return np.sum(w) - 1.0
-    
-    n_donors = len(available_donors)
-    if n_donors == 0:
-        return None
-    
-    w0 = np.ones(n_donors) / n_donors
-    bounds = [(0, 1) for _ in range(n_donors)]
-    constraints = [{'type': 'eq', 'fun': constraint_sum}]
-    
-    result = minimize(loss, w0, bounds=bounds, constraints=constraints, method='SLSQP')
-    
-    if not result.success:
-        return None
-    
-    weights = result.x
-    
-    X_full = pivot.loc[mask_full, available_donors]
-    y_full = pivot.loc[mask_full, target]
-    synthetic_full = X_full.dot(weights)
-    
-    gap = y_full - synthetic_full
-    rmspe_pre = np.sqrt(mean_squared_error(y_pre, X_pre.dot(weights)))
-    
-    return {
-        'gap': gap,
-        'actual': y_full,
-        'synthetic': synthetic_full,
-        'rmspe_pre': rmspe_pre,
-        'weights': dict(zip(available_donors, weights))
-    }
-
-def compute_placebo_gaps(df):
+def compute_placebo_gaps(panel):
     """
     Run SCM for all donors as placebo treated units
     Returns DataFrame with placebo gaps
@@ -99,33 +51,32 @@ def compute_placebo_gaps(df):
     
     # Get actual treatment
     print(f"\nActual treated unit: {TARGET_COUNTRY}")
-    actual_result = run_scm_return_gap(df, TARGET_COUNTRY, DONOR_POOL, VARIABLE,
-                                       START_DATE, INTERVENTION_DATE, END_DATE)
+    actual_result = panel.fit(TARGET_COUNTRY, DONOR_POOL, (START_DATE, INTERVENTION_DATE),
+                              (INTERVENTION_DATE, END_DATE))
     
     if actual_result is None:
         print("Failed to run actual SCM")
-        return None, None
+        return None, None, None, None
     
-    actual_gap = actual_result['gap']
+    actual_gap = fit_series(actual_result, 'gap')
     actual_rmspe = actual_result['rmspe_pre']
     
     print(f"Actual pre-RMSPE: {actual_rmspe:.4f}")
-    print(f"Actual post-treatment mean gap: {actual_gap[actual_gap.index >= INTERVENTION_DATE].mean():.4f}")
+    print(f"Actual post-treatment mean gap: {actual_result['ate']:.4f}")
     
     # Run placebo tests
     print(f"\nRunning placebo tests for {len(DONOR_POOL)} donors...")
     
-    for i, donor in enumerate(DONOR_POOL):
+    # Each donor treated from the remaining donors, all solved in one batch
+    placebo_results = panel.fit_batch([(donor, [d for d in DONOR_POOL if d != donor],
+                                        (START_DATE, INTERVENTION_DATE), (INTERVENTION_DATE, END_DATE))
+                                       for donor in DONOR_POOL])
+    
+    for i, (donor, placebo_result) in enumerate(zip(DONOR_POOL, placebo_results)):
         print(f"  [{i+1}/{len(DONOR_POOL)}] Placebo: {donor}")
         
-        # Create new donor pool excluding current placebo
-        new_donors = [d for d in DONOR_POOL if d != donor]
-        
-        placebo_result = run_scm_return_gap(df, donor, new_donors, VARIABLE,
-                                           START_DATE, INTERVENTION_DATE, END_DATE)
-        
         if placebo_result is not None:
-            placebo_gaps[donor] = placebo_result['gap']
+            placebo_gaps[donor] = fit_series(placebo_result, 'gap')
             placebo_rmspes[donor] = placebo_result['rmspe_pre']
             print(f"    Pre-RMSPE: {placebo_result['rmspe_pre']:.4f}")
         else:
@@ -275,11 +226,11 @@ def main():
         print(f"Data file not found: {DATA_PATH}")
         return
     
-    df = pd.read_csv(DATA_PATH)
-    df['date'] = pd.to_datetime(df['date'])
+    df = load_panel(DATA_PATH, columns=[VARIABLE])
+    panel = SCMPanel.from_long(df, VARIABLE)
     
     # Step 1: Compute placebo distribution
-    actual_gap, placebo_gaps, actual_rmspe, placebo_rmspes = compute_placebo_gaps(df)
+    actual_gap, placebo_gaps, actual_rmspe, placebo_rmspes = compute_placebo_gaps(panel)
     
     if actual_gap is None:
         print("Failed to compute placebo distribution")
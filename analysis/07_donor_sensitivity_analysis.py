@@ -12,11 +12,15 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
-from scipy.optimize import minimize
-from sklearn.metrics import mean_squared_error
+import argparse
 import warnings
 warnings.filterwarnings('ignore')
 
+import sys
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+from panel_store import load_panel
+from scm import SCMPanel, weight_dict, report_iterations
+
 # Config
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data.csv")
 FIGURES_DIR = os.path.join(PROJECT_ROOT, "paper", "figures")
@@ -32,64 +36,15 @@ START_DATE = '2019-01-01'
 END_DATE = '2023-12-01'
 VARIABLE = 'HICP_Total'
 
-def run_scm_basic(df, target, donors, variable, start_date, intervention_date, end_date):
-    """Run SCM and return key metrics"""
-    pivot = df.pivot(index='date', columns='geo', values=variable)
-    pivot = pivot.dropna()
-    
-    available_donors = [d for d in donors if d in pivot.columns]
-    if target not in pivot.columns or not available_donors:
-        return None
-    
-    mask_pre = (pivot.index >= start_date) & (pivot.index < intervention_date)
-    mask_full = (pivot.index >= start_date) & (pivot.index <= end_date)
-    
-    y_pre = pivot.loc[mask_pre, target]
-    X_pre = pivot.loc[mask_pre, available_donors]
-    
-    def loss(w):
-        return np.sum((y_pre - X_pre.dot(w))**2)
-    
-    def constraint_sum(w):
-        return np.sum(w) - 1.0
-    
-    n_donors = len(available_donors)
-    w0 = np.ones(n_donors) / n_donors
-    bounds = [(0, 1) for _ in range(n_donors)]
-    constraints = [{'type': 'eq', 'fun': constraint_sum}]
-    
-    result = minimize(loss, w0, bounds=bounds, constraints=constraints, method='SLSQP')
-    
-    if not result.success:
-        return None
-    
-    weights = result.x
-    weight_dict = dict(zip(available_donors, weights))
-    
-    X_full = pivot.loc[mask_full, available_donors]
-    synthetic_full = X_full.dot(weights)
-    gap = pivot.loc[mask_full, target] - synthetic_full
-    
-    gap_post = gap[gap.index >= intervention_date]
-    ate = gap_post.mean()
-    rmspe_pre = np.sqrt(mean_squared_error(y_pre, X_pre.dot(weights)))
-    
-    return {
-        'ate': ate,
-        'rmspe_pre': rmspe_pre,
-        'weights': weight_dict,
-        'donors_used': available_donors
-    }
-
-def run_sensitivity_analysis(df):
-    """Run Leave-One-Out analysis for each donor"""
+def run_sensitivity_analysis(panel, cold_reference=False):
+    """Run Leave-One-Out analysis for each donor (cold_reference: report warm-start savings)"""
     print(f"\n{'='*70}")
     print("DONOR SENSITIVITY ANALYSIS (Leave-One-Out)")
     print(f"{'='*70}")
     
     # 1. Baseline
-    baseline = run_scm_basic(df, TARGET_COUNTRY, DONOR_POOL, VARIABLE, 
-                            START_DATE, INTERVENTION_DATE, END_DATE)
+    pre_window, post_window = (START_DATE, INTERVENTION_DATE), (INTERVENTION_DATE, END_DATE)
+    baseline = panel.fit(TARGET_COUNTRY, DONOR_POOL, pre_window, post_window)
     
     if baseline is None:
         print("Baseline SCM failed")
@@ -98,7 +53,7 @@ def run_sensitivity_analysis(df):
     print(f"Baseline ATE: {baseline['ate']:.4f}")
     print(f"Baseline RMSPE: {baseline['rmspe_pre']:.4f}")
     print("Baseline Weights:")
-    for d, w in baseline['weights'].items():
+    for d, w in weight_dict(baseline).items():
         if w > 0.01:
             print(f"  {d}: {w:.4f}")
             
@@ -111,13 +66,10 @@ def run_sensitivity_analysis(df):
         'interpretation': 'Reference'
     })
     
-    # 2. Leave-One-Out
-    for donor in DONOR_POOL:
-        loo_donors = [d for d in DONOR_POOL if d != donor]
-        
-        res = run_scm_basic(df, TARGET_COUNTRY, loo_donors, VARIABLE,
-                           START_DATE, INTERVENTION_DATE, END_DATE)
-        
+    # 2. Leave-One-Out, each reduced pool warm-started from the baseline weights
+    loo_fits = panel.sweep([(TARGET_COUNTRY, [d for d in DONOR_POOL if d != donor], pre_window, post_window)
+                            for donor in DONOR_POOL], warm=baseline, cold_reference=cold_reference)
+    for donor, res in zip(DONOR_POOL, loo_fits):
         if res:
             change_pct = (res['ate'] - baseline['ate']) / abs(baseline['ate']) * 100
             
@@ -135,6 +87,8 @@ def run_sensitivity_analysis(df):
             
             print(f"Excluded {donor}: ATE={res['ate']:.4f}, RMSPE={res['rmspe_pre']:.4f}, Change={change_pct:.1f}%")
             
+    report_iterations(loo_fits)
+            
     # 3. Save Summary
     results_df = pd.DataFrame(results)
     output_file = os.path.join(RESULTS_DIR, "donor_loo_summary.csv")
@@ -189,15 +143,19 @@ def plot_sensitivity(df):
     plt.savefig(os.path.join(FIGURES_DIR, "donor_loo_comparison.png"), bbox_inches='tight', dpi=300)
     print(f"Plot saved: {os.path.join(FIGURES_DIR, 'donor_loo_comparison.png')}")
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Donor leave-one-out sensitivity')
+    parser.add_argument('--iteration-report', action='store_true',
+                        help='Also refit the leave-one-out pools cold to report solver iterations saved')
+    args = parser.parse_args(argv)
+    
     if not os.path.exists(DATA_PATH):
         print("Data file not found")
         return
         
-    df = pd.read_csv(DATA_PATH)
-    df['date'] = pd.to_datetime(df['date'])
+    df = load_panel(DATA_PATH, columns=[VARIABLE])
     
-    run_sensitivity_analysis(df)
+    run_sensitivity_analysis(SCMPanel.from_long(df, VARIABLE), args.iteration_report)
 
 if __name__ == "__main__":
     main()
@@ -14,6 +14,10 @@ import statsmodels.api as sm
 import os
 from scipy import stats
 
+import sys
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+from panel_store import load_panel
+
 # Config
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data.csv")
 FIGURES_DIR = os.path.join(PROJECT_ROOT, "paper", "figures")
@@ -160,8 +164,7 @@ def main():
         print("Data file not found")
         return
         
-    df = pd.read_csv(DATA_PATH)
-    df['date'] = pd.to_datetime(df['date'])
+    df = load_panel(DATA_PATH, columns=[VARIABLE])
     
     data = prepare_data(df, TARGET_COUNTRY, DONOR_POOL, VARIABLE, START_DATE, PRE_PERIOD_END)
     
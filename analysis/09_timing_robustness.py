@@ -12,11 +12,15 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os
-from scipy.optimize import minimize
-from sklearn.metrics import mean_squared_error
+import argparse
 import warnings
 warnings.filterwarnings('ignore')
 
+import sys
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+from panel_store import load_panel
+from scm import SCMPanel, report_iterations
+
 # Config
 DATA_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data.csv")
 FIGURES_DIR = os.path.join(PROJECT_ROOT, "paper", "figures")
@@ -39,73 +43,34 @@ DATES_TO_TEST = {
     '2022-07-01': 'Full Operation'
 }
 
-def run_scm_at_date(df, intervention_date):
-    """Run SCM with a specific intervention date"""
-    pivot = df.pivot(index='date', columns='geo', values=VARIABLE).dropna()
-    
-    available_donors = [d for d in DONOR_POOL if d in pivot.columns]
-    
-    mask_pre = (pivot.index >= START_DATE) & (pivot.index < intervention_date)
-    mask_full = (pivot.index >= START_DATE) & (pivot.index <= END_DATE)
-    
-    y_pre = pivot.loc[mask_pre, TARGET_COUNTRY]
-    X_pre = pivot.loc[mask_pre, available_donors]
-    
-    def loss(w):
-        return np.sum((y_pre - X_pre.dot(w))**2)
-    
-    def constraint_sum(w):
-        return np.sum(w) - 1.0
-    
-    n_donors = len(available_donors)
-    w0 = np.ones(n_donors) / n_donors
-    
-    result = minimize(loss, w0, bounds=[(0,1)]*n_donors, 
-                     constraints=[{'type':'eq', 'fun':constraint_sum}], method='SLSQP')
-    
-    if not result.success:
-        return None
-        
-    weights = result.x
-    X_full = pivot.loc[mask_full, available_donors]
-    synthetic = X_full.dot(weights)
-    gap = pivot.loc[mask_full, TARGET_COUNTRY] - synthetic
-    
-    # Calculate post-intervention effect relative to THIS date
-    gap_post = gap[gap.index >= intervention_date]
-    ate = gap_post.mean()
-    rmspe_pre = np.sqrt(mean_squared_error(y_pre, X_pre.dot(weights)))
-    
-    return {
-        'ate': ate,
-        'rmspe': rmspe_pre,
-        'gap': gap,
-        'weights': weights
-    }
-
-def run_timing_analysis(df):
-    """Test all dates"""
+def run_timing_analysis(panel, cold_reference=False):
+    """Test all dates (cold_reference: report warm-start savings)"""
     print(f"\n{'='*70}")
     print("TIMING ROBUSTNESS ANALYSIS")
     print(f"{'='*70}")
     
     results = []
+    # Post-intervention effect relative to each date; neighbouring dates
+    # warm-start one another
+    fits = panel.sweep([(TARGET_COUNTRY, DONOR_POOL, (START_DATE, date_str), (date_str, END_DATE))
+                        for date_str in DATES_TO_TEST], cold_reference=cold_reference)
     
-    for date_str, desc in DATES_TO_TEST.items():
+    for (date_str, desc), res in zip(DATES_TO_TEST.items(), fits):
         print(f"\nTesting Intervention Date: {date_str} ({desc})")
-        res = run_scm_at_date(df, date_str)
         
         if res:
-            print(f"  Pre-RMSPE: {res['rmspe']:.4f}")
+            print(f"  Pre-RMSPE: {res['rmspe_pre']:.4f}")
             print(f"  Estimated Effect (ATE): {res['ate']:.4f}")
             
             results.append({
                 'date': date_str,
                 'description': desc,
-                'rmspe': res['rmspe'],
+                'rmspe': res['rmspe_pre'],
                 'ate': res['ate']
             })
             
+    report_iterations(fits)
+    
     # Save results
     res_df = pd.DataFrame(results)
     output_file = os.path.join(RESULTS_DIR, "timing_robustness_summary.csv")
@@ -142,11 +107,14 @@ def plot_timing_robustness(df):
     plt.savefig(os.path.join(FIGURES_DIR, "timing_robustness.png"), dpi=300, bbox_inches='tight')
     print(f"Plot saved: {os.path.join(FIGURES_DIR, 'timing_robustness.png')}")
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Timing robustness of the SCM estimate')
+    parser.add_argument('--iteration-report', action='store_true',
+                        help='Also refit every date cold to report solver iterations saved')
+    args = parser.parse_args(argv)
     if not os.path.exists(DATA_PATH): return
-    df = pd.read_csv(DATA_PATH)
-    df['date'] = pd.to_datetime(df['date'])
-    run_timing_analysis(df)
+    df = load_panel(DATA_PATH, columns=[VARIABLE])
+    run_timing_analysis(SCMPanel.from_long(df, VARIABLE), args.iteration_report)
 
 if __name__ == "__main__":
     main()
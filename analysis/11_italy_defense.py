@@ -16,6 +16,10 @@ import seaborn as sns
 import statsmodels.api as sm
 import os
 
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+from panel_store import load_panel
+
 # Config
 DATA_PATH = "data/processed/merged_data.csv"
 FIGURES_DIR = "paper/figures"
@@ -72,8 +76,7 @@ def calculate_energy_sensitivity(df, country):
 
 def main():
     print(f"Loading data from {DATA_PATH}...")
-    df = pd.read_csv(DATA_PATH)
-    df['date'] = pd.to_datetime(df['date'])
+    df = load_panel(DATA_PATH, columns=['DL_Gas_EUR', 'CP0451', 'HICP_Energy', 'HICP_Total'])
     
     metrics = []
     
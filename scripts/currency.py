@@ -0,0 +1,64 @@
+"""
+Currency Conversion
+Each geo's currency in each month (euro changeovers included) and its
+exchange rate against the euro, looked up for a whole (month, geo) grid at
+once from a matrix of ECB reference rates (units of currency per EUR).
+"""
+
+import numpy as np
+from months import parse_periods
+from derived import apply
+
+EUR = 'EUR'
+
+# Current currency of non-euro geos (everything else, aggregates included, is EUR)
+GEO_CURRENCY = {
+    'PL': 'PLN', 'HU': 'HUF', 'CZ': 'CZK', 'RO': 'RON', 'SE': 'SEK', 'DK': 'DKK',
+    'CH': 'CHF', 'NO': 'NOK', 'IS': 'ISK', 'TR': 'TRY', 'UK': 'GBP',
+}
+
+# Euro changeovers: geo -> (legacy currency, first month in euro)
+EURO_CHANGEOVERS = {
+    'EL': ('GRD', '2001-01'), 'SI': ('SIT', '2007-01'), 'CY': ('CYP', '2008-01'),
+    'MT': ('MTL', '2008-01'), 'SK': ('SKK', '2009-01'), 'EE': ('EEK', '2011-01'),
+    'LV': ('LVL', '2014-01'), 'LT': ('LTL', '2015-01'), 'HR': ('HRK', '2023-01'),
+    'BG': ('BGN', '2026-01'),
+}
+
+# Every non-euro currency some geo uses (or used)
+CURRENCIES = sorted(set(GEO_CURRENCY.values()) | {legacy for legacy, _ in EURO_CHANGEOVERS.values()})
+
+def currency_index(months, geos, currencies):
+    """
+    (month, geo) matrix of positions into [EUR] + currencies (len + 1 for a
+    currency not in the list). Changeovers are applied with one comparison
+    of the month axis against each geo's first euro month (MISSING, which
+    nothing precedes, for geos without one).
+    """
+    lookup = {c: i for i, c in enumerate([EUR] + list(currencies))}
+    unknown = len(lookup)
+    current = np.array([lookup.get(GEO_CURRENCY.get(g, EUR), unknown) for g in geos], dtype=np.int64)
+    legacy = np.array([lookup.get(EURO_CHANGEOVERS.get(g, (EUR,))[0], unknown) for g in geos],
+                      dtype=np.int64)
+    changeover = parse_periods([EURO_CHANGEOVERS.get(g, (None, ''))[1] for g in geos])
+    before = np.asarray(months, dtype=np.int64)[:, None] < changeover.astype(np.int64)[None, :]
+    return np.where(before, legacy[None, :], current[None, :])
+
+def local_rates(months, geos, rates):
+    """
+    Units of local currency per EUR for every (month, geo), and a mask of
+    the cells whose currency is the euro. rates maps currency codes to
+    per-EUR rates on the months axis; missing currencies give NaN.
+    """
+    currencies = sorted(rates)
+    n = len(months)
+    table = np.column_stack([np.ones(n)] + [np.asarray(rates[c], dtype=np.float64) for c in currencies]
+                            + [np.full(n, np.nan)])
+    idx = currency_index(months, geos, currencies)
+    return np.take_along_axis(table, idx, axis=1), idx == 0
+
+def local_fx_shock(xr, is_euro):
+    """100 * log change of the local rate; zero wherever the currency is the euro"""
+    shock = apply('dlog', xr)
+    shock[is_euro] = 0.0
+    return shock
@@ -0,0 +1,96 @@
+"""
+Daily Series
+Daily (or weekly, or any irregular) observations held as an int32 day-ordinal
+array ("days since 1970-01-01") plus a float64 (n, k) value block, and
+reduced to the monthly calendar of months.py with grouped bincounts: monthly
+mean, end-of-month value and intra-month volatility of daily log changes,
+for every column in one vectorized pass.
+"""
+
+import numpy as np
+import pandas as pd
+from months import MONTH_DTYPE
+
+DAY_DTYPE = np.int32
+
+def read_daily_csv(path, date_col, value_cols, pivot=None):
+    """
+    Read a daily CSV into (days, values, names). value_cols maps source
+    columns to output names. For long files (one row per date and series,
+    like the ECB SDMX CSV) pivot names the series column and value_cols maps
+    its codes instead, e.g. pivot='CURRENCY', value_cols={'PLN': 'PLN_EUR'}
+    with the observations read from OBS_VALUE. Missing values ('.', '') are NaN.
+    """
+    if pivot is None:
+        df = pd.read_csv(path, usecols=[date_col] + list(value_cols), na_values=['.', ''])
+        df = df[[date_col] + list(value_cols)]
+    else:
+        df = pd.read_csv(path, usecols=[date_col, pivot, 'OBS_VALUE'], na_values=['.', ''])
+        df = df[df[pivot].isin(list(value_cols))]
+        df = df.pivot_table(index=date_col, columns=pivot, values='OBS_VALUE', aggfunc='last')
+        df = df.reindex(columns=list(value_cols)).reset_index()
+    days = pd.to_datetime(df[date_col], errors='coerce').to_numpy(dtype='datetime64[D]')
+    ok = ~np.isnat(days)
+    days = days[ok].astype(np.int64).astype(DAY_DTYPE)
+    values = df[list(value_cols)].to_numpy(dtype=np.float64)[ok]
+    order = np.argsort(days, kind='stable')
+    return days[order], values[order], list(value_cols.values())
+
+def day_months(days):
+    """Day ordinals -> month ordinals (months since 1970-01)"""
+    return np.asarray(days, dtype='datetime64[D]').astype('datetime64[M]').astype(np.int64).astype(MONTH_DTYPE)
+
+def monthly_reduce(days, values):
+    """
+    Monthly mean, end-of-month value and intra-month volatility (sample std
+    of 100 * daily log changes) of each column of a sorted daily block.
+    NaNs are skipped; a log change belongs to the month of its later
+    observation. Returns (months, {'mean': (m, k), 'eom': ..., 'vol': ...}).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    months = day_months(days).astype(np.int64)
+    if not len(months):
+        empty = np.empty((0, values.shape[1]))
+        return months.astype(MONTH_DTYPE), {'mean': empty, 'eom': empty, 'vol': empty}
+    m0 = months.min()
+    group = months - m0
+    n_groups = int(group.max()) + 1
+
+    k = values.shape[1]
+    valid = ~np.isnan(values)
+    # One bincount over (month, column) cells for all columns at once
+    cell = (group[:, None] * k + np.arange(k)).ravel()
+    counts = np.bincount(cell, weights=valid.ravel(), minlength=n_groups * k).reshape(n_groups, k)
+    sums = np.bincount(cell, weights=np.where(valid, values, 0.0).ravel(),
+                       minlength=n_groups * k).reshape(n_groups, k)
+    out = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out['mean'] = sums / counts
+
+    # End of month: the last valid observation in each group
+    out['eom'] = np.full((n_groups, k), np.nan)
+    # Volatility of daily log changes between consecutive valid observations
+    out['vol'] = np.full((n_groups, k), np.nan)
+    for j in range(k):
+        idx = np.flatnonzero(valid[:, j])
+        if not len(idx):
+            continue
+        g, v = group[idx], values[idx, j]
+        last = np.flatnonzero(np.append(g[1:] != g[:-1], True))
+        out['eom'][g[last], j] = v[last]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r = np.diff(np.log(v)) * 100
+        rg = g[1:]
+        ok = np.isfinite(r)
+        r, rg = r[ok], rg[ok]
+        n = np.bincount(rg, minlength=n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_r = np.bincount(rg, weights=r, minlength=n_groups) / n
+            ss = np.bincount(rg, weights=(r - mean_r[rg]) ** 2, minlength=n_groups)
+            out['vol'][:, j] = np.where(n > 1, np.sqrt(ss / (n - 1)), np.nan)
+
+    present = counts.sum(axis=1) > 0
+    months = (np.arange(n_groups) + m0)[present].astype(MONTH_DTYPE)
+    return months, {name: block[present] for name, block in out.items()}
@@ -0,0 +1,123 @@
+"""
+Derived Series
+Declarative transforms of panel variables (log, dlog, yoy, lag, diff, ratio,
+product), evaluated lazily on a PanelCube. An expression is a nested tuple
+built with the helpers below, e.g. lag(dlog('HICP_Total'), 1); a plain string
+names a cube variable. Each expression is computed at most once per cube,
+for every geo at once on the (date, geo) grid, and shared sub-expressions
+(the log inside several dlogs and lags) are reused.
+
+    derived = DerivedPanel(cube)
+    derived.frame(yoy('HICP_Total'))        # date x geo, like pivot + pct_change(12)
+    derived.series(dlog('f_GAS'), 'ES')     # one geo as a Series
+"""
+
+import numpy as np
+import pandas as pd
+
+# Expression builders
+
+def log(x):
+    return ('log', x)
+
+def diff(x, k=1):
+    """x_t - x_{t-k}"""
+    return ('diff', x, k)
+
+def dlog(x):
+    """Log change in percent: 100 * diff(log(x))"""
+    return ('dlog', x)
+
+def yoy(x, k=12):
+    """Percent change over k months: 100 * (x_t / x_{t-k} - 1)"""
+    return ('yoy', x, k)
+
+def lag(x, k=1):
+    """x_{t-k}; a negative k leads"""
+    return ('lag', x, k)
+
+def ratio(a, b):
+    return ('ratio', a, b)
+
+def product(a, b):
+    return ('product', a, b)
+
+# Array kernels (time on axis 0; any trailing axes)
+
+def shift(values, k):
+    """values shifted k steps along time, NaN-filled (pandas .shift(k))"""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(values.shape, np.nan)
+    if k == 0:
+        out[...] = values
+    elif 0 < k < len(values):
+        out[k:] = values[:-k]
+    elif -len(values) < k < 0:
+        out[:k] = values[-k:]
+    return out
+
+def _log(x):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log(x)
+
+def _div(a, b):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return a / b
+
+KERNELS = {
+    'log': _log,
+    'diff': lambda x, k: x - shift(x, k),
+    'dlog': lambda log_x: (log_x - shift(log_x, 1)) * 100,  # operand is log(x)
+    'yoy': lambda x, k: (_div(x, shift(x, k)) - 1) * 100,
+    'lag': lambda x, k: shift(x, k),
+    'ratio': lambda a, b: _div(a, b),
+    'product': lambda a, b: a * b,
+}
+
+def apply(expr_op, values, *args):
+    """One transform applied to a plain array or Series (e.g. a synthetic control)"""
+    if isinstance(values, pd.Series):
+        return pd.Series(apply(expr_op, values.to_numpy(dtype=np.float64), *args),
+                         index=values.index, name=values.name)
+    if expr_op == 'dlog':
+        values = _log(values)
+    return KERNELS[expr_op](np.asarray(values, dtype=np.float64), *args)
+
+class DerivedPanel:
+    def __init__(self, cube):
+        self.cube = cube
+        self._memo = {}
+
+    def values(self, expr):
+        """(date, geo) float64 array for an expression, memoized"""
+        if isinstance(expr, str):
+            return self.cube.data[self.cube._pos[expr]]
+        if expr not in self._memo:
+            op, *args = expr
+            if op == 'dlog':
+                operands = [self.values(log(args[0]))]
+            elif op in ('ratio', 'product'):
+                operands = [self.values(a) for a in args]
+            else:
+                operands = [self.values(args[0])] + list(args[1:])
+            self._memo[expr] = KERNELS[op](*operands)
+        return self._memo[expr]
+
+    def __getitem__(self, expr):
+        return self.values(expr)
+
+    def frame(self, expr, geos=None):
+        """date x geo DataFrame for an expression (cube.frame for derived series)"""
+        block = self.values(expr)
+        columns = self.cube.geos
+        if geos is not None:
+            keep = columns.isin(list(geos))
+            block, columns = block[:, keep], columns[keep]
+        return pd.DataFrame(block, index=self.cube.dates, columns=columns, copy=False)
+
+    def series(self, expr, geo):
+        return pd.Series(self.values(expr)[:, self.cube.geos.get_loc(geo)], index=self.cube.dates)
+
+    def rows(self, expr, df, time='date'):
+        """Expression values at each row of a long panel"""
+        return self.cube.rows(self.values(expr), df, time)
@@ -0,0 +1,433 @@
+"""
+Concurrent Data Fetcher
+Downloads every raw source used by process_data.py in one go: an asyncio
+scheduler with per-host concurrency limits drives blocking downloads on a
+shared, pooled requests.Session, streaming each response to disk.
+Downloads resume after interruption and are checked against
+data/CHECKSUMS.sha256 before they replace the local copy.
+
+Eurostat datasets are requested as SDMX key-filtered slices built from
+process_data.EUROSTAT_SLICES; --bulk downloads the whole datasets.
+
+Run `python scripts/fetch_async.py --mirror http://127.0.0.1:8000` to fetch
+from a local stand-in server instead, e.g. `python -m http.server 8000
+--directory <fixtures>` where <fixtures> holds files named like data/raw.
+"""
+# Get project root directory dynamically
+import os
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+import time
+import json
+import hashlib
+import asyncio
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from urllib.parse import urlsplit
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from process_data import load_checksums, EUROSTAT_SLICES, READER_FILTERS, EurostatStreamParser, ECB_FX_CURRENCIES
+from process_data import main as process_data_main
+
+# Config
+RAW_DIR = os.path.join(PROJECT_ROOT, "data", "raw")
+
+PER_HOST_LIMIT = 2       # simultaneous downloads per host
+MIN_CHUNK = 64 << 10     # adaptive read size bounds for streamed writes
+MAX_CHUNK = 8 << 20
+CHUNK_SECONDS = 0.25     # grow chunks while a read takes less than this
+TIMEOUT = (10, 300)      # (connect, read) seconds
+FETCH_META_NAME = ".fetch_meta.json"
+
+EUROSTAT_URL = "https://ec.europa.eu/eurostat/api/dissemination/sdmx/2.1/data/{path}?format=TSV&compressed=true"
+FRED_URL = "https://fred.stlouisfed.org/graph/fredgraph.csv?id={series}&cosd={start}"
+# ECB reference rates, daily, one row per day and currency
+ECB_FX_DAILY_URL = ("https://data-api.ecb.europa.eu/service/data/EXR/"
+                    f"D.{'+'.join(ECB_FX_CURRENCIES)}.EUR.SP00.A?format=csvdata&startPeriod=1999-01-01")
+BROWSER_HEADERS = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'}
+
+def sdmx_key(code, slices=EUROSTAT_SLICES):
+    """SDMX key filter for a dataset slice, e.g. M..CP00+NRG.PL+ES; None if no slice"""
+    if code not in slices:
+        return None
+    return '.'.join('+'.join(codes) for _, codes in slices[code])
+
+def eurostat_url(code, bulk=False):
+    """Filtered SDMX query for the slice process_data.py uses, or the whole dataset"""
+    key = None if bulk else sdmx_key(code)
+    return EUROSTAT_URL.format(path=code if key is None else f"{code}/{key}")
+
+def eurostat_source(code):
+    return {'name': code, 'url': eurostat_url(code), 'bulk_url': eurostat_url(code, bulk=True),
+            'filename': f'{code}.tsv.gz'}
+
+def yahoo_url(ticker, start="2015-01-01"):
+    period1 = int(pd.Timestamp(start).timestamp())
+    period2 = int(datetime.now().timestamp())
+    return (f"https://query1.finance.yahoo.com/v7/finance/download/{ticker}?period1={period1}"
+            f"&period2={period2}&interval=1mo&events=history&includeAdjustedClose=true")
+
+def fred_csv(path, resample=None):
+    """
+    Rewrite a fredgraph.csv download in the DATE,<series> layout that
+    pandas_datareader produced (which process_data.py reads), optionally
+    resampled to monthly means like fetch_data_upgrade.py / fetch_oil.py.
+    """
+    df = pd.read_csv(path, float_precision='round_trip')
+    date_col = 'observation_date' if 'observation_date' in df.columns else df.columns[0]
+    df['DATE'] = pd.to_datetime(df[date_col])
+    series = df.set_index('DATE')[df.columns[1]]
+    series = pd.to_numeric(series, errors='coerce')  # FRED marks gaps with '.'
+    if resample:
+        series = series.resample(resample).mean()
+    series.to_frame().to_csv(path)
+
+def looks_like_stooq(path):
+    with open(path, 'rb') as f:
+        head = f.read(256)
+    return b"Date" in head or b"Close" in head
+
+SOURCES = [
+    # Eurostat: only the slices in process_data.EUROSTAT_SLICES (whole dataset with --bulk)
+    eurostat_source('prc_hicp_midx'),
+    eurostat_source('sts_inpp_m'),
+    eurostat_source('sts_inpr_m'),
+    eurostat_source('ei_eteu27_2020_m'),
+    # ECB PLN/EUR, monthly average
+    {'name': 'ecb_pln_eur', 'url': "https://data-api.ecb.europa.eu/service/data/EXR/M.PLN.EUR.SP00.A?format=csvdata",
+     'filename': 'ecb_pln_eur.csv'},
+    # FRED series (see fetch_data_upgrade.py and fetch_oil.py)
+    {'name': 'PNGASEUUSDM', 'url': FRED_URL.format(series='PNGASEUUSDM', start='2015-01-01'),
+     'filename': 'gas_price_imf.csv', 'postprocess': fred_csv},
+    {'name': 'DEXUSEU', 'url': FRED_URL.format(series='DEXUSEU', start='2015-01-01'),
+     'filename': 'usd_eur_rate.csv', 'postprocess': partial(fred_csv, resample='ME')},
+    {'name': 'DCOILBRENTEU', 'url': FRED_URL.format(series='DCOILBRENTEU', start='2015-01-01'),
+     'filename': 'brent_oil_price_fred.csv', 'postprocess': partial(fred_csv, resample='ME')},
+    # Brent: Stooq and Yahoo, both often blocked
+    {'name': 'brent_stooq', 'url': "https://stooq.com/q/d/l/?s=cb.f&i=m", 'filename': 'brent_oil_price_stooq.csv',
+     'headers': BROWSER_HEADERS, 'validate': looks_like_stooq},
+    {'name': 'brent_yahoo', 'url': yahoo_url("BZ=F"), 'filename': 'brent_oil_price.csv', 'headers': BROWSER_HEADERS},
+    # Daily series (process_data.DAILY_SOURCES), reduced to monthly in process_data
+    {'name': 'ecb_fx_daily', 'url': ECB_FX_DAILY_URL, 'filename': 'ecb_fx_daily.csv'},
+    {'name': 'DCOILBRENTEU_daily', 'url': FRED_URL.format(series='DCOILBRENTEU', start='1987-05-20'),
+     'filename': 'brent_oil_daily.csv', 'postprocess': fred_csv},
+]
+
+def source_url(source, mirror=None, bulk=False):
+    """
+    The source's URL (its whole-dataset URL if bulk), or <mirror>/<filename>
+    when fetching from a stand-in server; the real URL then goes along in an
+    X-Source-URL header so the stub can check what would have been requested.
+    """
+    url = source['bulk_url'] if bulk and 'bulk_url' in source else source['url']
+    if mirror:
+        return f"{mirror.rstrip('/')}/{source['filename']}", url
+    return url, url
+
+def make_session(pool_size):
+    """One requests.Session whose connection pool is shared by every download"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _stream_to(raw, f, h, consumer=None):
+    """
+    Copy a response body to f, updating the SHA-256 as it goes. The read size
+    doubles while reads are fast and halves when they stall, so big files move
+    in MB-sized blocks without making slow links wait on huge reads.
+    """
+    chunk, n_bytes = MIN_CHUNK, 0
+    while True:
+        t0 = time.perf_counter()
+        block = raw.read(chunk)
+        if not block:
+            return n_bytes
+        f.write(block)
+        h.update(block)
+        if consumer is not None:
+            consumer.feed(block)
+        n_bytes += len(block)
+        elapsed = time.perf_counter() - t0
+        if elapsed < CHUNK_SECONDS / 2 and chunk < MAX_CHUNK:
+            chunk *= 2
+        elif elapsed > CHUNK_SECONDS and chunk > MIN_CHUNK:
+            chunk //= 2
+
+def _hash_file(path, h, consumer=None):
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(MAX_CHUNK), b''):
+            h.update(block)
+            if consumer is not None:
+                consumer.feed(block)
+    return h
+
+def _read_part_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _discard_part(part_path):
+    for p in (part_path, part_path + ".json"):
+        if os.path.exists(p):
+            os.remove(p)
+
+def load_fetch_meta(raw_dir=RAW_DIR):
+    """
+    Conditional-GET store (<raw_dir>/.fetch_meta.json): ETag/Last-Modified per
+    URL, SHA-256/size/mtime per saved file, and which files the last run changed.
+    """
+    meta = _read_part_meta(os.path.join(raw_dir, FETCH_META_NAME))
+    meta.setdefault('urls', {})
+    meta.setdefault('files', {})
+    return meta
+
+def save_fetch_meta(meta, raw_dir=RAW_DIR):
+    path = os.path.join(raw_dir, FETCH_META_NAME)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(meta, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def _local_copy_matches(path, record):
+    """True if the file on disk is still the one recorded in the fetch store"""
+    if not record or not os.path.exists(path):
+        return False
+    st = os.stat(path)
+    return record['size'] == st.st_size and record['mtime_ns'] == st.st_mtime_ns
+
+def download(session, source, url, raw_dir=RAW_DIR, expected_sha256=None, accept_new=False,
+             fetch_meta=None, consumer=None):
+    """
+    Stream one source to <raw_dir>/<filename>.part and move it into place
+    only once it is complete, valid and (when expected_sha256 is given, e.g.
+    from data/CHECKSUMS.sha256) matches the recorded digest.
+    Returns 'saved', 'unchanged' or 'failed'.
+
+    With a fetch_meta store the request is conditional (If-None-Match /
+    If-Modified-Since) as long as the local file is the one last fetched; a
+    304, or a body identical to the local file, leaves the file untouched.
+
+    An interrupted transfer leaves the .part file behind together with the
+    server's ETag/Last-Modified; the next call resumes it with an HTTP Range
+    request guarded by If-Range, so a changed upstream file restarts cleanly.
+    Sources with a postprocess step are small and always fetched whole.
+
+    A consumer (e.g. process_data.EurostatStreamParser) is fed every byte of
+    the file as it is written; finish(sha256) is called once the file is
+    saved, abort() otherwise.
+    """
+    status = _download(session, source, url, raw_dir, expected_sha256, accept_new, fetch_meta, consumer)
+    if consumer is not None and status != 'saved':
+        consumer.abort()
+    return status
+
+def _download(session, source, url, raw_dir, expected_sha256, accept_new, fetch_meta, consumer):
+    filename = source['filename']
+    path = os.path.join(raw_dir, filename)
+    part_path = path + ".part"
+    meta_path = part_path + ".json"
+    resumable = 'postprocess' not in source
+    headers = dict(source.get('headers') or {})
+    headers['Accept-Encoding'] = 'identity'  # byte ranges must refer to the file itself
+    
+    fetch_meta = {'urls': {}, 'files': {}} if fetch_meta is None else fetch_meta
+    local = fetch_meta['files'].get(filename)
+    local_ok = _local_copy_matches(path, local)
+    
+    offset = 0
+    part_meta = _read_part_meta(meta_path)
+    if resumable and os.path.exists(part_path) and part_meta.get('url') == url and part_meta.get('validator'):
+        offset = os.path.getsize(part_path)
+        headers['Range'] = f"bytes={offset}-"
+        headers['If-Range'] = part_meta['validator']
+    else:
+        cached = fetch_meta['urls'].get(url)
+        if cached and local_ok:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+    
+    start = time.perf_counter()
+    h = hashlib.sha256()
+    n_bytes = 0
+    try:
+        with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+            if response.status_code == 304 and not offset:
+                print(f"Unchanged upstream: {filename}")
+                return 'unchanged'
+            if offset and response.status_code == 416:
+                # Range starts at the end: the previous attempt got everything
+                _hash_file(part_path, h, consumer)
+                validators = part_meta
+            else:
+                response.raise_for_status()
+                if offset and response.status_code == 206:
+                    print(f"Resuming {filename} at {offset / 1e6:.1f} MB")
+                    _hash_file(part_path, h, consumer)
+                    mode = 'ab'
+                else:
+                    offset, mode = 0, 'wb'
+                etag = response.headers.get('ETag')
+                validators = {'etag': etag, 'last_modified': response.headers.get('Last-Modified')}
+                validator = etag if etag and not etag.startswith('W/') else validators['last_modified']
+                if resumable and validator:
+                    with open(meta_path, 'w') as f:
+                        json.dump(dict(validators, url=url, validator=validator), f)
+                with open(part_path, mode) as f:
+                    n_bytes = _stream_to(response.raw, f, h, consumer)
+    except Exception as e:
+        if resumable and os.path.exists(meta_path):
+            print(f"Failed to fetch {source['name']}: {e} (partial download kept for resume)")
+        else:
+            print(f"Failed to fetch {source['name']}: {e}")
+            _discard_part(part_path)
+        return 'failed'
+    
+    try:
+        if 'validate' in source and not source['validate'](part_path):
+            raise ValueError("unexpected content (likely blocked)")
+        if 'postprocess' in source:
+            source['postprocess'](part_path)
+            h = _hash_file(part_path, hashlib.sha256())
+    except Exception as e:
+        print(f"Failed to fetch {source['name']}: {e}")
+        _discard_part(part_path)
+        return 'failed'
+    
+    sha = h.hexdigest()
+    fetch_meta['urls'][url] = {'etag': validators.get('etag'), 'last_modified': validators.get('last_modified'),
+                               'filename': filename}
+    if local_ok and local['sha256'] == sha:
+        # Server ignored the conditional headers but sent the same bytes
+        _discard_part(part_path)
+        print(f"Unchanged content: {filename}")
+        return 'unchanged'
+    
+    if expected_sha256 and sha != expected_sha256:
+        if not accept_new:
+            print(f"Checksum mismatch for {filename}: got {sha[:12]}, "
+                  f"data/CHECKSUMS.sha256 has {expected_sha256[:12]}. Kept {part_path}; "
+                  f"re-run with --accept-new to take the new vintage.")
+            if not resumable:
+                _discard_part(part_path)
+            return 'failed'
+        print(f"Accepting new vintage of {filename} ({sha[:12]}); regenerate data/CHECKSUMS.sha256")
+    
+    os.replace(part_path, path)
+    _discard_part(part_path)
+    if consumer is not None:
+        consumer.finish(sha)
+    st = os.stat(path)
+    fetch_meta['files'][filename] = {'sha256': sha, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    print(f"Saved {path} ({(offset + n_bytes) / 1e6:.1f} MB, {n_bytes / 1e6:.1f} MB transferred "
+          f"in {time.perf_counter() - start:.1f}s, sha256 {sha[:12]})")
+    return 'saved'
+
+async def _fetch_all(sources, mirror, per_host, raw_dir, verify, accept_new, fetch_meta, bulk, pipeline):
+    # Limits are keyed on the real host even when fetching from a mirror, so a
+    # stand-in server sees the same schedule as the live endpoints would.
+    hosts = [urlsplit(s['url']).netloc for s in sources]
+    semaphores = {host: asyncio.Semaphore(per_host) for host in set(hosts)}
+    n_slots = max(1, min(len(sources), per_host * len(semaphores)))
+    loop = asyncio.get_running_loop()
+    session = make_session(n_slots)
+    executor = ThreadPoolExecutor(max_workers=n_slots)
+    checksums = load_checksums() if verify else {}
+
+    async def fetch_one(source, host):
+        async with semaphores[host]:
+            url, real_url = source_url(source, mirror, bulk)
+            if mirror:
+                source = dict(source, headers=dict(source.get('headers') or {}, **{'X-Source-URL': real_url}))
+            # CHECKSUMS.sha256 pins the Eurostat bulk files only: filtered slices
+            # are not the recorded dataset, and FRED/ECB/Yahoo change daily
+            expected = None
+            if bulk and 'bulk_url' in source:
+                expected = checksums.get(f"data/raw/{source['filename']}")
+            consumer = None
+            if pipeline and source['filename'] in READER_FILTERS:
+                consumer = EurostatStreamParser(source['filename'], **READER_FILTERS[source['filename']])
+            return await loop.run_in_executor(executor, download, session, source, url, raw_dir,
+                                              expected, accept_new, fetch_meta, consumer)
+
+    try:
+        results = await asyncio.gather(*(fetch_one(s, h) for s, h in zip(sources, hosts)))
+    finally:
+        executor.shutdown(wait=True)
+        session.close()
+    return {s['name']: status for s, status in zip(sources, results)}
+
+def fetch_all(sources=None, mirror=None, per_host=PER_HOST_LIMIT, raw_dir=RAW_DIR,
+              verify=True, accept_new=False, bulk=False, pipeline=False):
+    """
+    Download all sources concurrently (at most per_host at a time per host).
+    Eurostat sources fetch the process_data.py slice unless bulk is set.
+    With pipeline, Eurostat files are decoded while they stream in and the
+    result lands in process_data's parse cache.
+    With verify, Eurostat bulk files listed in data/CHECKSUMS.sha256 only
+    replace the local copy if their digest matches (or accept_new is set).
+    Returns {source name: 'saved' | 'unchanged' | 'failed'}; the files this
+    run replaced are recorded as last_run.changed in .fetch_meta.json.
+    """
+    sources = SOURCES if sources is None else sources
+    os.makedirs(raw_dir, exist_ok=True)
+    fetch_meta = load_fetch_meta(raw_dir)
+    results = asyncio.run(_fetch_all(sources, mirror, per_host, raw_dir, verify, accept_new, fetch_meta, bulk, pipeline))
+    fetch_meta['last_run'] = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'changed': sorted(s['filename'] for s in sources if results[s['name']] == 'saved'),
+        'failed': sorted(s['filename'] for s in sources if results[s['name']] == 'failed'),
+    }
+    save_fetch_meta(fetch_meta, raw_dir)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Download all raw data sources concurrently')
+    parser.add_argument('--mirror', help='Base URL of a local stand-in server serving files named like data/raw')
+    parser.add_argument('--per-host', type=int, default=PER_HOST_LIMIT, help='Concurrent downloads per host')
+    parser.add_argument('--only', help='Comma-separated source names to fetch')
+    parser.add_argument('--raw-dir', default=RAW_DIR, help='Output directory (default: data/raw)')
+    parser.add_argument('--no-verify', action='store_true', help='Skip the data/CHECKSUMS.sha256 comparison')
+    parser.add_argument('--accept-new', action='store_true',
+                        help='Replace local files even if they differ from data/CHECKSUMS.sha256')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Download whole Eurostat datasets instead of the slices process_data.py uses')
+    parser.add_argument('--list', action='store_true', help='Print the URLs that would be fetched and exit')
+    parser.add_argument('--process', action='store_true',
+                        help='Decode Eurostat files while they download, then run process_data.py')
+    args = parser.parse_args(argv)
+
+    sources = SOURCES
+    if args.only:
+        wanted = set(args.only.split(','))
+        sources = [s for s in SOURCES if s['name'] in wanted]
+    if args.list:
+        for source in sources:
+            print(f"{source['name']}: {source_url(source, bulk=args.bulk)[0]}")
+        return
+
+    print(f"Fetching {len(sources)} sources...")
+    start = time.perf_counter()
+    results = fetch_all(sources, mirror=args.mirror, per_host=args.per_host, raw_dir=args.raw_dir,
+                        verify=not args.no_verify, accept_new=args.accept_new, bulk=args.bulk,
+                        pipeline=args.process)
+    counts = Counter(results.values())
+    failed = [name for name, status in results.items() if status == 'failed']
+    print(f"Data collection complete in {time.perf_counter() - start:.1f}s "
+          f"({counts['saved']} saved, {counts['unchanged']} unchanged, {counts['failed']} failed"
+          f"{': ' + ', '.join(failed) if failed else ''})")
+    if not counts['saved']:
+        print("Nothing changed upstream; process_data.py will find every stage up to date.")
+    if args.process:
+        # Same process, so the stages pick up the frames decoded during the fetch
+        process_data_main(['--workers', '1'])
+
+if __name__ == "__main__":
+    main()
@@ -3,39 +3,41 @@
 import os
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 import os
-import requests
 import pandas as pd
-import io
 from datetime import datetime
+from fetch_async import download, make_session, load_fetch_meta, save_fetch_meta, eurostat_source
+from process_data import load_checksums
 
 # Setup directories
 RAW_DIR = os.path.join(PROJECT_ROOT, "data", "raw")
 os.makedirs(RAW_DIR, exist_ok=True)
 
-def fetch_eurostat_data(code, name):
+def _fetch(source, url, verify=False):
+    """
+    Download through fetch_async.download: conditional GET against
+    data/raw/.fetch_meta.json, resumable. verify=True checks the body against
+    data/CHECKSUMS.sha256 (Eurostat bulk files only; the other sources
+    publish a new vintage every day).
+    """
+    fetch_meta = load_fetch_meta(RAW_DIR)
+    expected = load_checksums().get(f"data/raw/{source['filename']}") if verify else None
+    with make_session(1) as session:
+        status = download(session, source, url, RAW_DIR, expected_sha256=expected, fetch_meta=fetch_meta)
+    save_fetch_meta(fetch_meta, RAW_DIR)
+    return status != 'failed'
+
+def fetch_eurostat_data(code, name, bulk=False):
     """
     Fetches data from Eurostat (TSV format) and saves it to data/raw.
-    Using the bulk download facility which is often more reliable for full datasets.
+    Requests only the slice process_data.py uses (SDMX key filter from
+    process_data.EUROSTAT_SLICES); bulk=True downloads the full dataset.
+    Interrupted downloads resume from data/raw/<code>.tsv.gz.part on the next run.
     """
     print(f"Fetching {name} ({code})...")
-    # Eurostat Bulk Download URL (TSV format)
     # The modern API endpoint that returns GZIP TSV
-    url = f"https://ec.europa.eu/eurostat/api/dissemination/sdmx/2.1/data/{code}?format=TSV&compressed=true"
-    
-    try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        
-        # Save compressed file
-        file_path = os.path.join(RAW_DIR, f"{code}.tsv.gz")
-        with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        print(f"Saved {file_path}")
-        return True
-    except Exception as e:
-        print(f"Failed to fetch {code}: {e}")
-        return False
+    source = eurostat_source(code)
+    url = source['bulk_url'] if bulk else source['url']
+    return _fetch(source, url, verify=url == source['bulk_url'])
 
 def fetch_yahoo_data(ticker, name, start="2015-01-01"):
     """
@@ -47,20 +49,10 @@ def fetch_yahoo_data(ticker, name, start="2015-01-01"):
     period2 = int(datetime.now().timestamp())
     url = f"https://query1.finance.yahoo.com/v7/finance/download/{ticker}?period1={period1}&period2={period2}&interval=1mo&events=history&includeAdjustedClose=true"
     
-    try:
-        # User-Agent is required for Yahoo
-        headers = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        file_path = os.path.join(RAW_DIR, f"{name.lower().replace(' ', '_')}.csv")
-        with open(file_path, 'wb') as f:
-            f.write(response.content)
-        print(f"Saved {file_path}")
-        return True
-    except Exception as e:
-        print(f"Failed to fetch {name}: {e}")
-        return False
+    # User-Agent is required for Yahoo
+    headers = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'}
+    filename = f"{name.lower().replace(' ', '_')}.csv"
+    return _fetch({'name': name, 'url': url, 'filename': filename, 'headers': headers}, url, verify=False)
 
 def fetch_ecb_data():
     """
@@ -69,19 +61,7 @@ def fetch_ecb_data():
     print("Fetching PLN/EUR Exchange Rate...")
     # EXR.M.PLN.EUR.SP00.A (Monthly, PLN to EUR, Spot, Average)
     url = "https://data-api.ecb.europa.eu/service/data/EXR/M.PLN.EUR.SP00.A?format=csvdata"
-    
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        file_path = os.path.join(RAW_DIR, "ecb_pln_eur.csv")
-        with open(file_path, 'wb') as f:
-            f.write(response.content)
-        print(f"Saved {file_path}")
-        return True
-    except Exception as e:
-        print(f"Failed to fetch ECB data: {e}")
-        return False
+    return _fetch({'name': 'ECB data', 'url': url, 'filename': "ecb_pln_eur.csv"}, url, verify=False)
 
 def main():
     print("Starting data collection...")
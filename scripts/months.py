@@ -0,0 +1,87 @@
+"""
+Monthly Calendar
+int32 month ordinals ("months since 1970-01") used as the time axis of the
+processing pipeline. Ordinal 0 is 1970-01, the same epoch as numpy's
+datetime64[M], so conversion back to Timestamps is a cast.
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+MONTH_DTYPE = np.int32
+MISSING = np.iinfo(MONTH_DTYPE).min
+
+# 2022M06, 2022-06, 2022-06-01, 202206
+_PERIOD_RE = re.compile(r'^\s*(\d{4})\s*[-M]?\s*(\d{1,2})')
+
+def _parse_one(label):
+    m = _PERIOD_RE.match(str(label))
+    if m is None:
+        return MISSING
+    year, month = int(m.group(1)), int(m.group(2))
+    if not 1 <= month <= 12:
+        return MISSING
+    return (year - 1970) * 12 + month - 1
+
+def parse_periods(labels):
+    """
+    Vectorized period parser: each distinct label is parsed once and the
+    result broadcast back, so cost scales with the number of periods rather
+    than the number of observations. Unparseable and missing labels map to
+    MISSING.
+    """
+    codes, uniques = pd.factorize(pd.Series(labels, dtype=object))
+    # Missing labels get code -1, i.e. the trailing MISSING entry
+    lut = np.array([_parse_one(u) for u in uniques] + [MISSING], dtype=MONTH_DTYPE)
+    return lut[codes]
+
+def from_dates(dates, roll_forward=False):
+    """
+    Timestamps -> month ordinals. With roll_forward=True a date that is not
+    the first of its month moves to the next month, which reproduces the
+    `date + pd.offsets.MonthBegin(0)` snapping used for FRED/Yahoo series.
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    months = (dates.year - 1970) * 12 + (dates.month - 1)
+    if roll_forward:
+        months = months + (dates.day != 1)
+    months = np.asarray(months, dtype=np.int64)
+    months[np.asarray(dates.isna())] = MISSING
+    return months.astype(MONTH_DTYPE)
+
+def to_timestamps(months):
+    """Month ordinals -> first-of-month Timestamps (output boundary only)"""
+    months = np.asarray(months, dtype=np.int64)
+    out = months.astype('datetime64[M]').astype('datetime64[ns]')
+    out[months == MISSING] = np.datetime64('NaT')
+    return pd.DatetimeIndex(out)
+
+def monthly_block(sources, dst_months):
+    """
+    Gathers several monthly series at dst_months into one (n, k) float64 block.
+    dst_months is turned into a single row -> offset map on the combined month
+    axis; each (src_months, values) source is scattered onto that axis and
+    read back through the map, so every extra series costs one column write.
+    """
+    dst_months = np.asarray(dst_months, dtype=np.int64)
+    sources = [(np.asarray(m, dtype=np.int64), np.asarray(v, dtype=np.float64))
+               for m, v in sources]
+    block = np.full((len(dst_months), len(sources)), np.nan)
+
+    valid_dst = dst_months != MISSING
+    spans = [m[m != MISSING] for m, _ in sources] + [dst_months[valid_dst]]
+    spans = [m for m in spans if len(m)]
+    if not spans or not valid_dst.any():
+        return block
+    lo = min(m.min() for m in spans)
+    hi = max(m.max() for m in spans)
+
+    offsets = dst_months[valid_dst] - lo
+    dense = np.empty(hi - lo + 1)
+    for j, (src_months, values) in enumerate(sources):
+        ok = src_months != MISSING
+        dense.fill(np.nan)
+        dense[src_months[ok] - lo] = values[ok]
+        block[valid_dst, j] = dense[offsets]
+    return block
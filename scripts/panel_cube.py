@@ -0,0 +1,147 @@
+"""
+Shared-Memory Panel Cube
+Dense float64 array of shape (variable, date, geo) with its label indexes,
+built once from the columnar panel store. A cube can be published into
+multiprocessing.shared_memory; pool workers attach to it without copying,
+so a sweep holds one copy of the panel however many workers it runs.
+
+    cube = PanelCube.load(DATA_PATH, ['HICP_Total'])
+    results = map_with_cube(job, specs, cube, workers=4)  # job(cube, spec)
+"""
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from panel_store import DATA_PATH, load_panel
+
+class PanelCube:
+    def __init__(self, data, variables, dates, geos, shm=None, owner=False):
+        self.data = data
+        self.variables = list(variables)
+        self.dates = pd.Index(dates, name='date')
+        self.geos = pd.Index(geos, name='geo')
+        self._pos = {v: i for i, v in enumerate(self.variables)}
+        self._shm = shm
+        self._owner = owner
+
+    @classmethod
+    def from_panel(cls, df, variables=None, time='date'):
+        """
+        Long (geo, time, ...) panel -> cube; one scatter per variable. time
+        names the period column ('date', or 'month' ordinals in process_data).
+        """
+        if variables is None:
+            variables = [c for c in df.columns if c not in ('geo', time)]
+        variables = [v for v in dict.fromkeys(variables) if v in df.columns]
+        date_codes, dates = pd.factorize(df[time], sort=True)
+        geo_codes, geos = pd.factorize(df['geo'], sort=True)
+        data = np.full((len(variables), len(dates), len(geos)), np.nan)
+        for i, var in enumerate(variables):
+            data[i, date_codes, geo_codes] = df[var].to_numpy(dtype=np.float64)
+        return cls(data, variables, dates, geos)
+
+    @classmethod
+    def load(cls, csv_path=DATA_PATH, variables=None):
+        """Cube of the requested variables (all if None) from the panel store"""
+        return cls.from_panel(load_panel(csv_path, columns=variables), variables)
+
+    def __contains__(self, variable):
+        return variable in self._pos
+
+    def frame(self, variable, geos=None):
+        """
+        date x geo DataFrame for one variable, the same table as
+        df.pivot(index='date', columns='geo', values=variable). Without geos
+        it is a view of the cube, not a copy.
+        """
+        block = self.data[self._pos[variable]]
+        columns = self.geos
+        if geos is not None:
+            keep = self.geos.isin(list(geos))
+            block, columns = block[:, keep], self.geos[keep]
+        return pd.DataFrame(block, index=self.dates, columns=columns, copy=False)
+
+    def rows(self, block, df, time='date'):
+        """Values of a (date, geo) block at each row of a long panel"""
+        t = self.dates.get_indexer(df[time])
+        g = self.geos.get_indexer(df['geo'])
+        out = block[t, g]
+        out[(t < 0) | (g < 0)] = np.nan
+        return out
+
+    # Shared memory
+
+    def share(self):
+        """Move the data into a new shared-memory block (owned by this cube)"""
+        if self._shm is None:
+            shm = shared_memory.SharedMemory(create=True, size=max(self.data.nbytes, 1))
+            shared = np.ndarray(self.data.shape, dtype=np.float64, buffer=shm.buf)
+            shared[...] = self.data
+            self.data, self._shm, self._owner = shared, shm, True
+        return self
+
+    @property
+    def handle(self):
+        """Picklable description that PanelCube.attach turns back into a cube"""
+        self.share()
+        return {'name': self._shm.name, 'shape': self.data.shape, 'variables': self.variables,
+                'dates': self.dates, 'geos': self.geos}
+
+    @classmethod
+    def attach(cls, handle):
+        """Zero-copy, read-only cube on a block published by another process"""
+        shm = shared_memory.SharedMemory(name=handle['name'])
+        data = np.ndarray(handle['shape'], dtype=np.float64, buffer=shm.buf)
+        data.flags.writeable = False
+        return cls(data, handle['variables'], handle['dates'], handle['geos'], shm=shm)
+
+    def close(self):
+        """Detach from shared memory; the owning cube also frees the block"""
+        if self._shm is None:
+            return
+        shm, owner = self._shm, self._owner
+        if owner:
+            self.data = np.array(self.data)  # keep a private copy usable
+        self._shm = None
+        try:
+            shm.close()
+        except BufferError:
+            pass  # frames still view the block; it is unmapped at exit
+        if owner:
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Pool workers attach once, in the initializer
+_WORKER_CUBE = None
+
+def _init_worker(handle):
+    global _WORKER_CUBE
+    _WORKER_CUBE = PanelCube.attach(handle)
+
+def _call(job, item):
+    return job(_WORKER_CUBE, item)
+
+def map_with_cube(job, items, cube, workers=1):
+    """
+    [job(cube, item) for item in items], in a process pool when workers > 1.
+    The cube is published once and every worker attaches to the same block;
+    job must be a module-level function.
+    """
+    items = list(items)
+    workers = max(1, min(workers, len(items)))
+    if workers == 1:
+        return [job(cube, item) for item in items]
+    was_shared = cube._shm is not None
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(cube.handle,)) as pool:
+            return list(pool.map(_call, [job] * len(items), items))
+    finally:
+        if not was_shared:
+            cube.close()
@@ -0,0 +1,197 @@
+"""
+Columnar Panel Store
+Typed, memory-mapped companion to data/processed/merged_data.csv
+
+Layout: one flat binary file holding a date block (int64 month ordinals,
+months since 1970-01), a geo block (int64 codes into the manifest's label
+list) and one float64 (or float32) block per numeric column (uint8 for the
+<col>_flag status columns), plus a JSON manifest with column offsets and a
+fingerprint of the CSV and raw inputs it was built from.
+"""
+
+import os
+import json
+import tempfile
+import numpy as np
+import pandas as pd
+from months import from_dates, to_timestamps
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(PROJECT_ROOT, "data", "raw")
+DATA_PATH = os.path.join(PROJECT_ROOT, "data", "processed", "merged_data.csv")
+
+STORE_VERSION = 1
+
+# Eurostat observation status flags, packed into the uint8 <col>_flag columns
+FLAG_BITS = {'p': 1, 'e': 2, 'b': 4, 'd': 8, 'c': 16, 'u': 32, 's': 64, 'r': 128}
+ALIGN = 8  # every block starts on an 8-byte boundary
+
+def store_paths(csv_path=DATA_PATH):
+    """Return (data file, manifest file) paths for the store next to a CSV"""
+    base = os.path.splitext(csv_path)[0]
+    return base + ".panel", base + ".panel.json"
+
+def source_fingerprint(csv_path=DATA_PATH, raw_dir=RAW_DIR):
+    """
+    Cheap (size, mtime) fingerprint of the CSV and every raw input file.
+    Any change to either invalidates the store. Dotfiles and in-progress
+    downloads (*.part) are not inputs.
+    """
+    paths = [csv_path]
+    if os.path.isdir(raw_dir):
+        paths += sorted(os.path.join(raw_dir, f) for f in os.listdir(raw_dir)
+                        if not f.startswith('.') and not f.endswith('.part'))
+    fingerprint = {}
+    for path in paths:
+        if os.path.isfile(path):
+            st = os.stat(path)
+            fingerprint[os.path.relpath(path, PROJECT_ROOT)] = [st.st_size, st.st_mtime_ns]
+    return fingerprint
+
+def to_month_ordinal(dates):
+    """Timestamps -> int64 months since 1970-01"""
+    return from_dates(dates).astype(np.int64)
+
+def from_month_ordinal(months):
+    """int64 months since 1970-01 -> first-of-month Timestamps"""
+    return to_timestamps(months)
+
+def _replace(tmp_path, path):
+    """os.replace for a mkstemp file, with the umask-derived mode a plain open() would give (mkstemp: 0600)"""
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_path, 0o666 & ~umask)
+    os.replace(tmp_path, path)
+
+def write_panel(df, csv_path=DATA_PATH, value_dtype=np.float64):
+    """
+    Write the columnar store for a long (geo, date, ...) panel.
+    Numeric columns are stored as value_dtype (float64, or float32 to halve
+    the size of wide panels), <col>_flag columns as uint8 FLAG_BITS codes;
+    other columns are skipped.
+    """
+    value_dtype = np.dtype(value_dtype)
+    data_path, manifest_path = store_paths(csv_path)
+    n_rows = len(df)
+
+    geo = pd.Categorical(df['geo'].astype(str))  # categories come out sorted
+    geo_labels = list(geo.categories)
+    geo_codes = geo.codes.astype(np.int64)
+    months = to_month_ordinal(df['date'])
+
+    value_cols = [c for c in df.columns
+                  if c not in ('geo', 'date') and pd.api.types.is_numeric_dtype(df[c])]
+
+    blocks = [('date', months), ('geo', geo_codes)]
+    blocks += [(c, df[c].fillna(0).to_numpy(dtype=np.uint8) if c.endswith('_flag')
+                else df[c].to_numpy(dtype=value_dtype)) for c in value_cols]
+
+    columns = {}
+    # Unique temporary names in the target directory, so concurrent builders
+    # never write the same file and os.replace stays atomic
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(data_path) or '.', suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        offset = 0
+        for name, arr in blocks:
+            columns[name] = {'offset': offset, 'dtype': arr.dtype.str}
+            f.write(np.ascontiguousarray(arr).tobytes())
+            offset += arr.nbytes
+            pad = -offset % ALIGN
+            f.write(b'\0' * pad)
+            offset += pad
+    _replace(tmp_path, data_path)
+
+    manifest = {
+        'version': STORE_VERSION,
+        'n_rows': n_rows,
+        'geo_labels': geo_labels,
+        'value_columns': value_cols,
+        'value_dtype': value_dtype.str,
+        'columns': columns,
+        'fingerprint': source_fingerprint(csv_path),
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(manifest_path) or '.', suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f)
+    _replace(tmp_path, manifest_path)
+    return manifest
+
+def read_manifest(csv_path=DATA_PATH):
+    """Return the store manifest if it is current, else None"""
+    data_path, manifest_path = store_paths(csv_path)
+    if not (os.path.exists(data_path) and os.path.exists(manifest_path)):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != STORE_VERSION:
+        return None
+    if manifest.get('fingerprint') != source_fingerprint(csv_path):
+        return None
+    return manifest
+
+def rebuild_store(csv_path=DATA_PATH, value_dtype=None):
+    """
+    (Re)write the store from the CSV alone. value_dtype defaults to that of
+    the store being replaced (float64 if there is none).
+    """
+    print(f"Building columnar panel store from {csv_path}...")
+    _, manifest_path = store_paths(csv_path)
+    if value_dtype is None:
+        value_dtype = np.float64
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                value_dtype = json.load(f).get('value_dtype', value_dtype)
+    df = pd.read_csv(csv_path)
+    df['date'] = pd.to_datetime(df['date'])
+    return write_panel(df, csv_path, value_dtype=value_dtype)
+
+def _warn_if_csv_stale(csv_path):
+    csv_mtime = os.stat(csv_path).st_mtime_ns
+    stale = [rel for rel, (_, mtime) in source_fingerprint(csv_path).items() if mtime > csv_mtime]
+    if stale:
+        print(f"Warning: {', '.join(stale)} newer than {os.path.basename(csv_path)}; "
+              f"re-run scripts/process_data.py to refresh the panel.")
+
+def open_column(name, manifest, csv_path=DATA_PATH):
+    """Memory-map a single column of the store (read-only, zero-copy)"""
+    data_path, _ = store_paths(csv_path)
+    spec = manifest['columns'][name]
+    return np.memmap(data_path, dtype=np.dtype(spec['dtype']), mode='r',
+                     offset=spec['offset'], shape=(manifest['n_rows'],))
+
+def load_panel(csv_path=DATA_PATH, columns=None):
+    """
+    Load the processed panel as a long DataFrame with geo, date and the
+    requested value columns (all of them if columns is None). Requested
+    columns that do not exist are skipped. The store is rebuilt from the CSV
+    whenever the CSV or any raw input has changed.
+    """
+    manifest = read_manifest(csv_path)
+    if manifest is None:
+        _warn_if_csv_stale(csv_path)
+        manifest = rebuild_store(csv_path)
+
+    if columns is None:
+        columns = manifest['value_columns']
+    columns = [c for c in dict.fromkeys(columns) if c in manifest['columns'] and c not in ('geo', 'date')]
+
+    geo_labels = np.array(manifest['geo_labels'], dtype=object)
+    data = {
+        'geo': geo_labels[open_column('geo', manifest, csv_path)],
+        'date': from_month_ordinal(open_column('date', manifest, csv_path)),
+    }
+    for col in columns:
+        data[col] = np.array(open_column(col, manifest, csv_path))
+    return pd.DataFrame(data)
+
+def flag_mask(df, variable, flags='pe'):
+    """
+    Boolean mask of rows whose `variable` observation carries any of the given
+    Eurostat flags (default: provisional or estimated). All False if the panel
+    has no `<variable>_flag` column.
+    """
+    col = f'{variable}_flag'
+    if col not in df.columns:
+        return pd.Series(False, index=df.index)
+    bits = sum(FLAG_BITS[ch] for ch in flags)
+    return (df[col].fillna(0).astype(np.int64) & bits) != 0
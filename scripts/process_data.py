@@ -6,21 +6,215 @@ import pandas as pd
 import os
 import io
 import gzip
+import zlib
+import queue
+import threading
+import shutil
+import json
+import hashlib
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+from panel_store import write_panel, read_manifest, rebuild_store, FLAG_BITS
+from panel_cube import PanelCube
+from derived import DerivedPanel, ratio, log, dlog
+from daily import read_daily_csv, monthly_reduce
+from currency import CURRENCIES, local_rates, local_fx_shock
+from months import MISSING, parse_periods, from_dates, to_timestamps, monthly_block
 
 # Config
 RAW_DIR = os.path.join(PROJECT_ROOT, "data", "raw")
 PROCESSED_DIR = os.path.join(PROJECT_ROOT, "data", "processed")
+CACHE_DIR = os.path.join(PROCESSED_DIR, "cache")
+CHECKSUMS_PATH = os.path.join(PROJECT_ROOT, "data", "CHECKSUMS.sha256")
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 
 # Countries: Main Interest + Donors for SCM
 # ES, PL (Main)
 # Donor Pool for Spain: DE (Germany), FR (France), IT (Italy), AT (Austria), PT (Portugal - maybe check), NL (Netherlands)
 COUNTRIES = ['PL', 'ES', 'DE', 'FR', 'IT', 'AT', 'PT', 'NL']
+EA_GEOS = ['EA20', 'EA19']
+# countries=ALL_GEOS keeps every geo present in the Eurostat files
+ALL_GEOS = 'all'
 
-def read_eurostat_tsv(filename):
+# Candidate codes pushed down into the STS reader; the process_* functions
+# still pick the preferred one among them.
+IP_S_ADJ = ['SCA', 'SWDA']
+IP_NACE = ['B-D', 'C']
+# Extra HICP series whose Eurostat status flags are kept as <col>_flag columns
+FLAGGED_COICOPS = ['CP0451']
+
+# process_ip and process_ea_ip share one slice of sts_inpr_m so it is parsed once
+STS_GEOS = COUNTRIES + EA_GEOS
+
+# Reader filters per Eurostat file. Every process_* stage reading a file uses
+# the same filters, so one decode serves them all and the fetch pipeline can
+# parse a file while it downloads (see EurostatStreamParser).
+READER_FILTERS = {
+    "prc_hicp_midx.tsv.gz": {'geo': COUNTRIES},
+    "sts_inpp_m.tsv.gz": {'geo': COUNTRIES},
+    "sts_inpr_m.tsv.gz": {'geo': STS_GEOS, 's_adj': IP_S_ADJ, 'nace_r2': IP_NACE},
+}
+
+# Named HICP series (process_hicp renames these COICOP columns)
+HICP_SERIES = {
+    'CP00': 'HICP_Total',
+    'TOT_X_NRG_FOOD': 'HICP_Core', # Alternative code
+    'CP00_X_NRG_FOOD': 'HICP_Core',
+    'NRG': 'HICP_Energy'
+}
+# PPI: B-E (Industry total) preferred, else B-D
+PPI_NACE = ['B-E', 'B-D']
+
+# Slice of each Eurostat dataset the processors need, as (dimension, codes)
+# in the dataset's SDMX key order (time excluded; [] = unconstrained).
+# scripts/fetch_async.py requests only these slices unless run with --bulk.
+EUROSTAT_SLICES = {
+    'prc_hicp_midx': [('freq', ['M']), ('unit', []),
+                      ('coicop', list(HICP_SERIES) + FLAGGED_COICOPS), ('geo', COUNTRIES)],
+    'sts_inpr_m': [('freq', ['M']), ('indic_bt', []), ('nace_r2', IP_NACE), ('s_adj', IP_S_ADJ),
+                   ('unit', []), ('geo', STS_GEOS)],
+    'sts_inpp_m': [('freq', ['M']), ('indic_bt', []), ('nace_r2', PPI_NACE), ('s_adj', []),
+                   ('unit', []), ('geo', COUNTRIES)],
+}
+
+# Daily sources, reduced to monthly mean (f_<name>_AVG), end-of-month value
+# (f_<name>_EOM) and intra-month volatility of daily log changes (f_<name>_VOL)
+# by scripts/daily.py. The ECB file is long (one row per day and currency);
+# it carries every currency in scripts/currency.py plus USD.
+ECB_FX_CURRENCIES = CURRENCIES + ['USD']
+DAILY_SOURCES = {
+    "brent_oil_daily.csv": {'date': 'DATE', 'columns': {'DCOILBRENTEU': 'OIL'}},
+    "ecb_fx_daily.csv": {'date': 'TIME_PERIOD', 'pivot': 'CURRENCY',
+                         'columns': {c: f'{c}_EUR' for c in ECB_FX_CURRENCIES}},
+}
+
+# Parse-once cache for raw Eurostat files, keyed on the file's SHA-256
+# (the same digests recorded in data/CHECKSUMS.sha256) and the reader filters.
+PARSE_CACHE_VERSION = 3
+CACHE_STATS = {'hits': 0, 'misses': 0, 'store': 0, 'decodes': Counter()}
+_PARSED = {}
+_SHA256_MEMO = {}
+
+# Geo-partitioned columnar copies of the Eurostat files (build_raw_store)
+RAW_STORE_DIR = os.path.join(PROCESSED_DIR, "raw_store")
+RAW_STORE_VERSION = 2
+
+# Incremental rebuild: which raw files (by SHA-256) produced each stage's
+# output, so only stages whose inputs changed are recomputed.
+STAGE_MANIFEST_PATH = os.path.join(PROCESSED_DIR, "stage_manifest.json")
+STAGE_CACHE_VERSION = 1
+
+# Panel modes: the baseline 8-country panel, or every geo in the Eurostat
+# files (EU27 plus aggregates and EFTA; needs the --bulk downloads) for
+# donor-pool work. Each mode has its own output and stage cache.
+PANEL_MODES = {
+    'baseline': {'countries': COUNTRIES, 'output': "merged_data.csv", 'stage_prefix': "stage"},
+    'universe': {'countries': ALL_GEOS, 'output': "merged_data_universe.csv", 'stage_prefix': "stage-universe"},
+}
+# Written by scripts/fetch_async.py: digests of the files it saved and which
+# files its last run changed
+FETCH_META_PATH = os.path.join(RAW_DIR, ".fetch_meta.json")
+
+def _compile_filters(id_vars, filters):
     """
-    Reads a Eurostat TSV file (possibly gzipped) and returns a clean DataFrame.
+    Turns keyword filters ({'geo': ['ES', 'PL'], 'unit': 'I15', ...}) into
+    (key position, allowed values) pairs for the dimensions present in the file.
+    Filters on dimensions the dataset does not have are ignored.
+    """
+    compiled = []
+    for dim, allowed in filters.items():
+        if allowed is None or dim not in id_vars:
+            continue
+        if isinstance(allowed, str):
+            allowed = [allowed]
+        compiled.append((id_vars.index(dim), frozenset(allowed)))
+    return compiled
+
+def decode_eurostat_cells(text):
+    """
+    Decodes newline-separated Eurostat cells ("101.3 p", ": ", ": c", "99.8")
+    in a single pass of the C CSV parser. Returns a float64 value array (NaN for
+    ':') and a uint8 array of FLAG_BITS status codes.
+    """
+    cells = pd.read_csv(io.StringIO(text), sep=' ', header=None, names=['value', 'flag', 'extra'],
+                        index_col=False, dtype={'flag': str, 'extra': str}, na_values=[':'],
+                        keep_default_na=False, skipinitialspace=True, skip_blank_lines=False)
+    
+    values = cells['value']
+    flags = cells['flag'].fillna('')
+    if not pd.api.types.is_float_dtype(values):
+        # Non-standard cells (e.g. "12.3p"): split number and flag letters,
+        # only for the cells the plain numeric conversion rejects
+        numeric = pd.to_numeric(values, errors='coerce')
+        bad = numeric.isna() & values.notna()
+        if bad.any():
+            parts = values[bad].astype(str).str.extract(r'^\s*([-+]?\d*\.?\d+|:)\s*([a-z]*)')
+            numeric = numeric.astype(np.float64)
+            numeric[bad] = pd.to_numeric(parts[0], errors='coerce')
+            flags[bad] = flags[bad] + parts[1].fillna('')
+        values = numeric
+    
+    codes, labels = pd.factorize(flags)
+    lut = np.array([sum(FLAG_BITS[ch] for ch in set(label) if ch in FLAG_BITS) for label in labels],
+                   dtype=np.uint8)
+    return values.to_numpy(dtype=np.float64), lut[codes]
+
+def parse_eurostat_lines(lines, **filters):
+    """
+    Core of parse_eurostat_tsv: consumes an iterable of text lines (header
+    first) and returns the long frame. Each row's key prefix is checked
+    against the filters before its value columns are touched.
+    """
+    lines = iter(lines)
+    header = next(lines).rstrip('\r\n').split('\t')
+    id_vars = header[0].split('\\')[0].split(',')
+    periods = [c.strip() for c in header[1:]]
+    n_periods = len(periods)
+    wanted = _compile_filters(id_vars, filters)
+    
+    keys = []
+    rows = []
+    for line in lines:
+        key, _, rest = line.partition('\t')
+        parts = key.strip().split(',')
+        if not rest or any(parts[i] not in allowed for i, allowed in wanted):
+            continue
+        rest = rest.rstrip('\r\n')
+        if rest.count('\t') + 1 != n_periods:
+            values = (rest.split('\t') + [':'] * n_periods)[:n_periods]
+            rest = '\t'.join(values)
+        keys.append(parts)
+        rows.append(rest)
+    
+    if not keys:
+        return pd.DataFrame(columns=id_vars + ['time', 'value', 'flag'])
+    
+    n_rows = len(keys)
+    values, flags = decode_eurostat_cells('\n'.join(rows).replace('\t', '\n'))
+    key_arr = np.array(keys, dtype=object)
+    return _long_frame({var: key_arr[:, i] for i, var in enumerate(id_vars)}, periods,
+                       values.reshape(n_rows, n_periods), flags.reshape(n_rows, n_periods))
+
+def _long_frame(key_columns, periods, values, flags):
+    """Wide (row x period) blocks -> long format, period-major like DataFrame.melt"""
+    n_rows, n_periods = values.shape
+    melted = pd.DataFrame({var: np.tile(col, n_periods) for var, col in key_columns.items()})
+    melted['time'] = np.repeat(np.array(periods, dtype=object), n_rows)
+    melted['value'] = values.T.ravel()
+    melted['flag'] = flags.T.ravel()
+    return melted
+
+def parse_eurostat_tsv(filename, **filters):
+    """
+    Streams a Eurostat TSV file (possibly gzipped) and returns a clean long DataFrame.
+
+    Keyword filters restrict key dimensions, e.g. geo=COUNTRIES, unit='I15',
+    coicop=[...], nace_r2=[...], s_adj=[...]. The file is decompressed line by
+    line and each row's `unit,coicop,geo` key prefix is checked before its value
+    columns are split, so memory and time scale with the rows kept rather than
+    with the EU-wide file.
     """
     filepath = os.path.join(RAW_DIR, filename)
     if not os.path.exists(filepath):
@@ -30,42 +224,416 @@ def read_eurostat_tsv(filename):
     print(f"Processing {filepath}...")
     
     try:
-        if filename.endswith('.gz'):
-            with gzip.open(filepath, 'rt', encoding='utf-8') as f:
-                content = f.read()
-        else:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-        
-        df = pd.read_csv(io.StringIO(content), sep='\t')
-        
-        first_col = df.columns[0]
-        id_vars = first_col.split('\\')[0].split(',')
-        
-        df[first_col] = df[first_col].str.strip()
-        split_cols = df[first_col].str.split(',', expand=True)
-        
-        for i, var in enumerate(id_vars):
-            df[var] = split_cols[i]
-            
-        df = df.drop(columns=[first_col])
-        date_cols = [c for c in df.columns if c not in id_vars]
-        
-        melted = df.melt(id_vars=id_vars, value_vars=date_cols, var_name='time', value_name='value')
-        
-        melted['value'] = melted['value'].astype(str).str.strip()
-        melted['value'] = melted['value'].replace(':', np.nan)
-        melted['value'] = melted['value'].str.extract(r'([-+]?\d*\.?\d+)')[0]
-        melted['value'] = pd.to_numeric(melted['value'], errors='coerce')
-        melted['time'] = melted['time'].str.strip()
-        
-        return melted
+        opener = gzip.open if filename.endswith('.gz') else open
+        with opener(filepath, 'rt', encoding='utf-8') as f:
+            return parse_eurostat_lines(f, **filters)
     except Exception as e:
         print(f"Error reading {filename}: {e}")
         return pd.DataFrame()
 
-def process_hicp():
-    df = read_eurostat_tsv("prc_hicp_midx.tsv.gz")
+class EurostatStreamParser:
+    """
+    Parses a Eurostat .tsv.gz while it downloads: feed() takes compressed
+    bytes as they arrive, inflates them incrementally and hands complete
+    lines to parse_eurostat_lines on a background thread. finish(sha256)
+    waits for the parse and stores the result in the parse cache under the
+    file's digest, so the process_* stages later find it already decoded.
+    """
+    def __init__(self, filename, **filters):
+        self.filename = filename
+        self.filters = filters
+        self._inflate = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        self._tail = b''
+        self._batches = queue.Queue(maxsize=64)
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def _lines(self):
+        while True:
+            batch = self._batches.get()
+            if batch is None:
+                return
+            for line in batch:
+                yield line.decode('utf-8')
+    
+    def _run(self):
+        try:
+            self._result = parse_eurostat_lines(self._lines(), **self.filters)
+        except Exception as e:
+            self._error = e
+            for _ in self._lines():  # drain so feed() never blocks
+                pass
+    
+    def feed(self, block):
+        if self._error is not None:
+            return
+        try:
+            data = self._inflate.decompress(block)
+            while self._inflate.eof and self._inflate.unused_data:
+                # next gzip member
+                rest = self._inflate.unused_data
+                self._inflate = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                data += self._inflate.decompress(rest)
+        except zlib.error as e:
+            # Not gzip after all: the download goes on, the stages parse it later
+            self._error = e
+            return
+        data = self._tail + data
+        *lines, self._tail = data.split(b'\n')
+        if lines:
+            self._batches.put(lines)
+    
+    def abort(self):
+        self._batches.put(None)
+        self._thread.join()
+    
+    def finish(self, sha256):
+        data = b'' if self._error is not None else self._tail + self._inflate.flush()
+        if data:
+            self._batches.put([data])
+        self._batches.put(None)
+        self._thread.join()
+        if self._error is not None:
+            print(f"Streaming parse of {self.filename} failed: {self._error}")
+            return None
+        cache_parsed(self.filename, sha256, self.filters, self._result)
+        print(f"Decoded {self.filename} while downloading ({len(self._result)} rows)")
+        return self._result
+
+def raw_store_path(filename, sha):
+    stem = filename.split('.')[0]
+    return os.path.join(RAW_STORE_DIR, f"{stem}-{sha[:16]}")
+
+def build_raw_store(filename, batch_rows=20000):
+    """
+    One-time conversion of a Eurostat TSV into a columnar store partitioned
+    by geo: data/processed/raw_store/<dataset>-<sha>/geo=<GEO>.npz, each
+    holding dictionary-encoded key columns (unit, coicop, nace_r2, ...), the
+    row x period value and flag blocks, and each row's position in the file.
+    Rows are decoded in batches, so memory holds numbers, not file text.
+    """
+    filepath = os.path.join(RAW_DIR, filename)
+    sha = file_sha256(filepath)
+    store_dir = raw_store_path(filename, sha)
+    if os.path.exists(os.path.join(store_dir, "manifest.json")):
+        return store_dir
+    
+    print(f"Building geo-partitioned store for {filename}...")
+    opener = gzip.open if filename.endswith('.gz') else open
+    parts = {}  # geo -> {'line': [...], 'keys': [...], 'values': [...], 'flags': [...]}
+    
+    def flush(lines, keys, rows):
+        values, flags = decode_eurostat_cells('\n'.join(rows).replace('\t', '\n'))
+        values = values.reshape(len(rows), n_periods)
+        flags = flags.reshape(len(rows), n_periods)
+        geos = np.array([k[geo_pos] for k in keys], dtype=object)
+        for geo in pd.unique(geos):
+            idx = np.flatnonzero(geos == geo)
+            part = parts.setdefault(geo, {'line': [], 'keys': [], 'values': [], 'flags': []})
+            part['line'].append(np.asarray(lines, dtype=np.int64)[idx])
+            part['keys'].extend(keys[i] for i in idx)
+            part['values'].append(values[idx])
+            part['flags'].append(flags[idx])
+    
+    with opener(filepath, 'rt', encoding='utf-8') as f:
+        header = f.readline().rstrip('\r\n').split('\t')
+        id_vars = header[0].split('\\')[0].split(',')
+        periods = [c.strip() for c in header[1:]]
+        n_periods = len(periods)
+        geo_pos = id_vars.index('geo')
+        lines, keys, rows = [], [], []
+        for i, line in enumerate(f):
+            key, _, rest = line.partition('\t')
+            if not rest:
+                continue
+            rest = rest.rstrip('\r\n')
+            if rest.count('\t') + 1 != n_periods:
+                rest = '\t'.join((rest.split('\t') + [':'] * n_periods)[:n_periods])
+            lines.append(i)
+            keys.append(key.strip().split(','))
+            rows.append(rest)
+            if len(rows) >= batch_rows:
+                flush(lines, keys, rows)
+                lines, keys, rows = [], [], []
+        if rows:
+            flush(lines, keys, rows)
+    
+    tmp_dir = store_dir + ".tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    for geo, part in parts.items():
+        arrays = {'line': np.concatenate(part['line']),
+                  'values': np.concatenate(part['values']),
+                  'flags': np.concatenate(part['flags'])}
+        key_arr = np.array(part['keys'], dtype=object)
+        for j, var in enumerate(id_vars):
+            if var == 'geo':
+                continue
+            codes, labels = pd.factorize(key_arr[:, j])
+            arrays[f'{var}.codes'] = codes.astype(np.int32)
+            arrays[f'{var}.labels'] = np.asarray(labels, dtype=str)
+        np.savez(os.path.join(tmp_dir, f"geo={geo}.npz"), **arrays)
+    manifest = {'version': RAW_STORE_VERSION, 'id_vars': id_vars, 'periods': periods,
+                'geos': {geo: int(sum(len(l) for l in part['line'])) for geo, part in parts.items()}}
+    with open(os.path.join(tmp_dir, "manifest.json"), 'w') as f:
+        json.dump(manifest, f)
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+    os.replace(tmp_dir, store_dir)
+    print(f"Stored {len(parts)} geo partitions in {store_dir}")
+    return store_dir
+
+def read_raw_store(filename, sha, **filters):
+    """
+    Long frame for the given filters read from the geo-partitioned store, or
+    None if no store exists for this version of the file. Only the requested
+    geos' partitions are opened; other filters are applied on the codes.
+    """
+    store_dir = raw_store_path(filename, sha)
+    manifest_path = os.path.join(store_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != RAW_STORE_VERSION:
+        return None
+    id_vars, periods = manifest['id_vars'], manifest['periods']
+    
+    geos = filters.get('geo')
+    geos = list(manifest['geos']) if geos is None else ([geos] if isinstance(geos, str) else list(geos))
+    blocks = []
+    for geo in dict.fromkeys(geos):
+        path = os.path.join(store_dir, f"geo={geo}.npz")
+        if geo not in manifest['geos'] or not os.path.exists(path):
+            continue
+        with np.load(path, allow_pickle=False) as z:
+            keep = np.ones(len(z['line']), dtype=bool)
+            for dim, allowed in filters.items():
+                if allowed is None or dim == 'geo' or dim not in id_vars:
+                    continue
+                allowed = [allowed] if isinstance(allowed, str) else allowed
+                keep &= np.isin(z[f'{dim}.codes'], np.flatnonzero(np.isin(z[f'{dim}.labels'], list(allowed))))
+            block = {'line': z['line'][keep], 'values': z['values'][keep], 'flags': z['flags'][keep]}
+            for var in id_vars:
+                if var == 'geo':
+                    block[var] = np.full(keep.sum(), geo, dtype=object)
+                else:
+                    block[var] = z[f'{var}.labels'].astype(object)[z[f'{var}.codes'][keep]]
+        blocks.append(block)
+    
+    if not blocks or not sum(len(b['line']) for b in blocks):
+        return pd.DataFrame(columns=id_vars + ['time', 'value', 'flag'])
+    # File order across partitions, as the TSV parser would return it
+    order = np.argsort(np.concatenate([b['line'] for b in blocks]), kind='stable')
+    key_columns = {var: np.concatenate([b[var] for b in blocks])[order] for var in id_vars}
+    values = np.concatenate([b['values'] for b in blocks])[order]
+    flags = np.concatenate([b['flags'] for b in blocks])[order]
+    return _long_frame(key_columns, periods, values, flags)
+
+def file_sha256(filepath):
+    """SHA-256 of a file, memoised on (path, size, mtime) for the current run"""
+    st = os.stat(filepath)
+    memo_key = (os.path.abspath(filepath), st.st_size, st.st_mtime_ns)
+    if memo_key not in _SHA256_MEMO:
+        h = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        _SHA256_MEMO[memo_key] = h.hexdigest()
+    return _SHA256_MEMO[memo_key]
+
+def load_checksums(path=CHECKSUMS_PATH):
+    """Reads data/CHECKSUMS.sha256 into {relative path: sha256}"""
+    checksums = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    checksums[parts[1]] = parts[0]
+    return checksums
+
+def _filters_key(filters):
+    normalized = {dim: sorted([v] if isinstance(v, str) else v)
+                  for dim, v in filters.items() if v is not None}
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()[:12]
+
+def frame_to_arrays(df):
+    """
+    Long frame -> dict of plain numpy arrays: numeric columns as-is, others
+    dictionary-encoded as <col>.codes (int32) + <col>.labels. Used for the
+    .npz caches and for shipping stage results back from worker processes.
+    """
+    arrays = {'__version__': np.array(PARSE_CACHE_VERSION),
+              '__columns__': np.array(list(df.columns), dtype=str)}
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            arrays[col] = df[col].to_numpy()
+        else:
+            codes, labels = pd.factorize(df[col])
+            arrays[f'{col}.codes'] = codes.astype(np.int32)
+            arrays[f'{col}.labels'] = np.asarray(labels, dtype=str)
+    return arrays
+
+def arrays_to_frame(arrays):
+    """Inverse of frame_to_arrays; None if written by another cache version"""
+    if int(arrays['__version__']) != PARSE_CACHE_VERSION:
+        return None
+    data = {}
+    for col in arrays['__columns__']:
+        if col in arrays:
+            data[col] = arrays[col]
+        else:
+            data[col] = arrays[f'{col}.labels'].astype(object)[arrays[f'{col}.codes']]
+    return pd.DataFrame(data)
+
+def _save_long_frame(path, df):
+    """Stores a long Eurostat frame as dictionary-encoded arrays in an .npz"""
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, **frame_to_arrays(df))
+    os.replace(tmp_path, path)
+
+def _load_long_frame(path):
+    with np.load(path, allow_pickle=False) as z:
+        return arrays_to_frame({name: z[name] for name in z.files})
+
+def read_eurostat_tsv(filename, **filters):
+    """
+    Cached front end to parse_eurostat_tsv.
+
+    Parsed long frames are kept in memory for the run and on disk under
+    data/processed/cache, keyed on the raw file's SHA-256 and the filters, so
+    a file is decoded at most once per content version. CACHE_STATS counts
+    hits, misses and per-file decodes.
+    """
+    filepath = os.path.join(RAW_DIR, filename)
+    if not os.path.exists(filepath):
+        return parse_eurostat_tsv(filename, **filters)
+    
+    sha = file_sha256(filepath)
+    recorded = load_checksums().get(f"data/raw/{filename}")
+    if recorded is not None and recorded != sha:
+        print(f"Note: {filename} differs from its data/CHECKSUMS.sha256 entry (new data vintage?)")
+    
+    key = (sha, _filters_key(filters))
+    if key in _PARSED:
+        CACHE_STATS['hits'] += 1
+        return _PARSED[key].copy()
+    
+    cache_path = _parse_cache_path(filename, sha, filters)
+    df = None
+    if os.path.exists(cache_path):
+        try:
+            df = _load_long_frame(cache_path)
+        except Exception as e:
+            print(f"Ignoring unreadable cache entry {cache_path}: {e}")
+    
+    if df is not None:
+        CACHE_STATS['hits'] += 1
+        print(f"Parse cache hit for {filename} ({sha[:12]})")
+        _PARSED[key] = df
+    elif (df := read_raw_store(filename, sha, **filters)) is not None:
+        CACHE_STATS['store'] += 1
+        _PARSED[key] = df
+    else:
+        CACHE_STATS['misses'] += 1
+        df = parse_eurostat_tsv(filename, **filters)
+        if df.empty:
+            return df
+        CACHE_STATS['decodes'][filename] += 1
+        cache_parsed(filename, sha, filters, df)
+    return df.copy()
+
+def _parse_cache_path(filename, sha, filters):
+    stem = filename.split('.')[0]
+    return os.path.join(CACHE_DIR, f"{stem}-{sha[:16]}-{_filters_key(filters)}.npz")
+
+def cache_parsed(filename, sha, filters, df):
+    """Store a parsed long frame in the memory and disk parse caches"""
+    if df is None or df.empty:
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    _save_long_frame(_parse_cache_path(filename, sha, filters), df)
+    _PARSED[(sha, _filters_key(filters))] = df
+
+def align_panel(frames, how='outer'):
+    """
+    Join (geo, month) frames without hashing: each row gets the integer key
+    geo_code * span + (month - first_month), the output grid is the sorted
+    union of keys (or the first frame's keys for how='left'), and every
+    frame's columns are scattered into it by position. geo comes back
+    categorical, so an all-EU panel holds one small code per row. Integer
+    columns (the uint8 FLAG_BITS codes) keep their dtype and are 0 where a
+    frame has no row.
+    """
+    frames = [f for f in frames if f is not None]
+    geos = sorted(set().union(*(f['geo'].unique() for f in frames)))
+    m0 = min(int(f['month'].min()) for f in frames)
+    span = max(int(f['month'].max()) for f in frames) - m0 + 1
+
+    def keys(f):
+        codes = pd.Categorical(f['geo'], categories=geos).codes.astype(np.int64)
+        return codes * span + (f['month'].to_numpy(dtype=np.int64) - m0)
+
+    frame_keys = [keys(f) for f in frames]
+    grid = np.unique(frame_keys[0] if how == 'left' else np.concatenate(frame_keys))
+
+    out = {'geo': pd.Categorical.from_codes(grid // span, categories=geos),
+           'month': (grid % span + m0).astype(np.int32)}
+    for f, k in zip(frames, frame_keys):
+        pos = np.searchsorted(grid, k)
+        found = (pos < len(grid)) & (grid[np.minimum(pos, len(grid) - 1)] == k)
+        for col in f.columns.drop(['geo', 'month']):
+            column = f[col].to_numpy()
+            if np.issubdtype(column.dtype, np.integer):
+                values = np.zeros(len(grid), dtype=column.dtype)
+            else:
+                values = np.full(len(grid), np.nan)
+                column = column.astype(np.float64)
+            values[pos[found]] = column[found]
+            out[col] = values
+    return pd.DataFrame(out)
+
+def attach_external(panel, externals):
+    """
+    Attach country-invariant monthly series to the (geo, month) panel.
+    All series are gathered into one preallocated block on the panel's month
+    axis and appended in a single concat instead of one merge per series.
+    """
+    names, sources = [], []
+    for ext in externals:
+        if ext is None:
+            continue
+        for col in ext.columns.drop('month'):
+            names.append(col)
+            sources.append((ext['month'], ext[col]))
+    if not names:
+        return panel
+    block = monthly_block(sources, panel['month'])
+    return pd.concat([panel, pd.DataFrame(block, columns=names, index=panel.index)], axis=1)
+
+def reader_filters(filename, countries=None):
+    """
+    READER_FILTERS for filename with the geo filter widened/narrowed to
+    countries (the euro-area aggregates stay in for sts_inpr_m). Reads of
+    countries outside COUNTRIES go to the geo-partitioned store when built.
+    countries=ALL_GEOS drops the geo filter.
+    """
+    filters = dict(READER_FILTERS[filename])
+    if countries == ALL_GEOS:
+        filters['geo'] = None
+    elif countries is not None:
+        countries = list(countries)
+        filters['geo'] = countries + EA_GEOS if filename == "sts_inpr_m.tsv.gz" else countries
+    return filters
+
+def _keep_geos(df, countries):
+    return df if countries == ALL_GEOS else df[df['geo'].isin(countries)]
+
+def process_hicp(countries=None):
+    countries = COUNTRIES if countries is None else countries
+    df = read_eurostat_tsv("prc_hicp_midx.tsv.gz", **reader_filters("prc_hicp_midx.tsv.gz", countries))
     if df.empty: return None
 
     # DEBUG: Print unique values
@@ -73,7 +641,7 @@ def process_hicp():
     print("HICP Unique Units:", df['unit'].unique())
     print("HICP Unique Coicops (head):", df['coicop'].unique()[:10])
 
-    df = df[df['geo'].isin(COUNTRIES)]
+    df = _keep_geos(df, countries)
     print(f"HICP Rows after Country Filter: {len(df)}")
     print("Available Units for PL/ES:", df['unit'].unique())
 
@@ -97,32 +665,30 @@ def process_hicp():
     # Core: CP00_X... might check full list
     # Let's map whatever starts with CP00... or just keep common ones.
     
-    target_coicops = {
-        'CP00': 'HICP_Total',
-        'TOT_X_NRG_FOOD': 'HICP_Core', # Alternative code
-        'CP00_X_NRG_FOOD': 'HICP_Core',
-        'NRG': 'HICP_Energy'
-    }
+    target_coicops = HICP_SERIES
     
-    # Flexible date parsing
-    # Eurostat TSV might be YYYY-MM or YYYYMmm
-    df['time_str'] = df['time'].str.replace('M', '-', regex=False)
+    # Eurostat TSV might be YYYY-MM or YYYYMmm; both parse to month ordinals
     print(f"Time sample: {df['time'].head().tolist()}")
-    df['date'] = pd.to_datetime(df['time_str'], errors='coerce')
-    print(f"Date nulls: {df['date'].isna().sum()} / {len(df)}")
-    if df['date'].isna().all():
-         print("Date parsing failed with REPLACE 'M'. Trying default.")
-         df['date'] = pd.to_datetime(df['time'], errors='coerce')
-         print(f"Date nulls after retry: {df['date'].isna().sum()}")
-
-    pivot = df.pivot_table(index=['geo', 'date'], columns='coicop', values='value').reset_index()
+    df['month'] = parse_periods(df['time'])
+    print(f"Period nulls: {(df['month'] == MISSING).sum()} / {len(df)}")
+    df = df[df['month'] != MISSING]
+
+    pivot = df.pivot_table(index=['geo', 'month'], columns='coicop', values='value').reset_index()
     pivot = pivot.rename(columns=target_coicops)
+    
+    # Eurostat status flags (provisional, estimated, ...) for the headline series
+    flagged = df[df['coicop'].isin(list(target_coicops) + FLAGGED_COICOPS)]
+    flags = flagged.pivot_table(index=['geo', 'month'], columns='coicop', values='flag', aggfunc='max')
+    flags = flags.fillna(0).astype(np.uint8)  # no observation -> no status bits
+    flags = flags.rename(columns=target_coicops).add_suffix('_flag').reset_index()
+    pivot = align_panel([pivot, flags], how='left')
     return pivot
 
-def process_ppi():
-    df = read_eurostat_tsv("sts_inpp_m.tsv.gz")
+def process_ppi(countries=None):
+    countries = COUNTRIES if countries is None else countries
+    df = read_eurostat_tsv("sts_inpp_m.tsv.gz", **reader_filters("sts_inpp_m.tsv.gz", countries))
     if df.empty: return None
-    df = df[df['geo'].isin(COUNTRIES)]
+    df = _keep_geos(df, countries)
     
     # Filter NACE
     # Try B-E or B-D or MIG_ING
@@ -135,20 +701,18 @@ def process_ppi():
         elif df['nace_r2'].str.contains('B-D').any():
             df = df[df['nace_r2'].isin(['B-D'])]
         
-    # Flexible date parsing
-    df['time_str'] = df['time'].str.replace('M', '-', regex=False)
-    df['date'] = pd.to_datetime(df['time_str'], errors='coerce')
-    if df['date'].isna().all():
-         df['date'] = pd.to_datetime(df['time'], errors='coerce')
+    df['month'] = parse_periods(df['time'])
+    df = df[df['month'] != MISSING]
 
-    pivot = df.pivot_table(index=['geo', 'date'], values='value').reset_index()
+    pivot = df.pivot_table(index=['geo', 'month'], values='value').reset_index()
     pivot = pivot.rename(columns={'value': 'PPI_Total'})
     return pivot
 
-def process_ip():
-    df = read_eurostat_tsv("sts_inpr_m.tsv.gz")
+def process_ip(countries=None):
+    countries = COUNTRIES if countries is None else countries
+    df = read_eurostat_tsv("sts_inpr_m.tsv.gz", **reader_filters("sts_inpr_m.tsv.gz", countries))
     if df.empty: return None
-    df = df[df['geo'].isin(COUNTRIES)]
+    df = _keep_geos(df, countries)
     
     # Filter S_ADJ
     if 's_adj' in df.columns:
@@ -165,13 +729,10 @@ def process_ip():
          elif df['nace_r2'].str.contains('C').any(): # Manufacturing
              df = df[df['nace_r2'] == 'C']
          
-    # Flexible date parsing
-    df['time_str'] = df['time'].str.replace('M', '-', regex=False)
-    df['date'] = pd.to_datetime(df['time_str'], errors='coerce')
-    if df['date'].isna().all():
-         df['date'] = pd.to_datetime(df['time'], errors='coerce')
+    df['month'] = parse_periods(df['time'])
+    df = df[df['month'] != MISSING]
 
-    pivot = df.pivot_table(index=['geo', 'date'], values='value').reset_index()
+    pivot = df.pivot_table(index=['geo', 'month'], values='value').reset_index()
     pivot = pivot.rename(columns={'value': 'IP_Total'})
     return pivot
 
@@ -182,9 +743,8 @@ def process_oil():
         try:
             df = pd.read_csv(path)
             # Stooq: Date, Open, High, Low, Close, Volume
-            df['date'] = pd.to_datetime(df['Date'])
-            df = df[['date', 'Close']].rename(columns={'Close': 'f_OIL'})
-            df['date'] = df['date'] + pd.offsets.MonthBegin(0)
+            df['month'] = from_dates(df['Date'], roll_forward=True)
+            df = df[['month', 'Close']].rename(columns={'Close': 'f_OIL'})
             return df
         except:
             pass
@@ -194,18 +754,16 @@ def process_oil():
     if os.path.exists(path) and os.path.getsize(path) > 0:
         df = pd.read_csv(path)
         # FRED: DATE, DCOILBRENTEU
-        df['date'] = pd.to_datetime(df['DATE'])
-        df = df[['date', 'DCOILBRENTEU']].rename(columns={'DCOILBRENTEU': 'f_OIL'})
-        df['date'] = df['date'] + pd.offsets.MonthBegin(0)
+        df['month'] = from_dates(df['DATE'], roll_forward=True)
+        df = df[['month', 'DCOILBRENTEU']].rename(columns={'DCOILBRENTEU': 'f_OIL'})
         return df
 
     # Fallback to Yahoo
     path = os.path.join(RAW_DIR, "brent_oil_price.csv")
     if os.path.exists(path):
         df = pd.read_csv(path)
-        df['date'] = pd.to_datetime(df['Date'])
-        df = df[['date', 'Adj Close']].rename(columns={'Adj Close': 'f_OIL'})
-        df['date'] = df['date'] + pd.offsets.MonthBegin(0)
+        df['month'] = from_dates(df['Date'], roll_forward=True)
+        df = df[['month', 'Adj Close']].rename(columns={'Adj Close': 'f_OIL'})
         return df
         
     return None
@@ -218,8 +776,8 @@ def process_ecb():
     df = pd.read_csv(path)
     # Check columns
     if 'TIME_PERIOD' in df.columns and 'OBS_VALUE' in df.columns:
-        df['date'] = pd.to_datetime(df['TIME_PERIOD'])
-        df = df[['date', 'OBS_VALUE']].rename(columns={'OBS_VALUE': 'f_PLN_EUR'})
+        df['month'] = parse_periods(df['TIME_PERIOD'])
+        df = df[['month', 'OBS_VALUE']].rename(columns={'OBS_VALUE': 'f_PLN_EUR'})
         # Since this is PLN/EUR, it applies to Poland.
         # Spain currency is EUR (rate=1 or irrelevant for exchange rate shock relative to non-euro?)
         # We might want USD/EUR for Spain?
@@ -233,9 +791,8 @@ def process_gas():
     if os.path.exists(path):
         df = pd.read_csv(path)
         # FRED: DATE, PNGASEUUSDM
-        df['date'] = pd.to_datetime(df['DATE'])
-        df = df[['date', 'PNGASEUUSDM']].rename(columns={'PNGASEUUSDM': 'f_GAS'})
-        df['date'] = df['date'] + pd.offsets.MonthBegin(0)
+        df['month'] = from_dates(df['DATE'], roll_forward=True)
+        df = df[['month', 'PNGASEUUSDM']].rename(columns={'PNGASEUUSDM': 'f_GAS'})
         return df
     return None
 
@@ -245,20 +802,19 @@ def process_usd_eur():
     if os.path.exists(path):
         df = pd.read_csv(path)
         # FRED: DATE, DEXUSEU
-        df['date'] = pd.to_datetime(df['DATE'])
-        df = df[['date', 'DEXUSEU']].rename(columns={'DEXUSEU': 'f_USD_EUR'})
-        df['date'] = df['date'] + pd.offsets.MonthBegin(0)
+        df['month'] = from_dates(df['DATE'], roll_forward=True)
+        df = df[['month', 'DEXUSEU']].rename(columns={'DEXUSEU': 'f_USD_EUR'})
         return df
     return None
 
-def process_ea_ip():
+def process_ea_ip(countries=None):
     # Eurostat sts_inpr_m (already fetched)
-    # Extract EA20 
-    df = read_eurostat_tsv("sts_inpr_m.tsv.gz")
+    # Extract EA20 (from the same read as process_ip)
+    df = read_eurostat_tsv("sts_inpr_m.tsv.gz", **reader_filters("sts_inpr_m.tsv.gz", countries))
     if df.empty: return None
     
     # Filter for EA20 (Euro Area) and S_ADJ=SCA/SWDA, NACE=B-D
-    df = df[df['geo'].isin(['EA20', 'EA19'])] # Try both
+    df = df[df['geo'].isin(EA_GEOS)] # Try both
     
     if 's_adj' in df.columns:
         if df['s_adj'].str.contains('SCA').any():
@@ -270,43 +826,283 @@ def process_ea_ip():
          if df['nace_r2'].str.contains('B-D').any():
              df = df[df['nace_r2'].isin(['B-D'])]
     
-    # Flexible date parsing
-    df['time_str'] = df['time'].str.replace('M', '-', regex=False)
-    df['date'] = pd.to_datetime(df['time_str'], errors='coerce')
-    if df['date'].isna().all():
-         df['date'] = pd.to_datetime(df['time'], errors='coerce')
-         
-    pivot = df.pivot_table(index=['date'], values='value').reset_index()
+    df['month'] = parse_periods(df['time'])
+    df = df[df['month'] != MISSING]
+
     # Average if multiple Geos (EA19 vs EA20 overlaps)
-    pivot = pivot.groupby('date')['value'].mean().reset_index()
+    pivot = df.groupby('month')['value'].mean().reset_index()
     pivot = pivot.rename(columns={'value': 'EA_IP_Total'})
     return pivot
 
-def main():
+def process_daily(filename):
+    """Monthly mean / end-of-month / volatility columns from a DAILY_SOURCES file"""
+    path = os.path.join(RAW_DIR, filename)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    spec = DAILY_SOURCES[filename]
+    days, values, names = read_daily_csv(path, spec['date'], spec['columns'], spec.get('pivot'))
+    months, stats = monthly_reduce(days, values)
+    if not len(months):
+        return None
+    out = {'month': months}
+    observed = ~np.isnan(stats['mean']).all(axis=0)  # series absent from the file add no columns
+    for stat, suffix in (('mean', 'AVG'), ('eom', 'EOM'), ('vol', 'VOL')):
+        for j, name in enumerate(names):
+            if observed[j]:
+                out[f'f_{name}_{suffix}'] = stats[stat][:, j]
+    return pd.DataFrame(out)
+
+def process_oil_daily():
+    return process_daily("brent_oil_daily.csv")
+
+def process_fx_daily():
+    return process_daily("ecb_fx_daily.csv")
+
+def exchange_rates(externals, months):
+    """
+    Units of each currency in CURRENCIES per EUR at months, from the external
+    stage outputs: the monthly ECB series (f_<CUR>_EUR) where it has a value,
+    else the monthly mean of the daily reference rates (f_<CUR>_EUR_AVG).
+    """
+    columns = {}
+    for ext in externals:
+        if ext is not None:
+            for col in ext.columns.drop('month'):
+                columns[col] = (ext['month'], ext[col])
+    rates = {}
+    for cur in CURRENCIES:
+        names = [n for n in (f'f_{cur}_EUR', f'f_{cur}_EUR_AVG') if n in columns]
+        if not names:
+            continue
+        block = monthly_block([columns[n] for n in names], months)
+        rate = block[:, 0]
+        for j in range(1, len(names)):
+            rate = np.where(np.isnan(rate), block[:, j], rate)
+        rates[cur] = rate
+    return rates
+
+# Processing stages and the raw files each one reads, in panel order.
+# 'panel' stages are (geo, month) frames, 'external' stages are month series.
+STAGES = {
+    'hicp': {'func': process_hicp, 'kind': 'panel', 'inputs': ["prc_hicp_midx.tsv.gz"]},
+    'ip': {'func': process_ip, 'kind': 'panel', 'inputs': ["sts_inpr_m.tsv.gz"]},
+    'oil': {'func': process_oil, 'kind': 'external',
+            'inputs': ["brent_oil_price_stooq.csv", "brent_oil_price_fred.csv", "brent_oil_price.csv"]},
+    'ecb': {'func': process_ecb, 'kind': 'external', 'inputs': ["ecb_pln_eur.csv"]},  # PLN/EUR
+    'gas': {'func': process_gas, 'kind': 'external', 'inputs': ["gas_price_imf.csv"]},
+    'usd_eur': {'func': process_usd_eur, 'kind': 'external', 'inputs': ["usd_eur_rate.csv"]},
+    'ea_ip': {'func': process_ea_ip, 'kind': 'external', 'inputs': ["sts_inpr_m.tsv.gz"]},
+    'oil_daily': {'func': process_oil_daily, 'kind': 'external', 'inputs': ["brent_oil_daily.csv"]},
+    'fx_daily': {'func': process_fx_daily, 'kind': 'external', 'inputs': ["ecb_fx_daily.csv"]},
+}
+
+# Code the stages run; editing any of it invalidates every cached stage
+STAGE_SOURCES = ["process_data.py", "daily.py", "months.py", "currency.py"]
+
+def _stage_code_key():
+    h = hashlib.sha256()
+    for name in STAGE_SOURCES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:12]
+
+def _stage_config_key(countries=COUNTRIES):
+    return _filters_key({'countries': countries, 'ea_geos': EA_GEOS, 'ip_s_adj': IP_S_ADJ,
+                         'ip_nace': IP_NACE, 'flagged': FLAGGED_COICOPS,
+                         'hicp_series': [f"{code}={col}" for code, col in HICP_SERIES.items()],
+                         'code': _stage_code_key()})
+
+def _run_stage(name, countries=None):
+    """Eurostat stages take the panel's country set; the others take no arguments"""
+    stage = STAGES[name]
+    if any(f in READER_FILTERS for f in stage['inputs']):
+        return stage['func'](countries=countries)
+    return stage['func']()
+
+def load_stage_manifest(path=STAGE_MANIFEST_PATH):
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get('version') == STAGE_CACHE_VERSION:
+            return manifest
+    return {'version': STAGE_CACHE_VERSION, 'stages': {}, 'inputs': {}}
+
+def load_fetch_meta(path=FETCH_META_PATH):
+    """The downloader's record of what it saved (see scripts/fetch_async.py), or {}"""
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except ValueError:
+            pass
+    return {}
+
+def input_digests(filenames, known, fetched=None):
+    """
+    SHA-256 of each raw input ({'data/raw/<file>': sha or None if absent}).
+    Files whose size and mtime match the manifest, or the digest the
+    downloader recorded when it saved them, reuse that digest, so unchanged
+    bulk files are not re-read just to prove they are unchanged.
+    """
+    fetched = fetched or {}
+    digests = {}
+    for name in filenames:
+        path = os.path.join(RAW_DIR, name)
+        rel = f"data/raw/{name}"
+        if not os.path.exists(path):
+            digests[rel] = None
+            continue
+        st = os.stat(path)
+        for prev in (known.get(rel), fetched.get(name)):
+            if prev and prev['size'] == st.st_size and prev['mtime_ns'] == st.st_mtime_ns:
+                _SHA256_MEMO[(os.path.abspath(path), st.st_size, st.st_mtime_ns)] = prev['sha256']
+                break
+        known[rel] = {'sha256': file_sha256(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        digests[rel] = known[rel]['sha256']
+    return digests
+
+def _stage_groups(names):
+    """Group stages that read the same raw file so it is decoded once per worker"""
+    groups = []
+    for name in names:
+        inputs = set(STAGES[name]['inputs'])
+        for group in groups:
+            if inputs & group['inputs']:
+                group['names'].append(name)
+                group['inputs'] |= inputs
+                break
+        else:
+            groups.append({'names': [name], 'inputs': inputs})
+    return [g['names'] for g in groups]
+
+def _run_stage_group(names, countries=None):
+    """Worker entry point: run stages, return compact arrays and cache stats"""
+    results = {}
+    for name in names:
+        df = _run_stage(name, countries)
+        results[name] = None if df is None else frame_to_arrays(df)
+    return results, CACHE_STATS
+
+def compute_stages(names, workers=1, countries=None):
+    """
+    Run the given stages, in a process pool when workers > 1. Stages sharing
+    a raw file go to the same worker; results come back as dictionary-encoded
+    arrays rather than pickled DataFrames.
+    """
+    groups = _stage_groups(names)
+    workers = max(1, min(workers, len(groups)))
+    if workers == 1:
+        return {name: _run_stage(name, countries) for name in names}
+    
+    print(f"Running {len(groups)} stage groups on {workers} worker processes...")
+    outputs = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for results, stats in pool.map(_run_stage_group, groups, [countries] * len(groups)):
+            for name, arrays in results.items():
+                outputs[name] = None if arrays is None else arrays_to_frame(arrays)
+            CACHE_STATS['hits'] += stats['hits']
+            CACHE_STATS['misses'] += stats['misses']
+            CACHE_STATS['store'] += stats['store']
+            CACHE_STATS['decodes'].update(stats['decodes'])
+    return outputs
+
+def stage_manifest_path(mode='baseline'):
+    if mode == 'baseline':
+        return STAGE_MANIFEST_PATH
+    return os.path.join(PROCESSED_DIR, f"stage_manifest_{mode}.json")
+
+def run_stages(force=False, workers=1, mode='baseline'):
+    """
+    Run every stage whose inputs or configuration changed since the last run
+    and load the rest from data/processed/cache. Returns ({stage: frame or
+    None}, [recomputed stages], updated manifest).
+    """
+    panel_mode = PANEL_MODES[mode]
+    countries = panel_mode['countries']
+    manifest = load_stage_manifest(stage_manifest_path(mode))
+    fetched = load_fetch_meta().get('files', {})
+    config_key = _stage_config_key(countries)
+    outputs, digests, stale = {}, {}, []
+    for name, stage in STAGES.items():
+        digests[name] = input_digests(stage['inputs'], manifest['inputs'], fetched)
+        cache_path = os.path.join(CACHE_DIR, f"{panel_mode['stage_prefix']}-{name}.npz")
+        record = manifest['stages'].get(name)
+        fresh = (not force and record is not None and record['inputs'] == digests[name]
+                 and record['config'] == config_key)
+        
+        df = None
+        if fresh and record['columns']:
+            try:
+                df = _load_long_frame(cache_path) if os.path.exists(cache_path) else None
+            except Exception as e:
+                print(f"Ignoring unreadable stage cache {cache_path}: {e}")
+            fresh = df is not None
+        
+        if fresh:
+            outputs[name] = df
+        else:
+            stale.append(name)
+    
+    if stale:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+    for name, df in compute_stages(stale, workers, countries).items():
+        if df is not None:
+            _save_long_frame(os.path.join(CACHE_DIR, f"{panel_mode['stage_prefix']}-{name}.npz"), df)
+        manifest['stages'][name] = {
+            'inputs': digests[name],
+            'config': config_key,
+            'columns': [] if df is None else [c for c in df.columns if c not in ('geo', 'month')],
+        }
+        outputs[name] = df
+    return {name: outputs[name] for name in STAGES}, stale, manifest
+
+def save_stage_manifest(manifest, path=STAGE_MANIFEST_PATH):
+    """Written only after the panel is saved, so a failed run is redone next time"""
+    with open(path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build data/processed/merged_data.csv from data/raw')
+    parser.add_argument('--force', action='store_true', help='Recompute every stage, ignoring cached stage outputs')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes for recomputing stages (1 = run serially)')
+    parser.add_argument('--build-raw-store', action='store_true',
+                        help='Convert the Eurostat files into the geo-partitioned store (data/processed/raw_store) first')
+    parser.add_argument('--universe', action='store_true',
+                        help='Keep every geo in the Eurostat files (writes merged_data_universe.csv)')
+    parser.add_argument('--float32', action='store_true',
+                        help='Store panel values as float32 in the columnar store (the CSV is unaffected)')
+    args = parser.parse_args(argv)
+    mode = 'universe' if args.universe else 'baseline'
+    
+    if args.build_raw_store:
+        for filename in READER_FILTERS:
+            if os.path.exists(os.path.join(RAW_DIR, filename)):
+                build_raw_store(filename)
+    
     print("Processing datasets...")
+    last_fetch = load_fetch_meta().get('last_run')
+    if last_fetch and not last_fetch['changed']:
+        print(f"Last fetch ({last_fetch['time']}) reported no upstream changes")
+    out_path = os.path.join(PROCESSED_DIR, PANEL_MODES[mode]['output'])
+    outputs, recomputed, manifest = run_stages(force=args.force, workers=args.workers, mode=mode)
+    value_dtype = np.dtype(np.float32 if args.float32 else np.float64)
+    if not recomputed and os.path.exists(out_path):
+        print(f"All stages up to date; {out_path} unchanged (use --force to rebuild)")
+        store = read_manifest(out_path)
+        if store is None or store['value_dtype'] != value_dtype.str:
+            rebuild_store(out_path, value_dtype)
+            print(f"Rewrote columnar panel store next to {out_path} as {value_dtype.name}")
+        return
+    print(f"Recomputed stages: {', '.join(recomputed)}")
     
     # 1. Main Country Panel
-    hicp = process_hicp()
-    # ppi = process_ppi() # Excluded
-    ip = process_ip()
-    
-    merged = hicp
-    if ip is not None:
-        merged = pd.merge(merged, ip, on=['geo', 'date'], how='outer')
+    # (ppi is excluded)
+    merged = align_panel([outputs[n] for n, st in STAGES.items() if st['kind'] == 'panel'])
         
     # 2. External Variables
-    oil = process_oil()
-    ecb = process_ecb() # PLN/EUR
-    
-    # New Vars
-    gas = process_gas()
-    usd_eur = process_usd_eur()
-    ea_ip = process_ea_ip()
-    
-    # Merge Ext
-    for ext in [oil, ecb, gas, usd_eur, ea_ip]:
-        if ext is not None:
-            merged = pd.merge(merged, ext, on='date', how='left')
+    merged = attach_external(merged, [outputs[n] for n, st in STAGES.items() if st['kind'] == 'external'])
             
     # 3. Construct Local Currency Shocks
     print("Constructing Local Currency Shocks...")
@@ -331,52 +1127,54 @@ def main():
     # P_Gas_EUR = P_Gas_USD / (USD/EUR) 
     # (since DEXUSEU is USD per 1 EUR).
     
+    # Derived series are evaluated per geo on the (month, geo) cube
+    cube = PanelCube.from_panel(merged, ['f_GAS', 'f_OIL', 'f_USD_EUR', 'f_PLN_EUR'], time='month')
+    derived = DerivedPanel(cube)
+    
     if 'f_GAS' in merged.columns and 'f_USD_EUR' in merged.columns:
-        merged['Gas_EUR'] = merged['f_GAS'] / merged['f_USD_EUR']
-        merged['Log_Gas_EUR'] = np.log(merged['Gas_EUR'])
-        merged['DL_Gas_EUR'] = merged['Log_Gas_EUR'].diff() * 100 # Percentage Change
+        gas_eur = ratio('f_GAS', 'f_USD_EUR')
+        merged['Gas_EUR'] = derived.rows(gas_eur, merged, time='month')
+        merged['Log_Gas_EUR'] = derived.rows(log(gas_eur), merged, time='month')
+        merged['DL_Gas_EUR'] = derived.rows(dlog(gas_eur), merged, time='month') # Percentage Change
         
         # Also keep USD Gas for reference
-        merged['DL_Gas_USD'] = np.log(merged['f_GAS']).diff() * 100
+        merged['DL_Gas_USD'] = derived.rows(dlog('f_GAS'), merged, time='month')
     
     # 2. Exchange Rates (Local Currency per 1 EUR)
     # Target: Increase = Depreciation against the Euro (The Anchor)
     
-    # Spain: EUR. Exchange rate against EUR is 1 (Log Change 0).
-    # Poland: PLN/EUR (f_PLN_EUR).
-    
-    merged['DL_XR_Local'] = 0.0 # Default 0 (for Spain)
+    # Each geo's currency per month (scripts/currency.py) looked up in the
+    # ECB rate matrix for the whole (month, geo) grid at once.
+    # Euro geos (Spain): rate 1, log change 0. Poland: PLN/EUR (f_PLN_EUR).
+    rates = exchange_rates([outputs[n] for n, st in STAGES.items() if st['kind'] == 'external'],
+                           cube.dates)
+    xr, is_euro = local_rates(cube.dates, cube.geos, rates)
+    merged['DL_XR_Local'] = cube.rows(local_fx_shock(xr, is_euro), merged, time='month')
 
-    # Poland: FX Shock = Delta Log PLN/EUR
     if 'f_PLN_EUR' in merged.columns:
-        pln_log = np.log(merged['f_PLN_EUR'])
-        pln_diff = pln_log.diff() * 100
-        
-        # Apply only to PL rows
-        mask_pl = merged['geo'] == 'PL'
-        # We need to ensure alignment. The diff is on the full series?
-        # f_PLN_EUR is a column. We can just map it.
-        # But we must be careful about dates.
-        # It's better to calculate diff on the column and fill.
-        
-        merged['DL_XR_PLN_EUR'] = pln_diff
-        merged.loc[mask_pl, 'DL_XR_Local'] = merged.loc[mask_pl, 'DL_XR_PLN_EUR']
-     
-    # For Spain, DL_XR_Local remains 0.
+        merged['DL_XR_PLN_EUR'] = derived.rows(dlog('f_PLN_EUR'), merged, time='month')
 
+    # Commodity prices in local currency: USD price / (USD/EUR) * (LCU/EUR)
+    for name, col in (('Gas', 'f_GAS'), ('Oil', 'f_OIL')):
+        if col in merged.columns and 'f_USD_EUR' in merged.columns:
+            merged[f'{name}_LCU'] = cube.rows(derived[ratio(col, 'f_USD_EUR')] * xr, merged, time='month')
 
     # Save
     if merged is not None:
-        merged = merged.sort_values(by=['geo', 'date'])
-        out_path = os.path.join(PROCESSED_DIR, "merged_data.csv")
+        merged = merged.sort_values(by=['geo', 'month'])
+        # Timestamps only at the output boundary
+        merged.insert(1, 'date', to_timestamps(merged.pop('month')))
         merged.to_csv(out_path, index=False)
         print(f"Saved merged data to {out_path}")
+        write_panel(merged, out_path, value_dtype=value_dtype)
+        print(f"Saved columnar panel store next to {out_path}")
+        save_stage_manifest(manifest, stage_manifest_path(mode))
         # Debug
         cols = ['geo', 'date', 'DL_Gas_USD', 'DL_XR_Local']
         print(merged[cols].tail())
-
-if __name__ == "__main__":
-    main()
+    
+    print(f"Parse cache: {CACHE_STATS['hits']} hits, {CACHE_STATS['store']} from raw store, {CACHE_STATS['misses']} misses, "
+          f"decodes {dict(CACHE_STATS['decodes'])}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,792 @@
+"""
+Synthetic Control Engine
+One outcome variable held as a (date, geo) float64 array, pivoted and
+masked once; every fit then slices that array instead of re-pivoting the
+long frame. Weights are non-negative and sum to one, chosen to minimize the
+pre-period squared gap between the target and the weighted donors.
+
+    panel = SCMPanel.from_long(df, 'HICP_Total')     # or from_cube(cube, ...)
+    fit = panel.fit('ES', ['DE', 'FR'], ('2019-01-01', '2022-06-01'),
+                    ('2022-06-01', '2023-12-01'))
+    fit['ate'], fit['rmspe_pre'], fit_series(fit, 'gap')
+
+Windows are (start, end) pairs: the pre-period is start <= date < end, the
+post-period start <= date <= end; None leaves a side open.
+
+The weights come from simplex_lstsq, an active-set solver working on a
+donors x donors Gram matrix only, so after setup its cost does not depend
+on the length of the pre-period. `python scripts/scm.py --benchmark` times it
+against SLSQP.
+
+Placebo, leave-one-out and donor-pool sweeps go through fit_batch: the
+all-geo Gram matrix is built once per window, every problem's matrix is
+read off it, and simplex_lstsq_batch runs the active-set steps of all
+problems together in stacked NumPy solves. Sweeps of neighbouring
+specifications (intervention dates, leave-one-out pools) go through
+sweep, which warm-starts each fit from the nearest one already solved.
+fit_nested chooses predictor importance as well (nested_v): an outer
+search over a diagonal V whose candidates are solved together, each inner
+problem warm-started and cached.
+"""
+
+import os
+import time
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+def simplex_lstsq(G, c, tol=1e-10, max_iter=None, w0=None, support=None, kkt_tol=1e-7):
+    """
+    argmin_w w'Gw - 2c'w subject to w >= 0, sum(w) = 1, i.e. the weights
+    minimizing ||y - Xw||^2 given G = X'X and c = X'y.
+
+    Primal active-set method: starting from the best single donor, solve the
+    equality-constrained problem on the current support exactly (one small
+    KKT system), step back to the boundary when that solution leaves the
+    simplex, and add the donor with the most negative reduced cost until
+    none is left. A donor that cannot enter (degenerate support: its KKT
+    solution gives it no weight) is passed over and the next one priced.
+    Returns (w, info) with info = {'nit', 'kkt'}; kkt is the largest KKT
+    violation at w (stationarity on the support, dual feasibility off it),
+    scaled like G, and a RuntimeWarning is issued when it exceeds
+    kkt_tol times the scale of G.
+
+    Warm start: w0 (non-negative weights, rescaled to sum to one) and/or
+    support (mask of the donors starting free, i.e. the complement of the
+    active set; defaults to w0 > 0). With the optimal support of a nearby
+    problem the solve usually ends after one KKT system.
+    """
+    G = np.asarray(G, dtype=np.float64)
+    c = np.asarray(c, dtype=np.float64)
+    n = len(c)
+    if max_iter is None:
+        max_iter = 10 * n + 10
+    eps = tol * max(1.0, np.abs(np.diag(G)).max())
+
+    w = np.zeros(n)
+    if support is None and w0 is not None:
+        support = np.asarray(w0) > 0
+    if support is not None and np.any(support):
+        support = np.asarray(support, dtype=bool)
+        w[support] = 1.0 if w0 is None else np.asarray(w0, dtype=np.float64)[support]
+        if not (w[support] > 0).all():
+            w[support] = 1.0
+        w /= w.sum()
+    else:
+        w[np.argmin(np.diag(G) - 2 * c)] = 1.0
+    support = w > 0
+    nu = 0.0
+    added = -1
+    passed = np.zeros(n, dtype=bool)  # degenerate entering donors, until w moves
+    for nit in range(1, max_iter + 1):
+        idx = np.flatnonzero(support)
+        k = len(idx)
+        K = np.zeros((k + 1, k + 1))
+        K[:k, :k] = G[np.ix_(idx, idx)]
+        K[:k, k] = K[k, :k] = 1.0
+        rhs = np.append(c[idx], 1.0)
+        try:
+            sol = np.linalg.solve(K, rhs)
+        except np.linalg.LinAlgError:
+            sol = np.linalg.lstsq(K, rhs, rcond=None)[0]
+        z, nu = sol[:k], sol[k]
+
+        if (z > 0).all():
+            if added >= 0:
+                passed[:] = False
+            w[:] = 0.0
+            w[idx] = z
+            reduced = G.dot(w) - c + nu  # zero on the support at an optimum
+            reduced[support | passed] = np.inf
+            j = np.argmin(reduced)
+            if reduced[j] >= -eps:
+                break
+            support[j] = True
+            added = j
+            continue
+
+        if added >= 0 and z[np.searchsorted(idx, added)] <= 0:
+            # The entering donor cannot move (degenerate support): leave w
+            # where it is and price the other donors
+            support[added] = False
+            passed[added] = True
+            added = -1
+            continue
+        # Move towards z until the first weight hits zero, and drop it
+        wi = w[idx]
+        blocking = np.flatnonzero(z <= 0)
+        ratios = wi[blocking] / (wi[blocking] - z[blocking])
+        alpha = ratios.min()
+        w[idx] = np.maximum(wi + alpha * (z - wi), 0.0)
+        w[idx[blocking[ratios <= alpha]]] = 0.0
+        support = w > 0
+        added = -1
+        if alpha > 0:
+            passed[:] = False
+
+    grad = G.dot(w) - c
+    on = support & (w > 0)
+    nu = -grad[on].mean()
+    violation = max(np.abs(grad[on] + nu).max(initial=0.0),
+                    -(grad[~on] + nu).min(initial=0.0))
+    _check_kkt(violation, kkt_tol * max(1.0, np.abs(np.diag(G)).max()))
+    return w, {'nit': nit, 'kkt': violation}
+
+def _check_kkt(violation, limit, problems=1):
+    if np.any(violation > limit):
+        warnings.warn(f"simplex_lstsq: KKT violation {np.max(violation):.3g} above {np.max(limit):.3g} "
+                      f"in {np.sum(violation > limit)} of {problems} problem(s); weights may not be optimal",
+                      RuntimeWarning, stacklevel=3)
+
+def simplex_lstsq_batch(G, allowed, c=None, tol=1e-10, max_iter=None, W0=None, kkt_tol=1e-7):
+    """
+    simplex_lstsq for a stack of problems: G (B, n, n), allowed (B, n) marks
+    each problem's donors (the rest stay at zero), c (B, n) defaults to 0.
+    The same active-set steps are taken in lockstep: every iteration solves
+    the KKT systems of all unfinished problems with one batched
+    np.linalg.solve, variables off the support pinned to zero by identity
+    rows. W0 (B, n) warm-starts the problems it has positive allowed
+    weights for, as w0 in simplex_lstsq. Degenerate entering donors and
+    the KKT check (kkt_tol) are handled as in simplex_lstsq.
+    Returns (W, {'nit': (B,), 'kkt': (B,)}).
+    """
+    G = np.asarray(G, dtype=np.float64)
+    allowed = np.asarray(allowed, dtype=bool)
+    B, n, _ = G.shape
+    c = np.zeros((B, n)) if c is None else np.asarray(c, dtype=np.float64)
+    if max_iter is None:
+        max_iter = 10 * n + 10
+    diag = np.diagonal(G, axis1=1, axis2=2)
+    eps = tol * np.maximum(1.0, np.abs(diag).max(axis=1))
+    di = np.arange(n)
+
+    W = np.zeros((B, n))
+    start = np.where(allowed, diag - 2 * c, np.inf).argmin(axis=1)
+    W[np.arange(B), start] = 1.0
+    W[~allowed.any(axis=1)] = 0.0
+    if W0 is not None:
+        W0 = np.where(allowed, np.maximum(W0, 0.0), 0.0)
+        mass = W0.sum(axis=1)
+        W[mass > 0] = W0[mass > 0] / mass[mass > 0, None]
+    support = W > 0
+    added = np.full(B, -1)
+    passed = np.zeros((B, n), dtype=bool)
+    done = ~allowed.any(axis=1)
+    nit = np.zeros(B, dtype=int)
+    for _ in range(max_iter):
+        act = np.flatnonzero(~done)
+        if not len(act):
+            break
+        nit[act] += 1
+        S = support[act]
+        K = np.zeros((len(act), n + 1, n + 1))
+        K[:, :n, :n] = np.where(S[:, :, None] & S[:, None, :], G[act], 0.0)
+        K[:, di, di] += ~S
+        K[:, :n, n] = K[:, n, :n] = S
+        rhs = np.zeros((len(act), n + 1))
+        rhs[:, :n] = np.where(S, c[act], 0.0)
+        rhs[:, n] = 1.0
+        try:
+            sol = np.linalg.solve(K, rhs[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            sol = np.array([np.linalg.lstsq(k, r, rcond=None)[0] for k, r in zip(K, rhs)])
+        z = np.where(S, sol[:, :n], 0.0)
+        nu = sol[:, n]
+        inside = np.where(S, z, 1.0).min(axis=1) > 0
+
+        # Inside the simplex: accept, then add the most negative reduced cost
+        f = act[inside]
+        if len(f):
+            passed[f[added[f] >= 0]] = False
+            W[f] = z[inside]
+            reduced = np.einsum('bij,bj->bi', G[f], W[f]) - c[f] + nu[inside][:, None]
+            reduced[support[f] | ~allowed[f] | passed[f]] = np.inf
+            j = reduced.argmin(axis=1)
+            optimal = reduced[np.arange(len(f)), j] >= -eps[f]
+            done[f[optimal]] = True
+            grow = ~optimal
+            support[f[grow], j[grow]] = True
+            added[f[grow]] = j[grow]
+
+        # Outside: step back to the first blocking weight and drop it
+        o = act[~inside]
+        if len(o):
+            zo = z[~inside]
+            stuck = (added[o] >= 0) & (zo[np.arange(len(o)), np.maximum(added[o], 0)] <= 0)
+            # Degenerate: the entering donor cannot move; pass it over
+            support[o[stuck], added[o[stuck]]] = False
+            passed[o[stuck], added[o[stuck]]] = True
+            added[o[stuck]] = -1
+            o, zo = o[~stuck], zo[~stuck]
+            Wo, So = W[o], support[o]
+            blocking = So & (zo <= 0)
+            ratios = np.where(blocking, Wo / np.where(blocking, Wo - zo, 1.0), np.inf)
+            alpha = ratios.min(axis=1)[:, None]
+            Wo = np.where(So, np.maximum(Wo + alpha * (zo - Wo), 0.0), 0.0)
+            Wo[blocking & (ratios <= alpha)] = 0.0
+            W[o], support[o], added[o] = Wo, Wo > 0, -1
+            passed[o[alpha[:, 0] > 0]] = False
+
+    grad = np.einsum('bij,bj->bi', G, W) - c
+    on = W > 0
+    with np.errstate(invalid='ignore'):
+        nu = -(grad * on).sum(axis=1) / on.sum(axis=1)
+    stationarity = np.where(on, np.abs(grad + nu[:, None]), 0.0).max(axis=1, initial=0.0)
+    dual = np.where(allowed & ~on, -(grad + nu[:, None]), 0.0).max(axis=1, initial=0.0)
+    kkt = np.maximum(stationarity, dual)
+    _check_kkt(kkt, kkt_tol * np.maximum(1.0, np.abs(diag).max(axis=1)), B)
+    return W, {'nit': nit, 'kkt': kkt}
+
+def gram(X, y):
+    """
+    (G, c) for simplex_lstsq. On the simplex y - Xw = -(X - y)w, so the
+    problem is posed on the Gram matrix of X - y with c = 0: same optimum
+    as X'X / X'y, without the common price level that makes X'X
+    ill-conditioned.
+    """
+    D = X - y[:, None]
+    return D.T.dot(D), np.zeros(D.shape[1])
+
+def simplex_lstsq_slsqp(X, y, options=None):
+    """
+    The same problem with SLSQP (the pre-engine solver), for comparison.
+    The objective is the hoisted quadratic w'Gw - 2c'w of gram(X, y) with
+    its exact gradient, so no residuals are formed and no finite
+    differences taken per iteration.
+    """
+    G, c = gram(X, y)
+
+    def loss(w):
+        Gw = G.dot(w)
+        return w.dot(Gw) - 2 * c.dot(w), 2 * (Gw - c)
+
+    n = len(c)
+    result = minimize(loss, np.ones(n) / n, jac=True, method='SLSQP', bounds=[(0, 1)] * n,
+                      constraints=[{'type': 'eq', 'fun': lambda w: np.sum(w) - 1.0,
+                                    'jac': lambda w: np.ones(n)}],
+                      options=dict({'disp': False}, **(options or {})))
+    return (result.x if result.success else None), {'nit': result.nit, 'kkt': np.nan}
+
+def nested_v(z1, Z0, y1, Y0, step=1.0, min_step=1 / 64, max_iter=500, starts=256, descents=4, seed=0,
+             rtol=1e-9):
+    """
+    Predictor importance by nested optimization (Abadie, Diamond and
+    Hainmueller): the diagonal V (non-negative, summing to one) whose
+    inner weights W*(V) = argmin (z1 - Z0 w)' V (z1 - Z0 w) on the simplex
+    best fit the pre-period outcome, mean((y1 - Y0 W*(V))^2).
+    z1 (k,) and Z0 (k, donors) are the (standardized) predictors of the
+    target and donors, y1 (T,) and Y0 (T, donors) the pre-period outcome.
+
+    Outer search: the outer loss is not convex in V, so equal weights,
+    the one-predictor-heavy Vs and `starts` random Dirichlet Vs are scored
+    first in one batch, then a compass search on log V runs from each of
+    the best `descents`. Every candidate of an iteration (V with one
+    predictor scaled up or down by exp(step)) is solved at once by
+    simplex_lstsq_batch, warm-started from the incumbent weights; the step
+    halves when no candidate improves the loss by more than rtol (relative),
+    down to min_step, each descent
+    taking at most max_iter steps. Candidates already evaluated come from
+    a cache. The V-weighted Gram matrix is rank-deficient whenever V puts
+    (almost) no weight on some predictors, so the inner objective carries a
+    tie-break of relative size 1e-6 (the outcome fit plus a ridge): W*(V)
+    is unique, and a cached W does not depend on the warm start it came from.
+    Returns (v, w, info) with info = {'loss', 'nit' (outer iterations),
+    'converged' (every descent ended on min_step, not on max_iter),
+    'evaluations', 'cache_hits', 'inner_nit', 'kkt'}.
+    """
+    D = Z0 - z1[:, None]
+    k = len(z1)
+    R = Y0 - y1[:, None]
+    outcome = R.T.dot(R) / len(y1)  # outer loss = w' outcome w on the simplex
+    J = D.shape[1]
+    tiebreak = outcome / max(np.trace(outcome), 1e-300) + np.eye(J) / J
+    cache = {}
+    info = {'evaluations': 0, 'cache_hits': 0, 'inner_nit': 0}
+
+    def normalize(x):
+        return np.maximum(x - x.max(), -30.0)
+
+    def evaluate(xs, w0):
+        keys = [np.round(x, 9).tobytes() for x in xs]
+        todo = [i for i, key in enumerate(keys) if key not in cache]
+        info['cache_hits'] += len(xs) - len(todo)
+        if todo:
+            V = np.exp(np.array([xs[i] for i in todo]))
+            V /= V.sum(axis=1, keepdims=True)
+            G = np.einsum('ki,bk,kj->bij', D, V, D)
+            scale = np.maximum(np.trace(G, axis1=1, axis2=2) / J, 1e-300)
+            G += 1e-6 * scale[:, None, None] * tiebreak
+            allowed = np.ones((len(todo), J), dtype=bool)
+            W, inner = simplex_lstsq_batch(G, allowed, W0=np.tile(w0, (len(todo), 1)))
+            loss = np.einsum('bi,ij,bj->b', W, outcome, W)
+            info['evaluations'] += len(todo)
+            info['inner_nit'] += int(inner['nit'].sum())
+            for b, i in enumerate(todo):
+                cache[keys[i]] = (loss[b], W[b], inner['kkt'][b])
+        return [cache[key] for key in keys]
+
+    # Candidate starting points, scored together
+    rng = np.random.default_rng(seed)
+    points = [np.zeros(k)] + [normalize(4.0 * step * np.eye(k)[i]) for i in range(k)]
+    points += [normalize(np.log(np.maximum(v, 1e-13))) for v in rng.dirichlet(np.full(k, 0.3), size=starts)]
+    results = evaluate(points, np.ones(D.shape[1]))
+    order = np.argsort([r[0] for r in results], kind='stable')
+
+    best, nit, converged = None, 0, True
+    for start in order[:descents]:
+        x, (loss, w, kkt), size = points[start], results[start], step
+        for _ in range(max_iter):
+            if size < min_step:
+                break
+            nit += 1
+            moves = [normalize(x + sign * size * np.eye(k)[i]) for i in range(k) for sign in (1.0, -1.0)]
+            moved = evaluate(moves, w)
+            j = int(np.argmin([r[0] for r in moved]))
+            if moved[j][0] < loss - rtol * max(1.0, loss):
+                x, (loss, w, kkt) = moves[j], moved[j]
+            else:
+                size /= 2
+        converged &= size < min_step
+        if best is None or loss < best[1]:
+            best = (x, loss, w, kkt)
+    x, loss, w, kkt = best
+    v = np.exp(x) / np.exp(x).sum()
+    info.update({'loss': loss, 'nit': nit, 'converged': bool(converged), 'kkt': kkt})
+    return v, w, info
+
+class SCMPanel:
+    def __init__(self, frame):
+        """frame: date x geo DataFrame of one variable (pivot or cube.frame)"""
+        self.dates = pd.DatetimeIndex(frame.index)
+        self.geos = pd.Index(frame.columns)
+        self.values = frame.to_numpy(dtype=np.float64, copy=True)  # never a view of a shared cube
+        # Rows without a missing value in any geo (pivot.dropna())
+        self.complete = ~np.isnan(self.values).any(axis=1)
+        self._days = self.dates.to_numpy(dtype='datetime64[D]')
+        self._column = {geo: i for i, geo in enumerate(self.geos)}
+
+    def _columns(self, geos):
+        return np.array([self._column[geo] for geo in geos], dtype=int)
+
+    @classmethod
+    def from_long(cls, df, variable, geos=None):
+        pivot = df.pivot(index='date', columns='geo', values=variable)
+        if geos is not None:
+            pivot = pivot[[g for g in pivot.columns if g in set(geos)]]
+        return cls(pivot)
+
+    @classmethod
+    def from_cube(cls, cube, variable, geos=None):
+        return cls(cube.frame(variable, geos))
+
+    def __contains__(self, geo):
+        return geo in self.geos
+
+    def series(self, geo):
+        """One geo over every date, as in pivot[geo]"""
+        return pd.Series(self.values[:, self.geos.get_loc(geo)], index=self.dates, name=geo)
+
+    def _between(self, start, end, closed):
+        keep = np.ones(len(self._days), dtype=bool)
+        if start is not None:
+            keep &= self._days >= np.datetime64(pd.Timestamp(start), 'D')
+        if end is not None:
+            end = np.datetime64(pd.Timestamp(end), 'D')
+            keep &= (self._days <= end) if closed else (self._days < end)
+        return keep
+
+    def fit(self, target, donors, pre_window, post_window, complete='panel', extra=None, solver='qp',
+            warm=None):
+        """
+        Synthetic control for target from the donors present in the panel.
+        Dates are the complete cases of the whole panel (complete='panel', as
+        after pivot.dropna()) or of the target and donors only ('pool').
+        extra = (y, X) adds rows to the pre-period fit (e.g. scaled predictor
+        targets and their donor values, X of shape (rows, donors)).
+        solver='slsqp' fits with SLSQP instead of simplex_lstsq.
+        warm: a previous fit whose weights (matched by donor) start the solver.
+
+        Returns None if the target or every donor is missing or the solver
+        fails, else a dict of arrays over the dates from the pre-period start
+        to the post-period end: 'dates', 'actual', 'synthetic', 'gap', the
+        'pre'/'post' masks, plus 'donors', 'weights', 'rmspe_pre', 'ate'
+        (mean post-period gap), 'nit' and 'kkt' (see simplex_lstsq).
+        """
+        if target not in self._column:
+            return None
+        donors = [d for d in donors if d in self._column]
+        if not donors:
+            return None
+        t = self._column[target]
+        cols = self._columns(donors)
+        if complete == 'panel':
+            rows = self.complete
+        else:
+            rows = ~np.isnan(self.values[:, [t] + list(cols)]).any(axis=1)
+
+        pre = rows & self._between(pre_window[0], pre_window[1], closed=False)
+        full = rows & self._between(pre_window[0], post_window[1], closed=True)
+        y_pre = self.values[pre, t]
+        X_pre = self.values[np.ix_(pre, cols)]
+        if extra is not None:
+            y_fit = np.concatenate([y_pre, np.asarray(extra[0], dtype=np.float64)])
+            X_fit = np.vstack([X_pre, np.asarray(extra[1], dtype=np.float64)])
+        else:
+            y_fit, X_fit = y_pre, X_pre
+
+        if solver == 'slsqp':
+            weights, info = simplex_lstsq_slsqp(X_fit, y_fit)
+            if weights is None:
+                return None
+        else:
+            w0 = None
+            if warm is not None:
+                w0 = np.array([weight_dict(warm).get(d, 0.0) for d in donors])
+            weights, info = simplex_lstsq(*gram(X_fit, y_fit), w0=w0)
+
+        return self._result(target, donors, weights, info, pre, full, post_window)
+
+    def _result(self, target, donors, weights, info, pre, full, post_window):
+        t = self._column[target]
+        cols = self._columns(donors)
+        actual = self.values[full, t]
+        synthetic = self.values[np.ix_(full, cols)].dot(weights)
+        gap = actual - synthetic
+        dates = self.dates[full]
+        post = self._between(post_window[0], None, closed=True)[full]
+        pre_gap = self.values[pre, t] - self.values[np.ix_(pre, cols)].dot(weights)
+        return {
+            'target': target,
+            'donors': donors,
+            'weights': weights,
+            'dates': dates,
+            'actual': actual,
+            'synthetic': synthetic,
+            'gap': gap,
+            'pre': pre[full],
+            'post': post,
+            'rmspe_pre': np.sqrt(np.mean(pre_gap ** 2)),
+            'ate': gap[post].mean() if post.any() else np.nan,
+            'nit': info['nit'],
+            'kkt': info['kkt'],
+        }
+
+    def sweep(self, specs, warm=None, cold_reference=False, **kwargs):
+        """
+        fit() for (target, donors, pre_window, post_window) specs that are
+        small changes of one another (dates moved, a donor dropped), in
+        continuation order: each fit is warm-started from the nearest spec
+        already solved (or from warm, a fit to start from), so a neighbour
+        with the same optimal support costs one KKT solve. kwargs go to
+        fit(). With cold_reference=True every result also has 'nit_cold',
+        the iterations of the same fit from a cold start.
+        Results come back in the order of specs.
+        """
+        specs = [(target, list(donors), tuple(pre_window), tuple(post_window))
+                 for target, donors, pre_window, post_window in specs]
+        distance = _spec_distances(specs)
+        solved = {}
+        pending = list(range(len(specs)))
+        while pending:
+            seed = None
+            if solved:
+                done = list(solved)
+                near = distance[np.ix_(pending, done)]
+                i, j = np.unravel_index(np.argmin(near), near.shape)
+                k, seed = pending[i], solved[done[j]]
+                if warm is not None and _donor_distance(specs[k], warm) < near[i, j]:
+                    seed = warm
+            elif warm is not None:
+                k = min(pending, key=lambda k: _donor_distance(specs[k], warm))
+                seed = warm
+            else:
+                k = pending[0]
+            pending.remove(k)
+            fit = self.fit(*specs[k], warm=seed, **kwargs)
+            if fit is not None:
+                if cold_reference:
+                    fit['nit_cold'] = self.fit(*specs[k], **kwargs)['nit']
+                solved[k] = fit
+        return [solved.get(k) for k in range(len(specs))]
+
+    def fit_batch(self, specs, summary=False, chunk=2048):
+        """
+        fit() for many (target, donors, pre_window, post_window) specs at once,
+        on the complete='panel' dates and without extra rows. The all-geo
+        Gram matrix is built once per pre-window, each problem's centered
+        Gram is read off it, and the problems are solved together by
+        simplex_lstsq_batch, chunk at a time.
+
+        Returns a list of fit() dicts (None where fit() would return None),
+        or with summary=True a dict of arrays over the specs: 'weights'
+        (specs x panel geos), 'rmspe_pre', 'ate', 'nit', 'kkt', 'ok'.
+        """
+        B, n_geo = len(specs), len(self.geos)
+        targets = np.full(B, -1)
+        allowed = np.zeros((B, n_geo), dtype=bool)
+        donor_lists = []
+        window_ids, windows, grams = np.zeros(B, dtype=int), {}, {}
+        for b, (target, donors, pre_window, post_window) in enumerate(specs):
+            donors = [d for d in donors if d in self._column]
+            donor_lists.append(donors)
+            if target in self._column:
+                targets[b] = self._column[target]
+            allowed[b, self._columns(donors)] = True
+            key = (tuple(pre_window), tuple(post_window))
+            if key not in windows:
+                pre = self.complete & self._between(pre_window[0], pre_window[1], closed=False)
+                full = self.complete & self._between(pre_window[0], post_window[1], closed=True)
+                post = full & self._between(post_window[0], None, closed=True)
+                if key[0] not in grams:
+                    # Differences between geos are all that matter; removing
+                    # each date's cross-geo mean keeps the Gram well scaled
+                    V = self.values[pre]
+                    V = V - V.mean(axis=1, keepdims=True)
+                    grams[key[0]] = V.T.dot(V)
+                windows[key] = (len(windows), pre, full, post)
+            window_ids[b] = windows[key][0]
+        masks = sorted(windows.values(), key=lambda w: w[0])
+        keys = sorted(windows, key=lambda k: windows[k][0])
+        A = np.stack([grams[k[0]] for k in keys]) if keys else np.zeros((0, n_geo, n_geo))
+        n_pre = np.array([m[1].sum() for m in masks])
+        post_means = np.array([self.values[m[3]].mean(axis=0) if m[3].any()
+                               else np.full(n_geo, np.nan) for m in masks])
+
+        ok = (targets >= 0) & allowed.any(axis=1)
+        W = np.zeros((B, n_geo))
+        nit = np.zeros(B, dtype=int)
+        kkt = np.full(B, np.nan)
+        rmspe = np.full(B, np.nan)
+        idx = np.flatnonzero(ok)
+        for lo in range(0, len(idx), chunk):
+            b = idx[lo:lo + chunk]
+            t, Ab = targets[b], A[window_ids[b]]
+            r = np.arange(len(b))
+            a = Ab[r, :, t]
+            Q = Ab - a[:, :, None] - a[:, None, :] + Ab[r, t, t][:, None, None]
+            W[b], info = simplex_lstsq_batch(Q, allowed[b])
+            nit[b], kkt[b] = info['nit'], info['kkt']
+            loss = np.einsum('bi,bij,bj->b', W[b], Q, W[b])
+            rmspe[b] = np.sqrt(np.maximum(loss, 0.0) / n_pre[window_ids[b]])
+        with np.errstate(invalid='ignore'):
+            ate = np.where(ok, post_means[window_ids, np.maximum(targets, 0)]
+                           - (post_means[window_ids] * W).sum(axis=1), np.nan)
+
+        if summary:
+            return {'weights': W, 'rmspe_pre': rmspe, 'ate': ate, 'nit': nit, 'kkt': kkt, 'ok': ok}
+        results = []
+        for b, (target, _, _, post_window) in enumerate(specs):
+            if not ok[b]:
+                results.append(None)
+                continue
+            _, pre, full, _ = masks[window_ids[b]]
+            donors = donor_lists[b]
+            weights = W[b, self._columns(donors)]
+            results.append(self._result(target, donors, weights, {'nit': nit[b], 'kkt': kkt[b]},
+                                        pre, full, post_window))
+        return results
+
+    def fit_nested(self, target, donors, pre_window, post_window, predictors, **kwargs):
+        """
+        fit() with the weights of nested_v: predictors is a geo x predictor
+        table, each predictor standardized by its standard deviation over
+        the target and donors; the pre-period outcome is the complete='panel'
+        dates. kwargs go to nested_v. The result also has 'v', the predictor
+        weights as a Series, and the nested_v info ('nit' counts outer
+        iterations).
+        """
+        if target not in self._column:
+            return None
+        donors = [d for d in donors if d in self._column and d in predictors.index]
+        if not donors or target not in predictors.index:
+            return None
+        t = self._column[target]
+        cols = self._columns(donors)
+        pre = self.complete & self._between(pre_window[0], pre_window[1], closed=False)
+        full = self.complete & self._between(pre_window[0], post_window[1], closed=True)
+
+        Z = predictors.loc[[target] + donors].to_numpy(dtype=np.float64)
+        scale = Z.std(axis=0, ddof=1)
+        Z = Z / np.where(scale > 0, scale, 1.0)
+        v, weights, info = nested_v(Z[0], Z[1:].T, self.values[pre, t], self.values[np.ix_(pre, cols)],
+                                    **kwargs)
+        fit = self._result(target, donors, weights, info, pre, full, post_window)
+        fit.update({key: info[key] for key in info if key not in fit})
+        fit['v'] = pd.Series(v, index=predictors.columns)
+        return fit
+
+def _donor_distance(spec, fit):
+    return (0 if spec[0] == fit['target'] else 1e6) + len(set(spec[1]) ^ set(fit['donors']))
+
+def _spec_distances(specs):
+    """
+    Pairwise distance of (target, donors, pre_window, post_window) specs:
+    donors changed plus months moved (a window bound set in one spec and
+    open in the other counts as 1000 months)
+    """
+    n = len(specs)
+    days = np.array([[np.nan if d is None else pd.Timestamp(d).value / 86400e9 for d in pre + post]
+                     for _, _, pre, post in specs]).reshape(n, -1)
+    moved = np.abs(days[:, None, :] - days[None, :, :]) / 30.4
+    both_open = np.isnan(days[:, None, :]) & np.isnan(days[None, :, :])
+    moved = np.where(both_open, 0.0, np.where(np.isnan(moved), 1e3, moved)).sum(axis=2)
+    donors = [set(spec[1]) for spec in specs]
+    changed = np.array([[len(a ^ b) + (0 if x[0] == y[0] else 1e6) for b, y in zip(donors, specs)]
+                        for a, x in zip(donors, specs)])
+    return moved + changed
+
+def fit_series(fit, key='gap'):
+    """One array of a fit as a date-indexed Series"""
+    return pd.Series(fit[key], index=fit['dates'])
+
+def weight_dict(fit):
+    return dict(zip(fit['donors'], fit['weights']))
+
+def report_iterations(fits):
+    """
+    Print the solver iterations of a sweep, against cold starts when it ran
+    with cold_reference=True
+    """
+    fits = [fit for fit in fits if fit is not None]
+    warm = sum(fit['nit'] for fit in fits)
+    if not all('nit_cold' in fit for fit in fits):
+        print(f"Solver iterations: {warm} warm-started over {len(fits)} fits")
+        return
+    cold = sum(fit['nit_cold'] for fit in fits)
+    print(f"Solver iterations: {warm} warm-started vs {cold} cold ({cold - warm} saved over {len(fits)} fits)")
+
+# Benchmark: simplex_lstsq against SLSQP, fit_batch against a fit() loop,
+# a warm-started sweep against cold fits
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "data", "processed", "merged_data.csv")
+
+def _time(func, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        out = func()
+    return (time.perf_counter() - start) / repeats, out
+
+def _compare(name, X, y, repeats):
+    """One problem solved both ways: time per fit, objective, weight gap, KKT"""
+    def objective(w):
+        r = y - X.dot(w)
+        return r.dot(r)
+
+    t_slsqp, (w_slsqp, info_slsqp) = _time(lambda: simplex_lstsq_slsqp(X, y), repeats)
+    t_qp, (w_qp, info_qp) = _time(lambda: simplex_lstsq(*gram(X, y)), repeats)
+    row = {'problem': name, 'donors': X.shape[1], 'pre_periods': X.shape[0],
+           'slsqp_ms': t_slsqp * 1e3, 'qp_ms': t_qp * 1e3, 'speedup': t_slsqp / t_qp,
+           'slsqp_nit': info_slsqp['nit'], 'qp_nit': info_qp['nit'],
+           'qp_loss': objective(w_qp), 'qp_kkt': info_qp['kkt'],
+           'slsqp_loss': np.nan, 'max_weight_diff': np.nan}
+    if w_slsqp is not None:
+        row['slsqp_loss'] = objective(w_slsqp)
+        row['max_weight_diff'] = np.abs(w_slsqp - w_qp).max()
+    return row
+
+def benchmark(n_donors=200, n_pre=41, trials=3, repeats=3, seed=0):
+    """
+    simplex_lstsq vs SLSQP on the HICP_Total ES problem (when the panel
+    exists) and on synthetic random-walk panels with n_donors donors.
+    """
+    rows = []
+    if os.path.exists(DATA_PATH):
+        from panel_store import load_panel
+        panel = SCMPanel.from_long(load_panel(DATA_PATH, columns=['HICP_Total']), 'HICP_Total')
+        pre = panel.complete & panel._between('2019-01-01', '2022-06-01', closed=False)
+        cols = panel.geos.get_indexer(['DE', 'FR', 'IT', 'AT', 'NL'])
+        if 'ES' in panel and (cols >= 0).all():
+            X = panel.values[np.ix_(pre, cols)]
+            y = panel.values[pre, panel.geos.get_loc('ES')]
+            rows.append(_compare('HICP_Total ES', X, y, repeats))
+    rng = np.random.default_rng(seed)
+    for trial in range(trials):
+        X = 100 + np.cumsum(rng.normal(size=(n_pre, n_donors)), axis=0)
+        true_w = rng.dirichlet(np.ones(5))
+        y = X[:, rng.choice(n_donors, 5, replace=False)].dot(true_w) + rng.normal(scale=0.3, size=n_pre)
+        rows.append(_compare(f'synthetic #{trial + 1}', X, y, 1))
+    return pd.DataFrame(rows)
+
+def benchmark_batch(problems=2000, n_geos=27, n_pre=41, n_post=19, loop=200, seed=0):
+    """
+    fit_batch throughput on a synthetic n_geos panel: problems random
+    (target, donor subset) specs over three intervention dates, against a
+    loop of fit() on the first loop specs.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2019-01-01', periods=n_pre + n_post, freq='MS')
+    geos = [f'G{i:02d}' for i in range(n_geos)]
+    panel = SCMPanel(pd.DataFrame(100 + np.cumsum(rng.normal(size=(len(dates), n_geos)), axis=0),
+                                  index=dates, columns=geos))
+    interventions = [dates[n_pre - 12], dates[n_pre - 6], dates[n_pre]]
+    specs = []
+    for k in range(problems):
+        target = rng.integers(n_geos)
+        donors = [g for i, g in enumerate(geos) if i != target and rng.random() < 0.6]
+        start = interventions[k % 3]
+        specs.append((geos[target], donors, (dates[0], start), (start, dates[-1])))
+    t_batch, out = _time(lambda: panel.fit_batch(specs, summary=True), 1)
+    t_loop, fits = _time(lambda: [panel.fit(*spec) for spec in specs[:loop]], 1)
+    ate_diff = max(abs(fit['ate'] - ate) for fit, ate in zip(fits, out['ate']) if fit is not None)
+    return pd.DataFrame([{'problems': problems, 'geos': n_geos,
+                          'batch_fits_per_s': problems / t_batch, 'loop_fits_per_s': loop / t_loop,
+                          'max_nit': out['nit'].max(), 'max_kkt': np.nanmax(out['kkt']),
+                          'max_ate_diff': ate_diff}])
+
+def benchmark_sweep(start='2022-01-01', end='2022-12-01', n_geos=27, seed=0):
+    """
+    Warm-started sweep of the intervention month over start..end against
+    the same fits from cold: the ES problem (when the panel exists) and
+    a synthetic n_geos panel with every other geo as donor.
+    """
+    months = pd.date_range(start, end, freq='MS')
+    panels = []
+    if os.path.exists(DATA_PATH):
+        from panel_store import load_panel
+        panel = SCMPanel.from_long(load_panel(DATA_PATH, columns=['HICP_Total']), 'HICP_Total')
+        if 'ES' in panel:
+            panels.append(('HICP_Total ES', panel, 'ES', ['DE', 'FR', 'IT', 'AT', 'NL']))
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2019-01-01', '2023-12-01', freq='MS')
+    geos = [f'G{i:02d}' for i in range(n_geos)]
+    panel = SCMPanel(pd.DataFrame(100 + np.cumsum(rng.normal(size=(len(dates), n_geos)), axis=0),
+                                  index=dates, columns=geos))
+    panels.append((f'synthetic {n_geos} geos', panel, geos[0], geos[1:]))
+
+    rows = []
+    for name, panel, target, donors in panels:
+        specs = [(target, donors, ('2019-01-01', m), (m, '2023-12-01')) for m in months]
+        t_cold, cold = _time(lambda: [panel.fit(*spec) for spec in specs], 1)
+        t_warm, warm = _time(lambda: panel.sweep(specs), 1)
+        nit_cold = [fit['nit'] for fit in cold]
+        rows.append({'problem': name, 'months': len(specs), 'single_cold_nit': nit_cold[0],
+                     'cold_nit': sum(nit_cold), 'warm_nit': sum(fit['nit'] for fit in warm),
+                     'cold_ms': t_cold * 1e3, 'warm_ms': t_warm * 1e3,
+                     'max_ate_diff': max(abs(a['ate'] - b['ate']) for a, b in zip(cold, warm))})
+    return pd.DataFrame(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SCM engine utilities')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Time simplex_lstsq against SLSQP on the ES problem and synthetic panels')
+    parser.add_argument('--donors', type=int, default=200, help='Donors in the synthetic panels')
+    parser.add_argument('--trials', type=int, default=3, help='Synthetic panels to solve')
+    parser.add_argument('--batch', type=int, default=2000,
+                        help='Problems in the fit_batch throughput run (0 to skip)')
+    args = parser.parse_args(argv)
+    if args.benchmark:
+        with pd.option_context('display.width', 200, 'display.max_columns', 20):
+            print(benchmark(args.donors, trials=args.trials).to_string(index=False))
+            if args.batch:
+                print()
+                print(benchmark_batch(args.batch).to_string(index=False))
+            print()
+            print(benchmark_sweep().to_string(index=False))
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
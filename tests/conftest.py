@@ -0,0 +1,95 @@
+"""
+Shared fixtures: the scripts/ modules on sys.path and a local stand-in for
+the upstream data servers
+"""
+
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "scripts"))
+
+
+class Upstream:
+    """
+    Files served by StubHandler, keyed on URL path, plus a log of every
+    request (path, headers, status, body bytes sent). drop_after makes the
+    next full response stop after that many bytes and close the connection.
+    honor_conditional=False makes the server ignore If-None-Match.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.drop_after = None
+        self.honor_conditional = True
+        self.url = None
+
+    def put(self, path, body, etag):
+        self.files[path] = (body, etag)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """GET with ETag, If-None-Match, Range and If-Range, as the real servers do"""
+
+    def do_GET(self):
+        upstream = self.server.upstream
+        log = {'path': self.path, 'headers': dict(self.headers), 'status': None, 'sent': 0}
+        upstream.requests.append(log)
+        if self.path not in upstream.files:
+            log['status'] = 404
+            self.send_error(404)
+            return
+        body, etag = upstream.files[self.path]
+
+        if upstream.honor_conditional and self.headers.get('If-None-Match') == etag:
+            log['status'] = 304
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        start = 0
+        byte_range = self.headers.get('Range')
+        if byte_range and self.headers.get('If-Range', etag) == etag:
+            start = int(byte_range.split('=')[1].split('-')[0])
+            if start >= len(body):
+                log['status'] = 416
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(body)}")
+                self.end_headers()
+                return
+        log['status'] = 206 if start else 200
+        self.send_response(log['status'])
+        self.send_header('ETag', etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(body) - start))
+        if start:
+            self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+        self.end_headers()
+
+        payload = body[start:]
+        if upstream.drop_after is not None and not start:
+            payload, upstream.drop_after = payload[:upstream.drop_after], None
+            self.close_connection = True
+        self.wfile.write(payload)
+        log['sent'] = len(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.upstream = Upstream()
+    server.upstream.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.upstream
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,20 @@
+"""Eurostat cell decoding: values and FLAG_BITS status codes"""
+
+import numpy as np
+
+from panel_store import FLAG_BITS
+from process_data import decode_eurostat_cells
+
+
+def test_standard_cells():
+    values, flags = decode_eurostat_cells("101.3 p\n: \n: c\n99.8\n-3.2 d")
+    np.testing.assert_array_equal(values, [101.3, np.nan, np.nan, 99.8, -3.2])
+    assert flags.dtype == np.uint8
+    assert flags.tolist() == [FLAG_BITS['p'], 0, FLAG_BITS['c'], 0, FLAG_BITS['d']]
+
+
+def test_flags_attached_to_the_number():
+    values, flags = decode_eurostat_cells("101.3 p\n12.3p\n7.1pe\n12.3p e\n5 b\n: \nn/a")
+    np.testing.assert_array_equal(values, [101.3, 12.3, 7.1, 12.3, 5.0, np.nan, np.nan])
+    pe = FLAG_BITS['p'] | FLAG_BITS['e']
+    assert flags.tolist() == [FLAG_BITS['p'], FLAG_BITS['p'], pe, pe, FLAG_BITS['b'], 0, 0]
@@ -0,0 +1,86 @@
+"""Conditional GETs: a 304 from a server that honours If-None-Match skips the body"""
+
+import json
+import os
+
+import process_data
+from fetch_async import download, fetch_all, make_session, load_fetch_meta, save_fetch_meta
+
+BODY = b"freq,unit,coicop,geo\\TIME_PERIOD\t2024-01 \t2024-02 \n" * 2000
+
+
+def _source(name, filename):
+    return {'name': name, 'filename': filename, 'url': f"https://example.org/{filename}"}
+
+
+def _fetch(upstream, raw_dir, fetch_meta):
+    url = upstream.url + "/prc_hicp_midx.tsv"
+    source = _source('HICP', "prc_hicp_midx.tsv")
+    return download(make_session(1), source, url, str(raw_dir), fetch_meta=fetch_meta)
+
+
+def test_304_leaves_file_untouched(upstream, tmp_path):
+    upstream.put("/prc_hicp_midx.tsv", BODY, '"a1"')
+    fetch_meta = load_fetch_meta(str(tmp_path))
+    assert _fetch(upstream, tmp_path, fetch_meta) == 'saved'
+    save_fetch_meta(fetch_meta, str(tmp_path))
+    mtime = os.stat(tmp_path / "prc_hicp_midx.tsv").st_mtime_ns
+
+    fetch_meta = load_fetch_meta(str(tmp_path))
+    assert _fetch(upstream, tmp_path, fetch_meta) == 'unchanged'
+    last = upstream.requests[-1]
+    assert last['headers']['If-None-Match'] == '"a1"'
+    assert last['status'] == 304 and last['sent'] == 0
+    assert os.stat(tmp_path / "prc_hicp_midx.tsv").st_mtime_ns == mtime
+    assert not (tmp_path / "prc_hicp_midx.tsv.part").exists()
+
+
+def test_new_etag_replaces_file(upstream, tmp_path):
+    upstream.put("/prc_hicp_midx.tsv", BODY, '"a1"')
+    fetch_meta = load_fetch_meta(str(tmp_path))
+    _fetch(upstream, tmp_path, fetch_meta)
+
+    upstream.put("/prc_hicp_midx.tsv", BODY + b"ES\t1.0 \t2.0 p\n", '"a2"')
+    assert _fetch(upstream, tmp_path, fetch_meta) == 'saved'
+    assert upstream.requests[-1]['status'] == 200
+    assert (tmp_path / "prc_hicp_midx.tsv").read_bytes().endswith(b"2.0 p\n")
+
+
+def test_edited_local_copy_is_refetched(upstream, tmp_path):
+    upstream.put("/prc_hicp_midx.tsv", BODY, '"a1"')
+    fetch_meta = load_fetch_meta(str(tmp_path))
+    _fetch(upstream, tmp_path, fetch_meta)
+
+    (tmp_path / "prc_hicp_midx.tsv").write_bytes(b"edited by hand")
+    assert _fetch(upstream, tmp_path, fetch_meta) == 'saved'
+    assert 'If-None-Match' not in upstream.requests[-1]['headers']
+    assert (tmp_path / "prc_hicp_midx.tsv").read_bytes() == BODY
+
+
+def test_same_body_without_304_is_unchanged(upstream, tmp_path):
+    upstream.put("/prc_hicp_midx.tsv", BODY, '"a1"')
+    upstream.honor_conditional = False
+    fetch_meta = load_fetch_meta(str(tmp_path))
+    _fetch(upstream, tmp_path, fetch_meta)
+    mtime = os.stat(tmp_path / "prc_hicp_midx.tsv").st_mtime_ns
+
+    assert _fetch(upstream, tmp_path, fetch_meta) == 'unchanged'
+    assert upstream.requests[-1]['status'] == 200
+    assert os.stat(tmp_path / "prc_hicp_midx.tsv").st_mtime_ns == mtime
+
+
+def test_fetch_all_records_nothing_changed(upstream, tmp_path):
+    upstream.put("/a.csv", b"month,value\n2024-01,1.0\n", '"x1"')
+    upstream.put("/b.csv", b"month,value\n2024-01,2.0\n", '"y1"')
+    sources = [_source('A', "a.csv"), _source('B', "b.csv")]
+
+    first = fetch_all(sources, mirror=upstream.url, raw_dir=str(tmp_path), verify=False)
+    assert first == {'A': 'saved', 'B': 'saved'}
+    second = fetch_all(sources, mirror=upstream.url, raw_dir=str(tmp_path), verify=False)
+    assert second == {'A': 'unchanged', 'B': 'unchanged'}
+    assert [r['status'] for r in upstream.requests[-2:]] == [304, 304]
+
+    meta = process_data.load_fetch_meta(str(tmp_path / ".fetch_meta.json"))
+    assert meta['last_run']['changed'] == []
+    with open(tmp_path / ".fetch_meta.json") as f:
+        assert set(json.load(f)['files']) == {"a.csv", "b.csv"}
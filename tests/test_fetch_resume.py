@@ -0,0 +1,84 @@
+"""Interrupted downloads resume with Range/If-Range and are checked against their digest"""
+
+import hashlib
+import os
+
+from fetch_async import download, make_session
+
+BODY = os.urandom(300_000)
+ETAG = '"v1"'
+
+
+def _source(filename="prc_hicp_midx.tsv.gz"):
+    return {'name': filename, 'filename': filename}
+
+
+def _interrupt(upstream, tmp_path, drop_after=100_000):
+    """First attempt: the server closes the connection after drop_after bytes"""
+    upstream.put("/prc_hicp_midx.tsv.gz", BODY, ETAG)
+    upstream.drop_after = drop_after
+    url = upstream.url + "/prc_hicp_midx.tsv.gz"
+    status = download(make_session(1), _source(), url, str(tmp_path))
+    assert status == 'failed'
+    return url
+
+
+def test_interrupted_download_keeps_part(upstream, tmp_path):
+    _interrupt(upstream, tmp_path)
+    assert not (tmp_path / "prc_hicp_midx.tsv.gz").exists()
+    assert (tmp_path / "prc_hicp_midx.tsv.gz.part").stat().st_size == 100_000
+    assert (tmp_path / "prc_hicp_midx.tsv.gz.part.json").exists()
+
+
+def test_resume_fetches_only_the_rest(upstream, tmp_path):
+    url = _interrupt(upstream, tmp_path)
+    expected = hashlib.sha256(BODY).hexdigest()
+    status = download(make_session(1), _source(), url, str(tmp_path), expected_sha256=expected)
+
+    assert status == 'saved'
+    assert (tmp_path / "prc_hicp_midx.tsv.gz").read_bytes() == BODY
+    assert not (tmp_path / "prc_hicp_midx.tsv.gz.part").exists()
+    assert not (tmp_path / "prc_hicp_midx.tsv.gz.part.json").exists()
+    resume = upstream.requests[-1]
+    assert resume['headers']['Range'] == "bytes=100000-"
+    assert resume['headers']['If-Range'] == ETAG
+    assert resume['status'] == 206
+    assert resume['sent'] == len(BODY) - 100_000
+
+
+def test_changed_upstream_restarts(upstream, tmp_path):
+    url = _interrupt(upstream, tmp_path)
+    new_body = os.urandom(250_000)
+    upstream.put("/prc_hicp_midx.tsv.gz", new_body, '"v2"')
+    status = download(make_session(1), _source(), url, str(tmp_path))
+
+    assert status == 'saved'
+    assert upstream.requests[-1]['status'] == 200
+    assert (tmp_path / "prc_hicp_midx.tsv.gz").read_bytes() == new_body
+
+
+def test_complete_part_is_finished_on_416(upstream, tmp_path):
+    url = _interrupt(upstream, tmp_path, drop_after=len(BODY) - 1)
+    with open(tmp_path / "prc_hicp_midx.tsv.gz.part", 'ab') as f:
+        f.write(BODY[-1:])
+    status = download(make_session(1), _source(), url, str(tmp_path))
+
+    assert status == 'saved'
+    assert upstream.requests[-1]['status'] == 416
+    assert (tmp_path / "prc_hicp_midx.tsv.gz").read_bytes() == BODY
+
+
+def test_checksum_mismatch_keeps_local_copy(upstream, tmp_path):
+    (tmp_path / "prc_hicp_midx.tsv.gz").write_bytes(b"old vintage")
+    upstream.put("/prc_hicp_midx.tsv.gz", BODY, ETAG)
+    url = upstream.url + "/prc_hicp_midx.tsv.gz"
+    stale = hashlib.sha256(b"old vintage").hexdigest()
+
+    status = download(make_session(1), _source(), url, str(tmp_path), expected_sha256=stale)
+    assert status == 'failed'
+    assert (tmp_path / "prc_hicp_midx.tsv.gz").read_bytes() == b"old vintage"
+    assert (tmp_path / "prc_hicp_midx.tsv.gz.part").read_bytes() == BODY
+
+    status = download(make_session(1), _source(), url, str(tmp_path), expected_sha256=stale, accept_new=True)
+    assert status == 'saved'
+    assert (tmp_path / "prc_hicp_midx.tsv.gz").read_bytes() == BODY
@@ -0,0 +1,68 @@
+"""Eurostat SDMX slice URLs, as requested from a local stand-in server"""
+
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+
+from fetch_async import EUROSTAT_URL, eurostat_url, main, sdmx_key
+from process_data import EUROSTAT_SLICES, IP_NACE, IP_S_ADJ, PPI_NACE, READER_FILTERS
+
+EUROSTAT = ['prc_hicp_midx', 'sts_inpp_m', 'sts_inpr_m', 'ei_eteu27_2020_m']
+BASE = urlsplit(EUROSTAT_URL.format(path=''))
+
+
+def _fetch(upstream, tmp_path, *flags):
+    """Run fetch_async.main against the stub; {dataset: the real URL it stood in for}"""
+    for code in EUROSTAT:
+        upstream.put(f"/{code}.tsv.gz", b"freq,geo\\TIME_PERIOD\t2024-01 \n", f'"{code}"')
+    main(['--mirror', upstream.url, '--only', ','.join(EUROSTAT), '--raw-dir', str(tmp_path),
+          '--no-verify', *flags])
+    return {r['path'][1:-len('.tsv.gz')]: r['headers']['X-Source-URL'] for r in upstream.requests}
+
+
+def _key(url):
+    """(dataset, SDMX key dimensions or None) of a Eurostat data URL"""
+    parts = urlsplit(url)
+    assert (parts.scheme, parts.netloc) == (BASE.scheme, BASE.netloc)
+    assert parse_qs(parts.query) == {'format': ['TSV'], 'compressed': ['true']}
+    path = parts.path[len(BASE.path):].split('/')
+    return path[0], (path[1].split('.') if len(path) > 1 else None)
+
+
+def test_slices_requested(upstream, tmp_path):
+    requested = _fetch(upstream, tmp_path)
+    assert sorted(requested) == sorted(EUROSTAT)
+    for code, url in requested.items():
+        assert url == eurostat_url(code)
+        assert _key(url)[0] == code
+
+    # Dimensions in SDMX key order: freq.unit.coicop.geo
+    geos = READER_FILTERS["prc_hicp_midx.tsv.gz"]['geo']
+    assert _key(requested['prc_hicp_midx'])[1] == [
+        'M', '', 'CP00+TOT_X_NRG_FOOD+CP00_X_NRG_FOOD+NRG+CP0451', '+'.join(geos)]
+
+    # freq.indic_bt.nace_r2.s_adj.unit.geo
+    assert _key(requested['sts_inpp_m'])[1] == [
+        'M', '', '+'.join(PPI_NACE), '', '', '+'.join(READER_FILTERS["sts_inpp_m.tsv.gz"]['geo'])]
+    assert _key(requested['sts_inpr_m'])[1] == [
+        'M', '', '+'.join(IP_NACE), '+'.join(IP_S_ADJ), '', '+'.join(READER_FILTERS["sts_inpr_m.tsv.gz"]['geo'])]
+
+    # No slice configured: the whole dataset
+    assert _key(requested['ei_eteu27_2020_m']) == ('ei_eteu27_2020_m', None)
+
+
+def test_bulk_requests_whole_datasets(upstream, tmp_path):
+    requested = _fetch(upstream, tmp_path, '--bulk')
+    for code, url in requested.items():
+        assert url == eurostat_url(code, bulk=True)
+        assert _key(url) == (code, None)
+
+
+@pytest.mark.parametrize('code', sorted(EUROSTAT_SLICES))
+def test_sdmx_key_follows_slice_order(code):
+    assert sdmx_key(code).split('.') == ['+'.join(codes) for _, codes in EUROSTAT_SLICES[code]]
+
+
+def test_sdmx_key_without_slice():
+    assert sdmx_key('ei_eteu27_2020_m') is None
+    assert sdmx_key('prc_hicp_midx', slices={}) is None
@@ -0,0 +1,28 @@
+"""Columnar panel store files"""
+
+import os
+import stat
+
+import numpy as np
+import pandas as pd
+
+from panel_store import store_paths, write_panel, load_panel
+
+
+def test_store_files_follow_umask(tmp_path):
+    csv_path = str(tmp_path / "merged_data.csv")
+    df = pd.DataFrame({'geo': ['ES', 'ES', 'PL'], 'date': pd.to_datetime(['2024-01-01', '2024-02-01', '2024-01-01']),
+                       'HICP_Total': [1.0, 2.0, 3.0], 'HICP_Total_flag': np.array([0, 1, 2], dtype=np.uint8)})
+    df.to_csv(csv_path, index=False)
+    old = os.umask(0o022)
+    try:
+        write_panel(df, csv_path)
+    finally:
+        os.umask(old)
+    for path in store_paths(csv_path):
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    assert not [f for f in os.listdir(tmp_path) if f.endswith('.tmp')]
+
+    loaded = load_panel(csv_path)
+    assert loaded['HICP_Total_flag'].dtype == np.uint8
+    assert loaded['HICP_Total_flag'].tolist() == [0, 1, 2]
@@ -0,0 +1,177 @@
+"""simplex_lstsq against SLSQP and an independent KKT check, on random and rank-deficient problems"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from scm import gram, simplex_lstsq, simplex_lstsq_batch, simplex_lstsq_slsqp
+
+pytestmark = pytest.mark.filterwarnings("error::RuntimeWarning")
+
+
+def _loss(X, y, w):
+    r = y - X.dot(w)
+    return r.dot(r)
+
+
+def _slsqp(X, y):
+    """SLSQP weights projected back onto the simplex (it leaves sum(w) = 1 off by ~1e-8)"""
+    w, _ = simplex_lstsq_slsqp(X, y, options={'ftol': 1e-10, 'maxiter': 1000})
+    assert w is not None
+    w = np.maximum(w, 0.0)
+    return w / w.sum()
+
+
+def _assert_kkt(G, c, w, tol=1e-7):
+    """w is feasible, the gradient is flat on its support and no lower off it"""
+    scale = max(1.0, np.abs(np.diag(G)).max())
+    assert (w >= 0).all()
+    assert w.sum() == pytest.approx(1.0, abs=1e-12)
+    grad = G.dot(w) - c
+    on = w > 0
+    level = grad[on].mean()
+    assert np.abs(grad[on] - level).max() <= tol * scale
+    assert (grad[~on] - level).min(initial=0.0) >= -tol * scale
+
+
+def _random_walks(rng, n_pre, n_donors):
+    X = 100 + np.cumsum(rng.normal(size=(n_pre, n_donors)), axis=0)
+    picks = rng.choice(n_donors, min(5, n_donors), replace=False)
+    y = X[:, picks].dot(rng.dirichlet(np.ones(len(picks)))) + rng.normal(scale=0.3, size=n_pre)
+    return X, y
+
+
+def _rank_deficient(rng, kind):
+    if kind == 'short pre-period':
+        return _random_walks(rng, 8, 40)
+    X, y = _random_walks(rng, 30, 12)
+    if kind == 'duplicate donors':
+        return np.hstack([X, X[:, :4]]), y
+    # Donors that are convex combinations of others
+    mix = rng.dirichlet(np.ones(12), size=6).T
+    return np.hstack([X, X.dot(mix)]), y
+
+
+@pytest.mark.parametrize('seed', range(8))
+@pytest.mark.parametrize('shape', [(41, 5), (41, 27), (60, 200)])
+def test_random_problems_match_slsqp(seed, shape):
+    X, y = _random_walks(np.random.default_rng(seed), *shape)
+    G, c = gram(X, y)
+    w, info = simplex_lstsq(G, c)
+    _assert_kkt(G, c, w)
+    assert info['kkt'] <= 1e-7 * max(1.0, np.abs(np.diag(G)).max())
+
+    w_ref = _slsqp(X, y)
+    loss, loss_ref = _loss(X, y, w), _loss(X, y, w_ref)
+    assert loss <= loss_ref + 1e-9 * max(1.0, loss_ref)
+    if shape[1] < shape[0]:
+        # G positive definite: the optimum is unique
+        np.testing.assert_allclose(w, w_ref, atol=1e-4)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('kind', ['short pre-period', 'duplicate donors', 'convex combinations'])
+def test_rank_deficient_problems(seed, kind):
+    X, y = _rank_deficient(np.random.default_rng(seed), kind)
+    G, c = gram(X, y)
+    assert np.linalg.matrix_rank(G) < G.shape[0]
+    w, info = simplex_lstsq(G, c)
+    _assert_kkt(G, c, w)
+
+    # The weights need not be unique; the fit must be
+    loss_ref = _loss(X, y, _slsqp(X, y))
+    assert _loss(X, y, w) <= loss_ref + 1e-9 * max(1.0, loss_ref)
+
+
+def _near_affine(seed):
+    """Donors within 1e-12..1e-4 of affine combinations of others"""
+    rng = np.random.default_rng(seed)
+    n_pre, k, extra = int(rng.integers(4, 30)), int(rng.integers(2, 6)), int(rng.integers(1, 8))
+    B = 100 + np.cumsum(rng.normal(size=(n_pre, k + 2)), axis=0)
+    y = B[:, :k].dot(rng.dirichlet(np.ones(k))) + rng.normal(scale=rng.choice([0, 0.1, 1]), size=n_pre)
+    A = rng.normal(size=(k + 2, extra))
+    A /= A.sum(axis=0)
+    delta = 10.0 ** rng.uniform(-12, -4)
+    X = np.hstack([B, B.dot(A) + delta * rng.normal(size=(n_pre, extra))])
+    if rng.random() < 0.5:
+        X = X[:, rng.permutation(X.shape[1])]
+    return X, y
+
+
+def _best_support_loss(X, y):
+    """Smallest loss over every support's equality-constrained optimum that is feasible"""
+    D = X - y[:, None]
+    n, best = X.shape[1], np.inf
+    for k in range(1, n + 1):
+        for S in itertools.combinations(range(n), k):
+            K = np.zeros((k + 1, k + 1))
+            K[:k, :k] = D[:, S].T.dot(D[:, S])
+            K[:k, k] = K[k, :k] = 1.0
+            a = np.linalg.lstsq(K, np.eye(k + 1)[k], rcond=None)[0][:k]
+            if (a >= -1e-12).all():
+                w = np.zeros(n)
+                w[list(S)] = np.maximum(a, 0.0) / np.maximum(a, 0.0).sum()
+                best = min(best, _loss(X, y, w))
+    return best
+
+
+# Seeds whose solve meets an entering donor that cannot move (degenerate support)
+@pytest.mark.parametrize('seed', [3503, 7548, 8677])
+def test_degenerate_entering_donor(seed):
+    X, y = _near_affine(seed)
+    G, c = gram(X, y)
+    best = _best_support_loss(X, y)
+    for w in (simplex_lstsq(G, c)[0], simplex_lstsq_batch(G[None], np.ones((1, len(c)), dtype=bool))[0][0]):
+        _assert_kkt(G, c, w)
+        assert _loss(X, y, w) <= best * (1 + 1e-8)
+        assert _loss(X, y, w) <= _loss(X, y, _slsqp(X, y)) * (1 + 1e-9)
+
+
+def test_target_inside_hull_is_reproduced():
+    rng = np.random.default_rng(1)
+    X = 100 + np.cumsum(rng.normal(size=(41, 10)), axis=0)
+    true_w = np.zeros(10)
+    true_w[[1, 4, 7]] = [0.2, 0.5, 0.3]
+    w, _ = simplex_lstsq(*gram(X, X.dot(true_w)))
+    np.testing.assert_allclose(w, true_w, atol=1e-8)
+
+
+@pytest.mark.parametrize('kind', ['short pre-period', 'duplicate donors'])
+def test_warm_start_reaches_the_same_fit(kind):
+    rng = np.random.default_rng(3)
+    X, y = _rank_deficient(rng, kind)
+    G, c = gram(X, y)
+    w, _ = simplex_lstsq(G, c)
+    for w0 in (rng.dirichlet(np.ones(len(c))), np.eye(len(c))[0], w):
+        w_warm, _ = simplex_lstsq(G, c, w0=w0)
+        _assert_kkt(G, c, w_warm)
+        assert _loss(X, y, w_warm) == pytest.approx(_loss(X, y, w), rel=1e-9, abs=1e-9)
+
+
+def test_batch_matches_single_solves():
+    rng = np.random.default_rng(7)
+    problems = [_random_walks(rng, 41, 27) for _ in range(6)]
+    problems += [_random_walks(rng, 8, 27) for _ in range(4)]  # rank-deficient
+    G = np.stack([gram(X, y)[0] for X, y in problems])
+    allowed = rng.random((len(problems), 27)) < 0.7
+    allowed[:, 0] = True
+
+    W, info = simplex_lstsq_batch(G, allowed)
+    for b, (X, y) in enumerate(problems):
+        assert (W[b, ~allowed[b]] == 0).all()
+        Xa = X[:, allowed[b]]
+        Ga, ca = gram(Xa, y)
+        _assert_kkt(Ga, ca, W[b, allowed[b]])
+        w, _ = simplex_lstsq(Ga, ca)
+        assert _loss(Xa, y, W[b, allowed[b]]) == pytest.approx(_loss(Xa, y, w), rel=1e-9, abs=1e-9)
+        assert info['kkt'][b] <= 1e-7 * max(1.0, np.abs(np.diag(G[b])).max())
+
+
+def test_unconverged_solve_warns():
+    X, y = _random_walks(np.random.default_rng(0), 41, 27)
+    G, c = gram(X, y)
+    with pytest.warns(RuntimeWarning, match="KKT violation"):
+        simplex_lstsq(G, c, max_iter=1)
+    with pytest.warns(RuntimeWarning, match="1 of 2 problem"):
+        simplex_lstsq_batch(np.stack([G, G]), np.array([[True] * 27, [True] + [False] * 26]), max_iter=1)